@@ -34,14 +34,77 @@ class Settings(BaseSettings):
     QDRANT_URL: str = os.getenv("QDRANT_URL", "http://localhost:6333")
     QDRANT_API_KEY: str = os.getenv("QDRANT_API_KEY", "")
     USE_PINECONE: bool = os.getenv("USE_PINECONE", "true").lower() == "true"
+    RAG_DEFAULT_TENANT: str = os.getenv("RAG_DEFAULT_TENANT", "default")
+    RAG_INDEXED_METADATA_FIELDS: str = os.getenv("RAG_INDEXED_METADATA_FIELDS", "tenant_id,document_id,document_type")
+    RAG_SNAPSHOT_PATH: str = os.getenv("RAG_SNAPSHOT_PATH", "")
+    QDRANT_QUANTIZATION: str = os.getenv("QDRANT_QUANTIZATION", "")  # "", "int8" or "pq"
+    QDRANT_PQ_COMPRESSION: str = os.getenv("QDRANT_PQ_COMPRESSION", "x16")
+    QDRANT_QUANTIZATION_RESCORE: bool = os.getenv("QDRANT_QUANTIZATION_RESCORE", "true").lower() == "true"
+    QDRANT_QUANTIZATION_OVERSAMPLING: float = float(os.getenv("QDRANT_QUANTIZATION_OVERSAMPLING", "2.0"))
+    VECTOR_STORE_MAX_WORKERS: int = int(os.getenv("VECTOR_STORE_MAX_WORKERS", "8"))
+    
+    # Local Embeddings (used when no OpenAI key is set)
+    LOCAL_EMBEDDING_MODEL: str = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    LOCAL_EMBEDDING_WORKERS: int = int(os.getenv("LOCAL_EMBEDDING_WORKERS", "2"))
+    LOCAL_EMBEDDING_MAX_BATCH: int = int(os.getenv("LOCAL_EMBEDDING_MAX_BATCH", "64"))
+    LOCAL_EMBEDDING_MAX_WAIT_MS: int = int(os.getenv("LOCAL_EMBEDDING_MAX_WAIT_MS", "5"))
+    LOCAL_EMBEDDING_TIMEOUT: float = float(os.getenv("LOCAL_EMBEDDING_TIMEOUT", "120"))  # seconds a blocking embed call waits
+    
+    # RAG Retrieval
+    RAG_HYBRID_SEARCH: bool = os.getenv("RAG_HYBRID_SEARCH", "true").lower() == "true"
+    RAG_CANDIDATE_MULTIPLIER: int = int(os.getenv("RAG_CANDIDATE_MULTIPLIER", "4"))
+    RAG_RRF_K: int = int(os.getenv("RAG_RRF_K", "60"))
+    RAG_RERANK_MODEL: str = os.getenv("RAG_RERANK_MODEL", "")
+    RAG_RERANK_WORKERS: int = int(os.getenv("RAG_RERANK_WORKERS", "2"))
+    RAG_CACHE_MAX_ENTRIES: int = int(os.getenv("RAG_CACHE_MAX_ENTRIES", "1024"))
+    RAG_CACHE_TTL_SECONDS: int = int(os.getenv("RAG_CACHE_TTL_SECONDS", "300"))
+    RAG_DEDUP_ENABLED: bool = os.getenv("RAG_DEDUP_ENABLED", "true").lower() == "true"
+    RAG_DEDUP_THRESHOLD: float = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.85"))
+    RAG_INDEX_LOG_RETENTION_SECONDS: int = int(os.getenv("RAG_INDEX_LOG_RETENTION_SECONDS", str(7 * 86400)))  # workers idle longer rebuild from the store
     
     # Database
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    LOCAL_DATABASE_URL: str = os.getenv("LOCAL_DATABASE_URL", "sqlite:///./data/app.db")  # used when DATABASE_URL is empty
     
     # Image Generation
     STABLE_DIFFUSION_API_URL: str = os.getenv("STABLE_DIFFUSION_API_URL", "http://localhost:7860")
+    STABLE_DIFFUSION_API_URLS: str = os.getenv("STABLE_DIFFUSION_API_URLS", "")  # comma-separated backend pool
+    SD_API_TIMEOUT: float = float(os.getenv("SD_API_TIMEOUT", "120"))
+    SD_API_MAX_ATTEMPTS: int = int(os.getenv("SD_API_MAX_ATTEMPTS", "3"))
+    SD_HEALTH_CHECK_PATH: str = os.getenv("SD_HEALTH_CHECK_PATH", "/internal/ping")
+    SD_HEALTH_CHECK_INTERVAL: float = float(os.getenv("SD_HEALTH_CHECK_INTERVAL", "30"))
+    LOCAL_DIFFUSION_MODEL: str = os.getenv("LOCAL_DIFFUSION_MODEL", "runwayml/stable-diffusion-v1-5")
+    LOCAL_DIFFUSION_ENABLED: bool = os.getenv("LOCAL_DIFFUSION_ENABLED", "true").lower() == "true"  # each web worker loads its own model copy
+    LOCAL_DIFFUSION_PRELOAD: bool = os.getenv("LOCAL_DIFFUSION_PRELOAD", "false").lower() == "true"
+    LOCAL_DIFFUSION_QUEUE_SIZE: int = int(os.getenv("LOCAL_DIFFUSION_QUEUE_SIZE", "8"))
+    LOCAL_DIFFUSION_JOB_TIMEOUT: float = float(os.getenv("LOCAL_DIFFUSION_JOB_TIMEOUT", "900"))
+    LOCAL_DIFFUSION_BATCH_WINDOW_MS: int = int(os.getenv("LOCAL_DIFFUSION_BATCH_WINDOW_MS", "50"))
+    LOCAL_DIFFUSION_MAX_BATCH_IMAGES: int = int(os.getenv("LOCAL_DIFFUSION_MAX_BATCH_IMAGES", "4"))
+    LOCAL_DIFFUSION_PREVIEW_STEPS: int = int(os.getenv("LOCAL_DIFFUSION_PREVIEW_STEPS", "5"))  # 0 disables previews
+    LOCAL_DIFFUSION_LEAN: bool = os.getenv("LOCAL_DIFFUSION_LEAN", "false").lower() == "true"  # attention/VAE slicing and VAE tiling
+    LOCAL_DIFFUSION_UNET_PRECISION: str = os.getenv("LOCAL_DIFFUSION_UNET_PRECISION", "float32")  # float32, bfloat16 or int8 (CPU only)
+    LOCAL_DIFFUSION_SAFETY_CHECKER: bool = os.getenv("LOCAL_DIFFUSION_SAFETY_CHECKER", "true").lower() == "true"
+    LOCAL_DIFFUSION_UPSCALER_MODEL: str = os.getenv("LOCAL_DIFFUSION_UPSCALER_MODEL", "")  # e.g. stabilityai/sd-x2-latent-upscaler
+    IMAGE_FINAL_UPSCALE: int = int(os.getenv("IMAGE_FINAL_UPSCALE", "1"))  # 1 disables upscaling
+    IMAGE_STORAGE_DIR: str = os.getenv("IMAGE_STORAGE_DIR", "uploads/images")
+    IMAGE_CACHE_ENABLED: bool = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+    IMAGE_CACHE_MAX_BYTES: int = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+    IMAGE_RENDITIONS_ENABLED: bool = os.getenv("IMAGE_RENDITIONS_ENABLED", "true").lower() == "true"
+    IMAGE_RENDITION_WORKERS: int = int(os.getenv("IMAGE_RENDITION_WORKERS", "4"))
+    MEDIA_BASE_URL: str = os.getenv("MEDIA_BASE_URL", "")  # public origin for stored images, e.g. https://cdn.example.com
+    MEDIA_CACHE_MAX_AGE: int = int(os.getenv("MEDIA_CACHE_MAX_AGE", "31536000"))
+    MEDIA_ACCEL_REDIRECT_PREFIX: str = os.getenv("MEDIA_ACCEL_REDIRECT_PREFIX", "")  # nginx internal location, e.g. /_media
+    IMAGE_JOB_CONCURRENCY: int = int(os.getenv("IMAGE_JOB_CONCURRENCY", "4"))
+    IMAGE_JOB_WEBHOOK_TIMEOUT: float = float(os.getenv("IMAGE_JOB_WEBHOOK_TIMEOUT", "10"))
+    IMAGE_JOB_LEASE_SECONDS: int = int(os.getenv("IMAGE_JOB_LEASE_SECONDS", "120"))  # renewed while the job runs
+    IMAGE_JOB_POLL_INTERVAL: float = float(os.getenv("IMAGE_JOB_POLL_INTERVAL", "2"))  # how often streams and running jobs check the job row
+    IMAGE_JOB_KEEPALIVE_SECONDS: float = float(os.getenv("IMAGE_JOB_KEEPALIVE_SECONDS", "15"))
+    OUTBOUND_ALLOWED_HOSTS: str = os.getenv("OUTBOUND_ALLOWED_HOSTS", "")  # comma-separated; when set, user-supplied URLs must use these hosts or their subdomains
+    IMAGE_ANALYSIS_WORKERS: int = int(os.getenv("IMAGE_ANALYSIS_WORKERS", "2"))
+    IMAGE_ANALYSIS_CACHE_ENTRIES: int = int(os.getenv("IMAGE_ANALYSIS_CACHE_ENTRIES", "1024"))
+    IMAGE_ANALYSIS_MAX_BYTES: int = int(os.getenv("IMAGE_ANALYSIS_MAX_BYTES", str(20 * 1024 * 1024)))  # largest image downloaded for analysis
     HUGGINGFACE_API_KEY: str = os.getenv("HUGGINGFACE_API_KEY", "")
     REPLICATE_API_TOKEN: str = os.getenv("REPLICATE_API_TOKEN", "")
     
@@ -51,14 +114,40 @@ class Settings(BaseSettings):
     TWITTER_ACCESS_TOKEN: str = os.getenv("TWITTER_ACCESS_TOKEN", "")
     TWITTER_ACCESS_TOKEN_SECRET: str = os.getenv("TWITTER_ACCESS_TOKEN_SECRET", "")
     TWITTER_BEARER_TOKEN: str = os.getenv("TWITTER_BEARER_TOKEN", "")
+    TWITTER_PUBLISH_TIMEOUT: float = float(os.getenv("TWITTER_PUBLISH_TIMEOUT", "30"))
+    TWITTER_PUBLISH_WORKERS: int = int(os.getenv("TWITTER_PUBLISH_WORKERS", "64"))  # concurrent tweepy calls
+    TWITTER_MEDIA_TTL: int = int(os.getenv("TWITTER_MEDIA_TTL", "86400"))  # used when the upload response has no expiry
+    TWITTER_CHUNKED_UPLOAD_BYTES: int = int(os.getenv("TWITTER_CHUNKED_UPLOAD_BYTES", str(1024 * 1024)))
     
     INSTAGRAM_ACCESS_TOKEN: str = os.getenv("INSTAGRAM_ACCESS_TOKEN", "")
     INSTAGRAM_APP_ID: str = os.getenv("INSTAGRAM_APP_ID", "")
     INSTAGRAM_APP_SECRET: str = os.getenv("INSTAGRAM_APP_SECRET", "")
+    INSTAGRAM_PUBLISH_TIMEOUT: float = float(os.getenv("INSTAGRAM_PUBLISH_TIMEOUT", "60"))
+    INSTAGRAM_CONTAINER_TTL: int = int(os.getenv("INSTAGRAM_CONTAINER_TTL", "86400"))  # unpublished containers expire after 24h
     
     LINKEDIN_CLIENT_ID: str = os.getenv("LINKEDIN_CLIENT_ID", "")
     LINKEDIN_CLIENT_SECRET: str = os.getenv("LINKEDIN_CLIENT_SECRET", "")
     LINKEDIN_ACCESS_TOKEN: str = os.getenv("LINKEDIN_ACCESS_TOKEN", "")
+    LINKEDIN_PUBLISH_TIMEOUT: float = float(os.getenv("LINKEDIN_PUBLISH_TIMEOUT", "20"))
+    
+    # Publishing limits per account: platform=calls/seconds
+    PLATFORM_RATE_LIMITS: str = os.getenv(
+        "PLATFORM_RATE_LIMITS",
+        "twitter=300/10800,instagram=25/86400,linkedin=150/86400,facebook=200/3600"
+    )
+    PUBLISH_MAX_ATTEMPTS: int = int(os.getenv("PUBLISH_MAX_ATTEMPTS", "4"))
+    PUBLISH_BACKOFF_BASE: float = float(os.getenv("PUBLISH_BACKOFF_BASE", "1.0"))
+    PUBLISH_BACKOFF_MAX: float = float(os.getenv("PUBLISH_BACKOFF_MAX", "60"))
+    PUBLISH_MAX_WAIT: float = float(os.getenv("PUBLISH_MAX_WAIT", "300"))  # longest a post queues for capacity
+    PUBLISH_PROCESSES: int = int(os.getenv("PUBLISH_PROCESSES", os.getenv("WEB_CONCURRENCY", "1")))  # web workers sharing PLATFORM_RATE_LIMITS
+    
+    # Durable publishing outbox
+    OUTBOX_WORKERS: int = int(os.getenv("OUTBOX_WORKERS", "8"))
+    OUTBOX_POLL_INTERVAL: float = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+    OUTBOX_LEASE_SECONDS: int = int(os.getenv("OUTBOX_LEASE_SECONDS", "600"))  # must exceed PUBLISH_MAX_WAIT plus the request
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+    OUTBOX_WAIT_SECONDS: float = float(os.getenv("OUTBOX_WAIT_SECONDS", "30"))  # how long publish endpoints wait for the result
+    OUTBOX_DEDUPE_WINDOW: int = int(os.getenv("OUTBOX_DEDUPE_WINDOW", "600"))  # seconds identical posts without a content ID are deduplicated
     
     # Reddit
     REDDIT_CLIENT_ID: str = os.getenv("REDDIT_CLIENT_ID", "")
@@ -2,14 +2,26 @@
 Database initialization and connection
 """
 from supabase import create_client, Client
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import DeclarativeBase, sessionmaker, Session
 from app.core.config import settings
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 # Global Supabase client
 supabase: Client = None
 
+# Global SQL engine for job and queue tables (DATABASE_URL, or a local SQLite file)
+engine: Engine = None
+SessionLocal: sessionmaker = None
+
+
+class Base(DeclarativeBase):
+    """Base class for SQL tables"""
+
 
 async def init_db():
     """Initialize database connection"""
@@ -23,6 +35,36 @@ async def init_db():
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
         raise
+    
+    init_sql_db()
+
+
+def init_sql_db() -> Engine:
+    """Initialize the SQL engine and create tables"""
+    global engine, SessionLocal
+    if engine is not None:
+        return engine
+    
+    url = settings.DATABASE_URL or settings.LOCAL_DATABASE_URL
+    if url.startswith("sqlite:///"):
+        os.makedirs(os.path.dirname(os.path.abspath(url[len("sqlite:///"):])), exist_ok=True)
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+    else:
+        engine = create_engine(url, pool_size=10, max_overflow=20, pool_pre_ping=True)
+    SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+    
+    # Register table definitions before creating them
+    import app.models.tables  # noqa: F401
+    Base.metadata.create_all(engine)
+    logger.info(f"SQL database ready ({engine.dialect.name})")
+    return engine
+
+
+def get_session() -> Session:
+    """Get a new SQL session"""
+    if SessionLocal is None:
+        init_sql_db()
+    return SessionLocal()
 
 
 def get_db() -> Client:
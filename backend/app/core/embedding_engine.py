@@ -0,0 +1,227 @@
+"""
+Batched, multi-process local embedding engine
+
+Concurrent embed_query/embed_documents calls are collected into micro-batches
+(bounded by max batch size and max wait) and encoded by sentence-transformers
+models loaded once per worker process, so large ingests use every core and
+queries are not serialized behind them in the web worker.
+"""
+from langchain_core.embeddings import Embeddings
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Model loaded once per worker process
+_worker_model = None
+
+
+def _init_worker(model_name: str, num_threads: int):
+    """Load the embedding model in a worker process"""
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(num_threads)
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_batch(texts: List[str]) -> List[List[float]]:
+    """Encode a batch of texts in a worker process"""
+    return _worker_model.encode(texts, batch_size=len(texts), show_progress_bar=False).tolist()
+
+
+class _EmbeddingRequest:
+    __slots__ = ("texts", "future")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+
+
+class BatchingEmbeddings(Embeddings):
+    """Embeddings that micro-batch concurrent requests onto a local process pool"""
+
+    def __init__(
+        self,
+        model_name: str,
+        workers: int = 2,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5,
+        threads_per_worker: Optional[int] = None,
+        timeout: float = 120
+    ):
+        self.model_name = model_name
+        self.workers = max(workers, 1)
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max_wait_ms / 1000
+        # Longest a synchronous caller waits for its vectors
+        self.timeout = timeout
+        self.threads_per_worker = threads_per_worker or max((os.cpu_count() or 1) // self.workers, 1)
+        self._queue: "queue.Queue[Optional[_EmbeddingRequest]]" = queue.Queue()
+        # Bounds in-flight batches so requests keep accumulating while every worker is busy
+        self._slots = threading.Semaphore(self.workers * 2)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._dispatcher: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "texts": 0, "batches": 0, "encode_seconds": 0.0}
+
+    def _ensure_started(self):
+        """Start the worker pool and dispatcher on first use"""
+        if self._dispatcher is not None:
+            return
+        with self._start_lock:
+            if self._dispatcher is not None:
+                return
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.threads_per_worker)
+            )
+            self._dispatcher = threading.Thread(
+                target=self._dispatch_loop,
+                name="embedding-dispatcher",
+                daemon=True
+            )
+            self._dispatcher.start()
+            logger.info(
+                f"Local embedding engine started: {self.model_name} "
+                f"({self.workers} workers, batch {self.max_batch_size}, wait {self.max_wait * 1000:.0f}ms)"
+            )
+
+    def _dispatch_loop(self):
+        """Group queued requests into micro-batches and hand them to the pool"""
+        carry: Optional[_EmbeddingRequest] = None
+        while True:
+            self._slots.acquire()
+            first = carry if carry is not None else self._queue.get()
+            carry = None
+            if first is None:
+                self._slots.release()
+                return
+
+            batch, size = [first], len(first.texts)
+            deadline = time.monotonic() + self.max_wait
+            stopping = False
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                if size + len(request.texts) > self.max_batch_size:
+                    carry = request
+                    break
+                batch.append(request)
+                size += len(request.texts)
+
+            self._submit(batch)
+            if stopping:
+                return
+
+    def _submit(self, batch: List[_EmbeddingRequest]):
+        # Requests whose caller gave up are dropped; the rest can no longer be cancelled,
+        # so setting their result below cannot fail
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not batch:
+            self._slots.release()
+            return
+        texts = [text for request in batch for text in request.texts]
+        started = time.perf_counter()
+
+        def on_done(future: Future):
+            self._slots.release()
+            with self._stats_lock:
+                self._stats["batches"] += 1
+                self._stats["texts"] += len(texts)
+                self._stats["encode_seconds"] += time.perf_counter() - started
+            try:
+                vectors = future.result()
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                return
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+        try:
+            self._pool.submit(_encode_batch, texts).add_done_callback(on_done)
+        except Exception as e:
+            self._slots.release()
+            for request in batch:
+                request.future.set_exception(e)
+
+    def _enqueue(self, texts: List[str]) -> List[Future]:
+        """Queue texts in pieces no larger than one batch so big calls spread across workers"""
+        self._ensure_started()
+        futures = []
+        for start in range(0, len(texts), self.max_batch_size):
+            request = _EmbeddingRequest(list(texts[start:start + self.max_batch_size]))
+            self._queue.put(request)
+            futures.append(request.future)
+        with self._stats_lock:
+            self._stats["requests"] += 1
+        return futures
+
+    def _wait(self, futures: List[Future]) -> List[List[float]]:
+        """Block for every batch, giving up after ``timeout`` seconds"""
+        deadline = time.monotonic() + self.timeout
+        vectors = []
+        try:
+            for future in futures:
+                vectors.extend(future.result(timeout=max(deadline - time.monotonic(), 0)))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, blocking until every batch completes"""
+        return self._wait(self._enqueue(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query"""
+        return self._wait(self._enqueue([text]))[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents without blocking the event loop"""
+        results = await asyncio.gather(*(asyncio.wrap_future(f) for f in self._enqueue(texts)))
+        return [vector for batch in results for vector in batch]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a query without blocking the event loop"""
+        return (await asyncio.wrap_future(self._enqueue([text])[0]))[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Get batching statistics"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_batch_size"] = stats["texts"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def close(self):
+        """Stop the dispatcher and worker processes"""
+        if self._dispatcher is None:
+            return
+        self._queue.put(None)
+        self._dispatcher.join(timeout=5)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._dispatcher = None
+        self._pool = None
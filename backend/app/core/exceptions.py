@@ -19,7 +19,8 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
             "error": True,
             "message": exc.detail,
             "status_code": exc.status_code
-        }
+        },
+        headers=getattr(exc, "headers", None)
     )
 
 
@@ -0,0 +1,111 @@
+"""
+Shared pooled HTTP client for outbound API calls
+"""
+from app.core.config import settings
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from urllib.parse import urlsplit
+import asyncio
+import httpx
+import ipaddress
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Global HTTP client
+http_client: httpx.AsyncClient = None
+
+
+def init_http_client() -> httpx.AsyncClient:
+    """Initialize the shared HTTP client with a persistent connection pool"""
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=60.0)
+        )
+        logger.info("HTTP client initialized")
+    return http_client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the shared HTTP client"""
+    if http_client is None:
+        return init_http_client()
+    return http_client
+
+
+class UnsafeURLError(ValueError):
+    """Raised for user-supplied URLs that must not be fetched from the server"""
+
+
+def _allowed_host(host: str) -> bool:
+    allowed = [item.strip().lower() for item in settings.OUTBOUND_ALLOWED_HOSTS.split(",") if item.strip()]
+    return not allowed or any(host == name or host.endswith("." + name) for name in allowed)
+
+
+async def check_public_url(url: str) -> str:
+    """Reject URLs that are not http(s), not on the allow-list, or resolve to a non-public address
+
+    Guards requests to user-supplied URLs against reaching internal services.
+    Redirects are not followed by the shared client, so only this URL is contacted.
+    Returns the checked address; connect with ``stream_public_url`` so the host
+    is not resolved again.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise UnsafeURLError("Only http and https URLs are allowed")
+    host = parts.hostname.lower()
+    if not _allowed_host(host):
+        raise UnsafeURLError(f"Host {host} is not allowed")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, port)
+    except (OSError, ValueError) as e:
+        raise UnsafeURLError(f"Cannot resolve {host}: {e}")
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if not address.is_global or address.is_multicast:
+            raise UnsafeURLError(f"Host {host} resolves to a non-public address")
+    return addresses[0][4][0]
+
+
+@asynccontextmanager
+async def stream_public_url(method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+    """Stream a request to a user-supplied URL over a connection pinned to the checked address
+
+    The request connects to the address ``check_public_url`` approved, keeping the
+    original Host header and TLS server name, so DNS rebinding cannot point it at an
+    internal service. The connection is closed afterwards instead of being pooled
+    under the bare address, where it could serve another host's requests.
+    """
+    address = await check_public_url(url)
+    target = httpx.URL(url)
+    headers = {**kwargs.pop("headers", {}), "Host": target.netloc.decode("ascii"), "Connection": "close"}
+    extensions = {"sni_hostname": target.host} if target.scheme == "https" else {}
+    async with get_http_client().stream(
+        method, target.copy_with(host=address), headers=headers, extensions=extensions, **kwargs
+    ) as response:
+        yield response
+
+
+async def read_limited(response: httpx.Response, max_bytes: int) -> bytes:
+    """Read a streamed response body, failing once it exceeds ``max_bytes``"""
+    length = response.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > max_bytes:
+        raise UnsafeURLError(f"Response is larger than {max_bytes} bytes")
+    chunks, size = [], 0
+    async for chunk in response.aiter_bytes():
+        size += len(chunk)
+        if size > max_bytes:
+            raise UnsafeURLError(f"Response is larger than {max_bytes} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def close_http_client():
+    """Close the shared HTTP client and its connections"""
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
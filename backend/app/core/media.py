@@ -0,0 +1,177 @@
+"""
+Serving of stored media files
+
+Stored images are content-addressed and never rewritten, so responses carry a
+strong ETag and an immutable Cache-Control header, and conditional requests
+get 304 Not Modified. Single byte ranges are supported. The body is sent with
+the ASGI zero-copy extension when the server offers it, or handed off to
+nginx with X-Accel-Redirect when MEDIA_ACCEL_REDIRECT_PREFIX is set.
+"""
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Optional, Tuple
+import asyncio
+import mimetypes
+import os
+import re
+
+# Names written by ImageStore: <sha256>.<ext> and renditions <sha256>.<name>.<ext>
+MEDIA_FILENAME = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9-]+)?\.(png|jpg|jpeg|webp)$")
+CHUNK_SIZE = 256 * 1024
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=" range into inclusive (start, end); None to serve the whole file
+
+    Raises ValueError if the range cannot be satisfied.
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        # Multiple ranges are rare for images; the full file is a valid answer
+        return None
+    start, _, end = (part.strip() for part in ranges.partition("-"))
+    if not (start or end) or (start and not start.isdigit()) or (end and not end.isdigit()):
+        return None
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(0, size - length), size - 1
+    first = int(start)
+    last = int(end) if end else size - 1
+    if first >= size:
+        raise ValueError("Range not satisfiable")
+    if last < first:
+        return None
+    return first, min(last, size - 1)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+class MediaFiles:
+    """ASGI app serving files from the image store directory"""
+
+    def __init__(self, directory: str, max_age: int = 31536000, accel_redirect_prefix: str = ""):
+        self.directory = directory
+        self.max_age = max_age
+        self.accel_redirect_prefix = accel_redirect_prefix.rstrip("/")
+
+    async def __call__(self, scope, receive, send):
+        if scope["method"] not in ("GET", "HEAD"):
+            await self._respond(send, 405, [(b"allow", b"GET, HEAD")])
+            return
+        filename = scope["path"].lstrip("/")
+        if not MEDIA_FILENAME.match(filename):
+            await self._respond(send, 404)
+            return
+        path = os.path.join(self.directory, filename)
+        try:
+            stat = await asyncio.to_thread(os.stat, path)
+        except FileNotFoundError:
+            await self._respond(send, 404)
+            return
+
+        request_headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        etag = '"{}"'.format(filename.rsplit(".", 1)[0])
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        headers = [
+            (b"content-type", (mimetypes.guess_type(filename)[0] or "application/octet-stream").encode()),
+            (b"etag", etag.encode()),
+            (b"last-modified", last_modified.encode()),
+            (b"cache-control", f"public, max-age={self.max_age}, immutable".encode()),
+            (b"accept-ranges", b"bytes"),
+            (b"x-content-type-options", b"nosniff"),
+        ]
+
+        if self._not_modified(request_headers, etag, stat.st_mtime):
+            await self._respond(send, 304, headers)
+            return
+
+        if self.accel_redirect_prefix:
+            # nginx serves the body with sendfile and handles Range itself
+            headers.append((b"x-accel-redirect", f"{self.accel_redirect_prefix}/{filename}".encode()))
+            await self._respond(send, 200, headers)
+            return
+
+        size = stat.st_size
+        status, offset, count = 200, 0, size
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and (if_range is None or if_range.strip() in (etag, last_modified)):
+            try:
+                byte_range = _parse_range(range_header, size)
+            except ValueError:
+                await self._respond(send, 416, headers + [(b"content-range", f"bytes */{size}".encode())])
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                status, offset, count = 206, start, end - start + 1
+                headers.append((b"content-range", f"bytes {start}-{end}/{size}".encode()))
+        headers.append((b"content-length", str(count).encode()))
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if scope["method"] == "HEAD" or count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": offset, "count": count})
+            return
+        await self._send_chunks(send, path, offset, count)
+
+    def _not_modified(self, request_headers: dict, etag: str, mtime: float) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return _etag_matches(if_none_match, etag)
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def _send_chunks(self, send, path: str, offset: int, count: int):
+        """Fallback for servers without zero-copy send: read in a thread, chunk by chunk"""
+        f = await asyncio.to_thread(open, path, "rb")
+        try:
+            await asyncio.to_thread(f.seek, offset)
+            while count > 0:
+                chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, count))
+                if not chunk:
+                    break
+                count -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": count > 0})
+            if count > 0:
+                # File shrank underneath us; close the response
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await asyncio.to_thread(f.close)
+
+    async def _respond(self, send, status: int, headers: Optional[List[Tuple[bytes, bytes]]] = None):
+        await send({"type": "http.response.start", "status": status, "headers": (headers or []) + [(b"content-length", b"0")]})
+        await send({"type": "http.response.body", "body": b""})
+
+
+class MediaMiddleware:
+    """Routes media URLs straight to MediaFiles
+
+    Installed outermost so file bodies skip BaseHTTPMiddleware, which would
+    copy every chunk through a memory stream and cannot pass zero-copy sends.
+    """
+
+    def __init__(self, app, prefix: str, directory: str, max_age: int = 31536000, accel_redirect_prefix: str = ""):
+        self.app = app
+        self.prefix = prefix.rstrip("/")
+        self.files = MediaFiles(directory, max_age=max_age, accel_redirect_prefix=accel_redirect_prefix)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.prefix + "/"):
+            await self.files({**scope, "path": scope["path"][len(self.prefix):]}, receive, send)
+            return
+        await self.app(scope, receive, send)
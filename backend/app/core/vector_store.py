@@ -3,19 +3,74 @@ Vector store initialization for RAG pipeline
 """
 from langchain.vectorstores import Pinecone, Qdrant
 from langchain_openai import OpenAIEmbeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_core.embeddings import Embeddings
 import pinecone
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import (
+    Distance,
+    VectorParams,
+    PayloadSchemaType,
+    Filter,
+    FieldCondition,
+    IsEmptyCondition,
+    PayloadField,
+    MatchAny,
+    MatchValue,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    ProductQuantization,
+    ProductQuantizationConfig,
+    CompressionRatio,
+    SearchParams,
+    QuantizationSearchParams
+)
 from app.core.config import settings
+from app.core.embedding_engine import BatchingEmbeddings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import functools
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
 # Global vector store
 vector_store = None
 embeddings: Embeddings = None
+_init_lock = threading.Lock()
+
+# Bounded pool for blocking vector store calls so they never run on the event loop
+vector_store_executor = ThreadPoolExecutor(
+    max_workers=settings.VECTOR_STORE_MAX_WORKERS,
+    thread_name_prefix="vector-store"
+)
+
+# Vector store methods served by a native async client when one is available. Similarity
+# search is not listed: its async variant embeds the query synchronously on the event loop,
+# so RAGService embeds with aembed_query and searches by vector instead.
+NATIVE_ASYNC_METHODS = {"add_documents"}
+
+# Pinecone caps top_k for queries that return metadata
+PINECONE_MAX_METADATA_TOP_K = 1000
+
+
+def build_quantization_config():
+    """Qdrant quantization config for the configured storage mode"""
+    mode = settings.QDRANT_QUANTIZATION.lower()
+    if mode == "int8":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if mode == "pq":
+        return ProductQuantization(
+            product=ProductQuantizationConfig(
+                compression=CompressionRatio(settings.QDRANT_PQ_COMPRESSION),
+                always_ram=True
+            )
+        )
+    return None
 
 
 def init_vector_store():
@@ -28,11 +83,15 @@ def init_vector_store():
             embeddings = OpenAIEmbeddings(openai_api_key=settings.OPENAI_API_KEY)
             logger.info("Using OpenAI embeddings")
         else:
-            # Fallback to HuggingFace embeddings
-            embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2"
+            # Fallback to local sentence-transformers embeddings in a batching process pool
+            embeddings = BatchingEmbeddings(
+                model_name=settings.LOCAL_EMBEDDING_MODEL,
+                workers=settings.LOCAL_EMBEDDING_WORKERS,
+                max_batch_size=settings.LOCAL_EMBEDDING_MAX_BATCH,
+                max_wait_ms=settings.LOCAL_EMBEDDING_MAX_WAIT_MS,
+                timeout=settings.LOCAL_EMBEDDING_TIMEOUT
             )
-            logger.info("Using HuggingFace embeddings")
+            logger.info("Using local batched embeddings")
         
         if settings.USE_PINECONE and settings.PINECONE_API_KEY:
             # Initialize Pinecone
@@ -57,27 +116,52 @@ def init_vector_store():
         
         else:
             # Initialize Qdrant
+            qdrant_api_key = settings.QDRANT_API_KEY if settings.QDRANT_API_KEY else None
             qdrant_client = QdrantClient(
                 url=settings.QDRANT_URL,
-                api_key=settings.QDRANT_API_KEY if settings.QDRANT_API_KEY else None
+                api_key=qdrant_api_key
             )
             
+            # Quantized vectors stay in RAM; the float originals move to disk for rescoring
+            quantization_config = build_quantization_config()
+            
             # Create collection if it doesn't exist
             try:
                 qdrant_client.get_collection("social_media_content")
+                collection_exists = True
             except:
+                collection_exists = False
+            
+            if collection_exists:
+                if quantization_config is not None:
+                    qdrant_client.update_collection(
+                        collection_name="social_media_content",
+                        quantization_config=quantization_config
+                    )
+            else:
                 qdrant_client.create_collection(
                     collection_name="social_media_content",
                     vectors_config=VectorParams(
                         size=1536 if settings.OPENAI_API_KEY else 384,
-                        distance=Distance.COSINE
-                    )
+                        distance=Distance.COSINE,
+                        on_disk=quantization_config is not None
+                    ),
+                    quantization_config=quantization_config
+                )
+            
+            # Index the payload fields used for tenant and metadata filtering
+            for field in settings.RAG_INDEXED_METADATA_FIELDS.split(","):
+                qdrant_client.create_payload_index(
+                    collection_name="social_media_content",
+                    field_name=f"{Qdrant.METADATA_KEY}.{field.strip()}",
+                    field_schema=PayloadSchemaType.KEYWORD
                 )
             
             vector_store = Qdrant(
                 client=qdrant_client,
                 collection_name="social_media_content",
-                embeddings=embeddings
+                embeddings=embeddings,
+                async_client=AsyncQdrantClient(url=settings.QDRANT_URL, api_key=qdrant_api_key)
             )
             logger.info("Qdrant vector store initialized")
     
@@ -89,13 +173,168 @@ def init_vector_store():
 def get_vector_store():
     """Get vector store instance"""
     if vector_store is None:
-        init_vector_store()
+        with _init_lock:
+            if vector_store is None:
+                init_vector_store()
     return vector_store
 
 
 def get_embeddings():
     """Get embeddings instance"""
     if embeddings is None:
-        init_vector_store()
+        with _init_lock:
+            if embeddings is None:
+                init_vector_store()
     return embeddings
 
+
+def pinecone_namespace(tenant_id: str) -> str:
+    """Pinecone namespace for a tenant; the default tenant keeps the default namespace chunks were first written to"""
+    return "" if tenant_id == settings.RAG_DEFAULT_TENANT else tenant_id
+
+
+def _qdrant_tenant_condition(store, tenant_id: str):
+    """Qdrant condition matching a tenant's chunks; chunks stored without a tenant_id belong to the default tenant"""
+    field = f"{store.metadata_payload_key}.tenant_id"
+    condition = FieldCondition(key=field, match=MatchValue(value=tenant_id))
+    if tenant_id != settings.RAG_DEFAULT_TENANT:
+        return condition
+    return Filter(should=[condition, IsEmptyCondition(is_empty=PayloadField(key=field))])
+
+
+def build_write_kwargs(store, tenant_id: str) -> Dict[str, Any]:
+    """Vector store arguments that scope writes and deletes to a tenant"""
+    if isinstance(store, Pinecone):
+        return {"namespace": pinecone_namespace(tenant_id)}
+    # Other stores partition by the indexed tenant_id payload field
+    return {}
+
+
+def build_search_kwargs(store, tenant_id: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Vector store arguments that scope a search to a tenant and metadata filters"""
+    filters = filters or {}
+    if isinstance(store, Pinecone):
+        pinecone_filter = {
+            key: {"$in": list(value)} if isinstance(value, (list, tuple, set)) else value
+            for key, value in filters.items()
+        }
+        return {"namespace": pinecone_namespace(tenant_id), "filter": pinecone_filter or None}
+    
+    if isinstance(store, Qdrant):
+        conditions = [_qdrant_tenant_condition(store, tenant_id)]
+        for key, value in filters.items():
+            field = f"{store.metadata_payload_key}.{key}"
+            if isinstance(value, (list, tuple, set)):
+                conditions.append(FieldCondition(key=field, match=MatchAny(any=list(value))))
+            else:
+                conditions.append(FieldCondition(key=field, match=MatchValue(value=value)))
+        search_kwargs = {"filter": Filter(must=conditions)}
+        if build_quantization_config() is not None:
+            # Oversample quantized candidates and rescore them against the float originals
+            search_kwargs["search_params"] = SearchParams(
+                quantization=QuantizationSearchParams(
+                    rescore=settings.QDRANT_QUANTIZATION_RESCORE,
+                    oversampling=settings.QDRANT_QUANTIZATION_OVERSAMPLING
+                )
+            )
+        return search_kwargs
+    
+    return {"filter": {**filters, "tenant_id": tenant_id}}
+
+
+def find_document_chunks(store, document_id: str, tenant_id: str, batch_size: int = 256) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+    """Find every stored chunk of a document as {chunk_id: (text, metadata)} (blocking)"""
+    chunks = {}
+    if isinstance(store, Qdrant):
+        scroll_filter = Filter(must=[
+            FieldCondition(key=f"{store.metadata_payload_key}.document_id", match=MatchValue(value=document_id)),
+            _qdrant_tenant_condition(store, tenant_id)
+        ])
+        offset = None
+        while True:
+            points, offset = store.client.scroll(
+                collection_name=store.collection_name,
+                scroll_filter=scroll_filter,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False
+            )
+            for point in points:
+                payload = point.payload or {}
+                chunks[str(point.id)] = (
+                    payload.get(store.content_payload_key, ""),
+                    payload.get(store.metadata_payload_key) or {}
+                )
+            if offset is None:
+                return chunks
+    
+    if isinstance(store, Pinecone):
+        # Pinecone cannot list by metadata alone, so query with the filter and a placeholder vector,
+        # paging past the chunks already seen since metadata queries return at most 1000 matches
+        index = store._index
+        dimension = index.describe_index_stats()["dimension"]
+        page_size = min(batch_size, PINECONE_MAX_METADATA_TOP_K)
+        while True:
+            page_filter = {"document_id": {"$in": [document_id]}}
+            if chunks:
+                page_filter["chunk_id"] = {"$nin": list(chunks)}
+            response = index.query(
+                vector=[1.0] + [0.0] * (dimension - 1),
+                top_k=page_size,
+                filter=page_filter,
+                namespace=pinecone_namespace(tenant_id),
+                include_metadata=True
+            )
+            found = len(chunks)
+            for match in response["matches"]:
+                metadata = dict(match["metadata"] or {})
+                text = metadata.pop(store._text_key, "")
+                chunks[match["id"]] = (text, metadata)
+            # A short page is the last one; no new chunks means the rest can't be paged past
+            if len(response["matches"]) < page_size or len(chunks) == found:
+                return chunks
+    
+    raise NotImplementedError(f"Finding document chunks is not supported for {type(store).__name__}")
+
+
+def update_chunk_metadata(store, chunk_id: str, metadata: Dict[str, Any], tenant_id: str):
+    """Replace the metadata stored with a chunk without re-embedding it (blocking)"""
+    if isinstance(store, Qdrant):
+        store.client.set_payload(
+            collection_name=store.collection_name,
+            payload={store.metadata_payload_key: metadata},
+            points=[chunk_id]
+        )
+    elif isinstance(store, Pinecone):
+        # Pinecone merges metadata on update, so fields that went away keep their old value
+        store._index.update(id=chunk_id, set_metadata=metadata, namespace=pinecone_namespace(tenant_id))
+    else:
+        raise NotImplementedError(f"Updating chunk metadata is not supported for {type(store).__name__}")
+
+
+async def run_in_vector_pool(func, *args, **kwargs):
+    """Run a blocking vector store call in the bounded vector store pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(vector_store_executor, functools.partial(func, *args, **kwargs))
+
+
+def supports_native_async(store) -> bool:
+    """Check whether a vector store has a native async client"""
+    return getattr(store, "async_client", None) is not None
+
+
+async def aget_vector_store():
+    """Get vector store instance, initializing it off the event loop"""
+    if vector_store is None:
+        await run_in_vector_pool(get_vector_store)
+    return vector_store
+
+
+async def close_vector_store():
+    """Close vector store clients and the worker pools"""
+    if supports_native_async(vector_store):
+        await vector_store.async_client.close()
+    if isinstance(embeddings, BatchingEmbeddings):
+        embeddings.close()
+    vector_store_executor.shutdown(wait=False)
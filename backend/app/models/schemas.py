@@ -23,6 +23,13 @@ class ContentStatus(str, Enum):
     FAILED = "failed"
 
 
+class ImageQuality(str, Enum):
+    """Image generation quality tier"""
+    PREVIEW = "preview"
+    STANDARD = "standard"
+    FINAL = "final"
+
+
 class ContentRequest(BaseModel):
     """Request to generate content"""
     topic: str = Field(..., description="Topic for content generation")
@@ -63,6 +70,41 @@ class PostResponse(BaseModel):
     published_at: Optional[datetime] = None
     scheduled_for: Optional[datetime] = None
     error: Optional[str] = None
+    retryable: bool = Field(False, description="Whether a failed post was not processed by the platform and can be retried")
+
+
+class OutboxStatus(str, Enum):
+    """Publishing outbox entry status"""
+    PENDING = "pending"
+    IN_FLIGHT = "in_flight"
+    PUBLISHED = "published"
+    FAILED = "failed"
+
+
+class PlatformPost(BaseModel):
+    """Content and media for one platform in a multi-platform post"""
+    platform: Platform
+    content: str
+    image_url: Optional[str] = None
+
+
+class MultiPlatformPostRequest(BaseModel):
+    """Request to publish to several platforms at once"""
+    content_id: str = ""
+    posts: List[PlatformPost] = Field(..., min_length=1, description="One entry per platform")
+
+
+class PlatformPostResult(PostResponse):
+    """Outcome of publishing to one platform"""
+    duration_seconds: float
+
+
+class MultiPlatformPostResponse(BaseModel):
+    """Aggregated outcome of a multi-platform post"""
+    content_id: str
+    status: str = Field(..., description="published, partial or failed")
+    results: List[PlatformPostResult]
+    duration_seconds: float
 
 
 class TrendingTopic(BaseModel):
@@ -99,6 +141,7 @@ class RAGUploadRequest(BaseModel):
     content: str
     metadata: Optional[Dict[str, Any]] = None
     document_type: Optional[str] = None
+    tenant_id: Optional[str] = Field(None, description="Tenant namespace (defaults to the shared namespace)")
 
 
 class AnalyticsRequest(BaseModel):
@@ -125,6 +168,8 @@ class ImageGenerationRequest(BaseModel):
     width: int = Field(512, ge=256, le=1024)
     height: int = Field(512, ge=256, le=1024)
     num_images: int = Field(1, ge=1, le=4)
+    seed: Optional[int] = Field(None, description="Fixed seed for reproducible images")
+    quality: ImageQuality = Field(ImageQuality.STANDARD, description="Preview drafts are fast and low resolution")
 
 
 class ImageGenerationResponse(BaseModel):
@@ -133,3 +178,33 @@ class ImageGenerationResponse(BaseModel):
     prompt: str
     metadata: Dict[str, Any]
 
+
+class ImageAnalysisRequest(BaseModel):
+    """Request to analyze a batch of images"""
+    images: List[str] = Field(..., min_length=1, max_length=32, description="Image URLs or stored image paths")
+
+
+class ImageJobStatus(str, Enum):
+    """Image job status"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class ImageJobRequest(ImageGenerationRequest):
+    """Request to generate images in the background"""
+    webhook_url: Optional[str] = Field(None, description="Called with the job when it finishes")
+
+
+class ImageJobResponse(BaseModel):
+    """Image job state"""
+    job_id: str
+    status: ImageJobStatus
+    created_at: datetime
+    updated_at: datetime
+    completed_at: Optional[datetime] = None
+    result: Optional[ImageGenerationResponse] = None
+    error: Optional[str] = None
+
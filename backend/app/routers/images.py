@@ -2,8 +2,21 @@
 Image generation router
 """
 from fastapi import APIRouter, HTTPException
-from app.models.schemas import ImageGenerationRequest, ImageGenerationResponse
+from fastapi.responses import StreamingResponse
+from app.models.schemas import (
+    ImageGenerationRequest,
+    ImageGenerationResponse,
+    ImageJobRequest,
+    ImageJobResponse,
+    ImageAnalysisRequest
+)
 from app.services.image_generator import image_generator
+from app.services.diffusion_worker import WorkerBusyError
+from app.services.image_store import image_store
+from app.services.image_jobs import image_job_service
+from app.services.image_analysis import image_analysis_service
+import asyncio
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,27 +30,104 @@ async def generate_image(request: ImageGenerationRequest):
     try:
         response = await image_generator.generate_image(request)
         return response
+    except WorkerBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"Error generating image: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/jobs", response_model=ImageJobResponse, status_code=202)
+async def create_image_job(request: ImageJobRequest):
+    """Queue image generation and return a job id to poll"""
+    try:
+        return await image_job_service.create_job(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error creating image job: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/jobs/{job_id}", response_model=ImageJobResponse)
+async def get_image_job(job_id: str):
+    """Get image job status and result"""
+    job = await image_job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_image_job(job_id: str):
+    """Stream job status and low-resolution previews as server-sent events"""
+    if await image_job_service.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for event in image_job_service.events(job_id):
+            if "comment" in event:
+                yield f": {event['comment']}\n\n"
+            else:
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=ImageJobResponse)
+async def cancel_image_job(job_id: str):
+    """Cancel a queued or running image job"""
+    job = await image_job_service.cancel_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/backends")
+async def get_backends():
+    """Get Stable Diffusion backend pool health and load"""
+    return {"backends": image_generator.get_backend_stats()}
+
+
+@router.get("/worker")
+async def get_worker():
+    """Get local diffusion worker queue depth and job timing"""
+    return image_generator.get_worker_stats()
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Get generation cache hit rate and image storage usage"""
+    return await asyncio.to_thread(image_generator.get_cache_stats)
+
+
+@router.get("/renditions")
+async def get_renditions(image_url: str):
+    """List the platform renditions stored for a generated image"""
+    source = image_store.filename_from_url(image_url)
+    if source is None:
+        raise HTTPException(status_code=404, detail="Image is not stored locally")
+    return {"image_url": image_url, "renditions": await asyncio.to_thread(image_store.get_renditions, source)}
+
+
 @router.post("/analyze")
 async def analyze_image(image_url: str):
     """Analyze image for insights"""
     try:
-        # Placeholder for image analysis
-        # In production, use vision models to analyze images
-        return {
-            "image_url": image_url,
-            "insights": {
-                "aesthetics": "high",
-                "tone": "professional",
-                "colors": ["blue", "white"],
-                "engagement_potential": "high"
-            }
-        }
+        return await image_analysis_service.analyze(image_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error analyzing image: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/analyze/batch")
+async def analyze_images(request: ImageAnalysisRequest):
+    """Analyze a batch of images; failures are reported per image"""
+    results = await image_analysis_service.analyze_batch(request.images)
+    return {"results": results, "cache": image_analysis_service.cache.stats()}
@@ -1,54 +1,83 @@
 """
 RAG (Retrieval-Augmented Generation) router
 """
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Body
 from app.models.schemas import RAGUploadRequest, RAGDocument
-from app.services.rag_service import RAGService
-from typing import List, Dict, Any
+from app.services.rag_service import rag_service
+from app.core.vector_store import get_embeddings, aget_vector_store, run_in_vector_pool
+from app.services.vector_quantization import evaluate_quantization
+from app.core.embedding_engine import BatchingEmbeddings
+from typing import List, Dict, Any, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-rag_service = RAGService()
 
 
 @router.post("/upload")
 async def upload_document(request: RAGUploadRequest):
     """Upload document to RAG"""
     try:
-        document_id = await rag_service.add_document(
+        metadata = dict(request.metadata or {})
+        if request.document_type:
+            metadata["document_type"] = request.document_type
+        
+        report = await rag_service.ingest_document(
             content=request.content,
-            metadata=request.metadata or {}
+            metadata=metadata,
+            tenant_id=request.tenant_id
         )
-        return {"document_id": document_id, "message": "Document uploaded successfully"}
+        return {
+            "document_id": report["document_id"],
+            "message": "Document uploaded successfully",
+            "deduplication": report
+        }
     except Exception as e:
         logger.error(f"Error uploading document: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/upload/file")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(
+    file: UploadFile = File(...),
+    document_type: Optional[str] = Form(None),
+    tenant_id: Optional[str] = Form(None)
+):
     """Upload file to RAG"""
     try:
         content = await file.read()
         content_str = content.decode("utf-8")
         
-        document_id = await rag_service.add_document(
+        metadata = {"filename": file.filename, "content_type": file.content_type}
+        if document_type:
+            metadata["document_type"] = document_type
+        
+        report = await rag_service.ingest_document(
             content=content_str,
-            metadata={"filename": file.filename, "content_type": file.content_type}
+            metadata=metadata,
+            tenant_id=tenant_id
         )
-        return {"document_id": document_id, "message": "File uploaded successfully"}
+        return {
+            "document_id": report["document_id"],
+            "message": "File uploaded successfully",
+            "deduplication": report
+        }
     except Exception as e:
         logger.error(f"Error uploading file: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/search")
-async def search_documents(query: str, top_k: int = 5):
-    """Search documents in RAG"""
+async def search_documents(
+    query: str,
+    top_k: int = 5,
+    tenant_id: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = Body(None, embed=True)
+):
+    """Search documents in RAG, optionally filtered by metadata (e.g. {"document_type": "guideline"})"""
     try:
-        results = await rag_service.search_with_metadata(query, top_k)
+        results = await rag_service.search_with_metadata(query, top_k, filters=filters, tenant_id=tenant_id)
         return {"query": query, "results": results}
     except Exception as e:
         logger.error(f"Error searching documents: {e}")
@@ -56,15 +85,51 @@ async def search_documents(query: str, top_k: int = 5):
 
 
 @router.delete("/document/{document_id}")
-async def delete_document(document_id: str):
+async def delete_document(document_id: str, tenant_id: Optional[str] = None):
     """Delete document from RAG"""
     try:
-        success = await rag_service.delete_document(document_id)
+        success = await rag_service.delete_document(document_id, tenant_id=tenant_id)
         if success:
             return {"message": "Document deleted successfully"}
         else:
             raise HTTPException(status_code=404, detail="Document not found")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting document: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Get RAG retrieval cache statistics"""
+    return rag_service.get_cache_stats()
+
+
+@router.get("/dedup/stats")
+async def get_dedup_stats():
+    """Get near-duplicate chunk detection statistics"""
+    return rag_service.get_dedup_stats()
+
+
+@router.get("/embeddings/stats")
+async def get_embedding_stats():
+    """Get local embedding engine batching statistics"""
+    # The first call may load the model, so keep it off the event loop
+    embeddings = await run_in_vector_pool(get_embeddings)
+    if not isinstance(embeddings, BatchingEmbeddings):
+        return {"engine": type(embeddings).__name__, "batching": False}
+    return {"engine": embeddings.model_name, "batching": True, **embeddings.stats()}
+
+
+@router.get("/quantization/report")
+async def get_quantization_report(sample_size: int = 100, k: int = 10):
+    """Report memory saved and recall lost by quantized vector storage"""
+    try:
+        vector_store = await aget_vector_store()
+        return await run_in_vector_pool(evaluate_quantization, vector_store, sample_size, k)
+    except NotImplementedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error building quantization report: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
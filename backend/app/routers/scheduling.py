@@ -3,7 +3,7 @@ Scheduling router
 """
 from fastapi import APIRouter, HTTPException
 from app.models.schemas import PostRequest, PostResponse
-from app.services.social_media import social_media_service
+from app.services.publish_outbox import publish_outbox
 from app.core.scheduler import get_scheduler
 from app.core.database import get_db
 from pydantic import BaseModel
@@ -61,9 +61,9 @@ async def schedule_post(request: SchedulePostRequest):
 
 
 async def _publish_post(request: PostRequest, content: str) -> PostResponse:
-    """Publish a post"""
+    """Publish a post through the durable outbox"""
     try:
-        response = await social_media_service.post(request, content)
+        response = await publish_outbox.publish(request, content)
         return response
     except Exception as e:
         logger.error(f"Error publishing post: {e}")
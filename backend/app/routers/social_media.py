@@ -2,8 +2,11 @@
 Social media router
 """
 from fastapi import APIRouter, HTTPException
-from app.models.schemas import PostRequest, PostResponse
+from app.models.schemas import PostRequest, PostResponse, MultiPlatformPostRequest, MultiPlatformPostResponse
 from app.services.social_media import social_media_service
+from app.services.platform_limits import platform_rate_limiter
+from app.services.publish_outbox import publish_outbox
+from app.services.media_cache import media_upload_cache
 from app.core.config import settings
 from pydantic import BaseModel
 from typing import List
@@ -28,13 +31,52 @@ async def post_content(request: PostContentRequest):
             platform=request.platform,
             image_url=request.image_url
         )
-        response = await social_media_service.post(post_request, request.content)
+        response = await publish_outbox.publish(post_request, request.content)
         return response
     except Exception as e:
         logger.error(f"Error posting to social media: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/post/multi", response_model=MultiPlatformPostResponse)
+async def post_content_multi(request: MultiPlatformPostRequest):
+    """Post to several platforms concurrently with per-platform status and timing"""
+    platforms = [post.platform for post in request.posts]
+    if len(set(platforms)) != len(platforms):
+        raise HTTPException(status_code=400, detail="Each platform may appear only once")
+    try:
+        return await social_media_service.post_many(request.content_id, request.posts, publish=publish_outbox.publish_post)
+    except Exception as e:
+        logger.error(f"Error posting to multiple platforms: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/rate-limits")
+async def get_rate_limits():
+    """Get publishing token bucket state per platform account"""
+    return platform_rate_limiter.stats()
+
+
+@router.get("/outbox")
+async def get_outbox():
+    """Get publishing outbox depth by status"""
+    try:
+        return await publish_outbox.stats()
+    except Exception as e:
+        logger.error(f"Error getting outbox stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/media-cache")
+async def get_media_cache():
+    """Get media upload cache hit rate and entries per platform"""
+    try:
+        return await media_upload_cache.stats()
+    except Exception as e:
+        logger.error(f"Error getting media cache stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/platforms")
 async def get_platforms():
     """Get available platforms"""
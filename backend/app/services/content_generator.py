@@ -7,7 +7,7 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.schema import HumanMessage, SystemMessage
 from app.core.config import settings
 from app.models.schemas import Platform, ContentRequest, ContentResponse, ContentStatus
-from app.services.rag_service import RAGService
+from app.services.rag_service import rag_service
 from typing import Optional, List
 import logging
 import uuid
@@ -21,7 +21,7 @@ class ContentGeneratorService:
     
     def __init__(self):
         self.llm = None
-        self.rag_service = RAGService()
+        self.rag_service = rag_service
     
     def _get_llm(self):
         """Get or initialize LLM"""
@@ -0,0 +1,167 @@
+"""
+Near-duplicate chunk detection with MinHash signatures and an LSH index
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+import hashlib
+import json
+import re
+import threading
+import numpy as np
+
+# Mersenne prime used for the universal hash family
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Chunk metadata fields that describe the chunk itself rather than a source document
+CHUNK_FIELDS = ("tenant_id", "chunk_id", "sources")
+
+
+class MinHasher:
+    """Computes MinHash signatures over word shingles"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    def _shingles(self, text: str) -> Set[str]:
+        words = re.findall(r"\w+", text.lower())
+        if len(words) < self.shingle_size:
+            return {" ".join(words)} if words else set()
+        return {
+            " ".join(words[i:i + self.shingle_size])
+            for i in range(len(words) - self.shingle_size + 1)
+        }
+
+    def signature(self, text: str) -> np.ndarray:
+        """Compute the MinHash signature of a text"""
+        shingles = self._shingles(text)
+        if not shingles:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles],
+            dtype=np.uint64
+        )
+        # (a * x + b) mod p, truncated to 32 bits, for every permutation and shingle
+        permuted = (np.outer(hashes, self._a) + self._b) % np.uint64(_PRIME) & np.uint64(_MAX_HASH)
+        return permuted.min(axis=0)
+
+
+def estimate_jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimate Jaccard similarity from two MinHash signatures"""
+    return float(np.mean(a == b))
+
+
+class NearDuplicateIndex:
+    """Banded LSH index over MinHash signatures of stored chunks"""
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, threshold: float = 0.85):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = defaultdict(set)
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [
+            (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def find_duplicate(self, signature: np.ndarray) -> Optional[Tuple[str, float]]:
+        """Return the most similar indexed chunk above the threshold, if any"""
+        with self._lock:
+            candidates: Set[str] = set()
+            for key in self._band_keys(signature):
+                candidates |= self._buckets.get(key, set())
+            best: Optional[Tuple[str, float]] = None
+            for chunk_id in candidates:
+                similarity = estimate_jaccard(signature, self._signatures[chunk_id])
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (chunk_id, similarity)
+            return best
+
+    def add(self, chunk_id: str, signature: np.ndarray):
+        """Index a stored chunk, replacing any previous signature"""
+        with self._lock:
+            self._remove_locked(chunk_id)
+            self._signatures[chunk_id] = signature
+            for key in self._band_keys(signature):
+                self._buckets[key].add(chunk_id)
+
+    def remove(self, chunk_id: str):
+        """Forget a chunk that was deleted from the store"""
+        with self._lock:
+            self._remove_locked(chunk_id)
+
+    def _remove_locked(self, chunk_id: str):
+        signature = self._signatures.pop(chunk_id, None)
+        if signature is None:
+            return
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(chunk_id)
+                if not bucket:
+                    del self._buckets[key]
+
+
+def chunk_sources(metadata: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Metadata of every document a stored chunk belongs to, keyed by document id"""
+    if metadata.get("sources"):
+        return json.loads(metadata["sources"])
+    return {
+        str(metadata.get("document_id")): {key: value for key, value in metadata.items() if key not in CHUNK_FIELDS}
+    }
+
+
+def _flatten_sources(metadata: Dict[str, Any], sources: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Chunk metadata whose filterable fields hold the values of every source document"""
+    flattened = {key: metadata[key] for key in CHUNK_FIELDS if key in metadata and key != "sources"}
+    if len(sources) == 1:
+        return {**next(iter(sources.values())), **flattened}
+    values: Dict[str, List[Any]] = {}
+    for source in sources.values():
+        for key, value in source.items():
+            merged = values.setdefault(key, [])
+            for v in value if isinstance(value, list) else [value]:
+                if v not in merged:
+                    merged.append(v)
+    for key, merged in values.items():
+        flattened[key] = merged[0] if len(merged) == 1 else merged
+    # Kept as a JSON string since Pinecone metadata cannot nest objects
+    flattened["sources"] = json.dumps(sources, sort_keys=True, default=str)
+    return flattened
+
+
+def merge_chunk_metadata(
+    metadata: Dict[str, Any],
+    document_id: str,
+    document_metadata: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Add a document whose content duplicates a stored chunk to that chunk's metadata
+
+    Fields become lists when documents disagree, so metadata filters such as
+    document_id or document_type match the chunk for every document it belongs to.
+    """
+    sources = chunk_sources(metadata)
+    sources[document_id] = {**document_metadata, "document_id": document_id}
+    return _flatten_sources(metadata, sources)
+
+
+def release_chunk_metadata(metadata: Dict[str, Any], document_id: str) -> Optional[Dict[str, Any]]:
+    """Remove a document from a chunk's metadata; None when no document uses the chunk any more"""
+    sources = chunk_sources(metadata)
+    sources.pop(document_id, None)
+    if not sources:
+        return None
+    return _flatten_sources(metadata, sources)
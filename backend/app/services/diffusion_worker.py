@@ -0,0 +1,701 @@
+"""
+Local Stable Diffusion inference worker
+
+The pipeline is loaded once in a dedicated process that consumes a bounded job
+queue, so image generation never blocks the event loop. Concurrent jobs with the
+same size, steps, guidance and scheduler are denoised together in one batched
+forward pass.
+Results come back through asyncio futures; when the queue is full, callers get
+WorkerBusyError. Jobs can stream low-resolution latent previews while denoising
+and can be cancelled between steps.
+
+On CPU an optional lean mode trades some latency for memory: attention and VAE
+slicing, VAE tiling, a bfloat16 or dynamically int8-quantized UNet, and no
+safety checker. The worker reports its peak RSS so more workers can be packed
+per node.
+"""
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import io
+import logging
+import math
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+SCHEDULERS = {
+    "dpm": "DPMSolverMultistepScheduler",
+    "euler_a": "EulerAncestralDiscreteScheduler",
+}
+
+# Linear approximation of the SD 1.x VAE decoder: latent channels -> RGB in [-1, 1]
+LATENT_RGB_FACTORS = [
+    [0.298, 0.207, 0.208],
+    [0.187, 0.286, 0.173],
+    [-0.158, 0.189, 0.264],
+    [-0.184, -0.271, -0.473],
+]
+
+UNET_PRECISIONS = ("float32", "bfloat16", "int8")
+
+# Worker process state for optional final-image upscaling
+_upscaler_model = ""
+_upscaler = None
+
+
+class WorkerBusyError(Exception):
+    """Raised when the diffusion job queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Image generation queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class WorkerUnavailableError(Exception):
+    """Raised when the diffusion worker failed to load or died"""
+
+
+class JobCancelledError(Exception):
+    """Raised when a diffusion job was cancelled before it finished"""
+
+
+class _BatchCancelled(Exception):
+    """Aborts a pipeline call from the step callback once every job in it is cancelled"""
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process in MiB"""
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def load_pipeline(
+    model_id: str,
+    lean: bool = False,
+    unet_precision: str = "float32",
+    safety_checker: bool = True
+):
+    """Load the Stable Diffusion pipeline on the best available device
+
+    ``lean`` enables attention slicing, VAE slicing and tiling. On CPU,
+    ``unet_precision`` "bfloat16" loads the pipeline in bfloat16 and "int8"
+    dynamically quantizes the UNet's linear layers.
+    """
+    import torch
+    from diffusers import StableDiffusionPipeline
+
+    if unet_precision not in UNET_PRECISIONS:
+        raise ValueError(f"Unknown UNet precision {unet_precision!r}, expected one of {UNET_PRECISIONS}")
+
+    if torch.cuda.is_available():
+        device = "cuda"
+        dtype = torch.float16
+    else:
+        device = "cpu"
+        dtype = torch.bfloat16 if unet_precision == "bfloat16" else torch.float32
+
+    kwargs = {"torch_dtype": dtype, "low_cpu_mem_usage": True}
+    if not safety_checker:
+        kwargs.update(safety_checker=None, requires_safety_checker=False)
+    pipeline = StableDiffusionPipeline.from_pretrained(model_id, **kwargs)
+    pipeline = pipeline.to(device)
+
+    if device == "cpu" and unet_precision == "int8":
+        pipeline.unet = quantize_unet(pipeline.unet)
+    if lean:
+        pipeline.enable_attention_slicing()
+        pipeline.enable_vae_slicing()
+        pipeline.enable_vae_tiling()
+
+    pipeline.default_scheduler = pipeline.scheduler
+    pipeline.schedulers = {}
+    return pipeline, device
+
+
+def _plain_linear(module):
+    """Copy of a LoRA-compatible linear layer as a torch.nn.Linear sharing its weights"""
+    import torch
+    linear = torch.nn.Linear(module.in_features, module.out_features, bias=module.bias is not None, device="meta")
+    linear.weight = module.weight
+    linear.bias = module.bias
+    return linear
+
+
+def quantized_layer_count(model) -> int:
+    """Number of dynamically int8-quantized linear layers in a model"""
+    import torch
+    return sum(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in model.modules())
+
+
+def quantize_unet(unet):
+    """Dynamically quantize the UNet's linear layers to int8
+
+    Attention and feed-forward projections dominate the UNet; convolutions
+    stay float32. quantize_dynamic only matches exact types, and diffusers
+    builds these projections as LoRACompatibleLinear, so layers without a
+    LoRA attached are swapped for plain torch.nn.Linear first.
+    """
+    import torch
+    try:
+        from diffusers.models.lora import LoRACompatibleLinear
+    except ImportError:
+        # Newer diffusers use torch.nn.Linear directly
+        LoRACompatibleLinear = None
+
+    if LoRACompatibleLinear is not None:
+        for parent in list(unet.modules()):
+            for name, child in list(parent.named_children()):
+                if isinstance(child, LoRACompatibleLinear) and getattr(child, "lora_layer", None) is None:
+                    setattr(parent, name, _plain_linear(child))
+
+    unet = torch.ao.quantization.quantize_dynamic(unet, {torch.nn.Linear}, dtype=torch.qint8)
+    count = quantized_layer_count(unet)
+    if count == 0:
+        logger.warning("int8 UNet requested but no linear layers were quantized")
+    else:
+        logger.info(f"Quantized {count} UNet linear layers to int8")
+    return unet
+
+
+def _use_scheduler(pipeline, name: Optional[str]):
+    """Swap the pipeline's sampler; schedulers share the model, so this is cheap"""
+    if not name or name == "default" or name not in SCHEDULERS:
+        pipeline.scheduler = pipeline.default_scheduler
+        return
+    if name not in pipeline.schedulers:
+        import diffusers
+
+        scheduler_cls = getattr(diffusers, SCHEDULERS[name])
+        pipeline.schedulers[name] = scheduler_cls.from_config(pipeline.default_scheduler.config)
+    pipeline.scheduler = pipeline.schedulers[name]
+
+
+def _upscale(params: Dict[str, Any], images: list) -> list:
+    """Upscale final images with the latent upscaler if configured, otherwise Lanczos"""
+    global _upscaler
+    factor = params.get("upscale") or 1
+    if factor <= 1:
+        return images
+    if _upscaler_model and factor == 2:
+        if _upscaler is None:
+            import torch
+            from diffusers import StableDiffusionLatentUpscalePipeline
+
+            dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            _upscaler = StableDiffusionLatentUpscalePipeline.from_pretrained(
+                _upscaler_model, torch_dtype=dtype
+            ).to(device)
+        return [
+            _upscaler(prompt=params["prompt"], image=image, num_inference_steps=20, guidance_scale=0).images[0]
+            for image in images
+        ]
+    from PIL import Image
+
+    return [image.resize((image.width * factor, image.height * factor), Image.LANCZOS) for image in images]
+
+
+def _encode_png(image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def latents_to_preview(latents) -> bytes:
+    """Cheap JPEG preview of one latent (4 x h/8 x w/8) without running the VAE"""
+    import numpy as np
+    from PIL import Image
+
+    rgb = np.einsum("chw,cr->hwr", latents.float().cpu().numpy(), np.array(LATENT_RGB_FACTORS))
+    pixels = (((rgb + 1) / 2).clip(0, 1) * 255).astype(np.uint8)
+    image = Image.fromarray(pixels).resize((pixels.shape[1] * 2, pixels.shape[0] * 2), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=70)
+    return buffer.getvalue()
+
+
+def _batch_key(params: Dict[str, Any]) -> tuple:
+    """Jobs can share a forward pass only if these match"""
+    return (params["width"], params["height"], params["steps"], params["guidance_scale"], params.get("scheduler"))
+
+
+def _run_batch(pipeline, batch: List[Dict[str, Any]], on_step=None) -> List[List[bytes]]:
+    """Run every image of every job in one batched pipeline call, return PNG bytes per job
+
+    ``on_step(step, latents)`` is called after every denoising step and may raise to abort.
+    """
+    import torch
+
+    prompts, negative_prompts, generators = [], [], []
+    for params in batch:
+        for i in range(params["num_images"]):
+            prompts.append(params["prompt"])
+            negative_prompts.append(params.get("negative_prompt") or "")
+            generator = torch.Generator(device=pipeline.device)
+            if params.get("seed") is not None:
+                generator = generator.manual_seed(params["seed"] + i)
+            else:
+                generator.seed()
+            generators.append(generator)
+
+    step_kwargs = {}
+    if on_step is not None:
+        def callback(pipe, step, timestep, callback_kwargs):
+            on_step(step, callback_kwargs["latents"])
+            return callback_kwargs
+
+        step_kwargs = {"callback_on_step_end": callback, "callback_on_step_end_tensor_inputs": ["latents"]}
+
+    first = batch[0]
+    _use_scheduler(pipeline, first.get("scheduler"))
+    images = pipeline(
+        prompt=prompts,
+        negative_prompt=negative_prompts,
+        width=first["width"],
+        height=first["height"],
+        num_inference_steps=first["steps"],
+        guidance_scale=first["guidance_scale"],
+        generator=generators,
+        **step_kwargs
+    ).images
+
+    results, offset = [], 0
+    for params in batch:
+        job_images = _upscale(params, images[offset:offset + params["num_images"]])
+        results.append([_encode_png(image) for image in job_images])
+        offset += params["num_images"]
+    return results
+
+
+def _collect_batch(jobs, pending: deque, window: float, max_images: int):
+    """Gather compatible jobs that arrive within the collection window
+
+    Returns (batch, stop). Incompatible jobs are kept in ``pending`` for the next batch.
+    """
+    if pending:
+        first = pending.popleft()
+    else:
+        first = jobs.get()
+        if first is None:
+            return [], True
+    key = _batch_key(first[1])
+    batch, images = [first], first[1]["num_images"]
+
+    # Compatible jobs that were already waiting go first
+    for job in list(pending):
+        if images >= max_images:
+            break
+        if _batch_key(job[1]) == key and images + job[1]["num_images"] <= max_images:
+            pending.remove(job)
+            batch.append(job)
+            images += job[1]["num_images"]
+
+    deadline = time.time() + window
+    while images < max_images:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        try:
+            job = jobs.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if job is None:
+            return batch, True
+        if _batch_key(job[1]) == key and images + job[1]["num_images"] <= max_images:
+            batch.append(job)
+            images += job[1]["num_images"]
+        else:
+            pending.append(job)
+    return batch, False
+
+
+def _drain(cancels, cancelled: set):
+    """Collect cancellation requests sent by the parent"""
+    while True:
+        try:
+            cancelled.add(cancels.get_nowait())
+        except queue.Empty:
+            return
+
+
+def _step_callback(batch: list, results, cancels, cancelled: set):
+    """Send latent previews for jobs that asked for them and abort fully cancelled batches"""
+    offsets, offset = [], 0
+    for _, params, _ in batch:
+        offsets.append(offset)
+        offset += params["num_images"]
+
+    def on_step(step: int, latents):
+        _drain(cancels, cancelled)
+        if all(job_id in cancelled for job_id, _, _ in batch):
+            raise _BatchCancelled()
+        for (job_id, params, _), start in zip(batch, offsets):
+            every = params.get("preview_every") or 0
+            if every and job_id not in cancelled and (step + 1) % every == 0 and step + 1 < params["steps"]:
+                results.put(("preview", job_id, {
+                    "step": step + 1,
+                    "steps": params["steps"],
+                    "image": latents_to_preview(latents[start])
+                }))
+
+    return on_step
+
+
+def _worker_main(
+    model_id: str,
+    jobs,
+    results,
+    cancels,
+    batch_window: float,
+    max_batch_images: int,
+    upscaler_model: str,
+    pipeline_options: Dict[str, Any]
+):
+    """Worker process entry point: load the pipeline once, then serve micro-batches of jobs"""
+    global _upscaler_model
+    _upscaler_model = upscaler_model
+    started = time.time()
+    try:
+        pipeline, device = load_pipeline(model_id, **pipeline_options)
+    except Exception as e:
+        results.put(("failed", None, {"error": str(e)}))
+        return
+    results.put(("ready", None, {
+        "device": device,
+        "load_seconds": time.time() - started,
+        "peak_rss_mb": peak_rss_mb()
+    }))
+
+    pending = deque()
+    cancelled = set()
+    stop = False
+    while not stop or pending:
+        batch, stop_requested = _collect_batch(jobs, pending, batch_window, max_batch_images)
+        stop = stop or stop_requested
+
+        # Skip jobs cancelled while they waited in the queue
+        _drain(cancels, cancelled)
+        for job in [job for job in batch if job[0] in cancelled]:
+            batch.remove(job)
+            cancelled.discard(job[0])
+            results.put(("cancelled", job[0], {}))
+        if not batch:
+            continue
+
+        started = time.time()
+        try:
+            outputs = _run_batch(
+                pipeline,
+                [params for _, params, _ in batch],
+                on_step=_step_callback(batch, results, cancels, cancelled)
+            )
+        except _BatchCancelled:
+            for job_id, _, _ in batch:
+                cancelled.discard(job_id)
+                results.put(("cancelled", job_id, {}))
+            continue
+        except Exception as e:
+            for job_id, _, _ in batch:
+                results.put(("error", job_id, {"error": str(e)}))
+            continue
+        inference_seconds = time.time() - started
+        results.put(("batch", None, {
+            "jobs": len(batch),
+            "images": sum(len(images) for images in outputs),
+            "inference_seconds": inference_seconds,
+            "peak_rss_mb": peak_rss_mb()
+        }))
+        for (job_id, params, enqueued_at), images in zip(batch, outputs):
+            if job_id in cancelled:
+                cancelled.discard(job_id)
+                results.put(("cancelled", job_id, {}))
+                continue
+            results.put(("done", job_id, {
+                "images": images,
+                "queue_seconds": started - enqueued_at,
+                "inference_seconds": inference_seconds,
+                "batch_size": len(batch)
+            }))
+
+
+class DiffusionWorker:
+    """Parent-side handle for the inference worker process"""
+
+    def __init__(
+        self,
+        model_id: str,
+        max_queue_size: int = 8,
+        job_timeout: float = 900.0,
+        batch_window_ms: int = 50,
+        max_batch_images: int = 4,
+        upscaler_model: str = "",
+        pipeline_options: Optional[Dict[str, Any]] = None
+    ):
+        self.model_id = model_id
+        self.max_queue_size = max_queue_size
+        self.job_timeout = job_timeout
+        self.batch_window_ms = batch_window_ms
+        self.max_batch_images = max_batch_images
+        self.upscaler_model = upscaler_model
+        self.pipeline_options = pipeline_options or {}
+        self._context = multiprocessing.get_context("spawn")
+        self._jobs = None
+        self._results = None
+        self._cancels = None
+        self._process = None
+        self._listener: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._preview_handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+        self._lock = threading.Lock()
+        self.ready = threading.Event()
+        self.error: Optional[str] = None
+        self.device: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.load_peak_rss_mb: Optional[float] = None
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "cancelled": 0,
+            "last_queue_seconds": None,
+            "last_inference_seconds": None,
+            "last_batch_size": None,
+            "batches": 0,
+            "batched_images": 0,
+            "total_inference_seconds": 0.0,
+            "peak_rss_mb": None
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def start(self):
+        """Spawn the worker process; the pipeline loads there, off the event loop"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._jobs = self._context.Queue(maxsize=self.max_queue_size)
+        self._results = self._context.Queue()
+        self._cancels = self._context.Queue()
+        self.ready.clear()
+        self.error = None
+        self._process = self._context.Process(
+            target=_worker_main,
+            args=(
+                self.model_id,
+                self._jobs,
+                self._results,
+                self._cancels,
+                self.batch_window_ms / 1000,
+                self.max_batch_images,
+                self.upscaler_model,
+                self.pipeline_options
+            ),
+            name="diffusion-worker",
+            daemon=True
+        )
+        self._process.start()
+        self._listener = threading.Thread(target=self._listen, name="diffusion-results", daemon=True)
+        self._listener.start()
+        logger.info(f"Diffusion worker started (pid {self._process.pid}), loading {self.model_id}")
+
+    def _listen(self):
+        """Resolve job futures from worker results"""
+        while True:
+            try:
+                kind, job_id, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if self._process is None or not self._process.is_alive():
+                    if not self.ready.is_set():
+                        # Died while loading; restarting would just crash again
+                        self.error = "Diffusion worker exited before loading the pipeline"
+                    self._fail_all("Diffusion worker exited")
+                    return
+                continue
+            except (EOFError, OSError):
+                self._fail_all("Diffusion worker connection lost")
+                return
+
+            if kind == "ready":
+                self.device = payload["device"]
+                self.load_seconds = payload["load_seconds"]
+                self.load_peak_rss_mb = payload["peak_rss_mb"]
+                with self._lock:
+                    self._stats["peak_rss_mb"] = payload["peak_rss_mb"]
+                self.ready.set()
+                logger.info(
+                    f"Diffusion pipeline loaded on {self.device} in {self.load_seconds:.1f}s "
+                    f"(peak RSS {self.load_peak_rss_mb} MiB)"
+                )
+            elif kind == "failed":
+                self.error = payload["error"]
+                logger.error(f"Diffusion worker failed to load pipeline: {self.error}")
+                self._fail_all(self.error)
+                return
+            elif kind == "done":
+                with self._lock:
+                    self._stats["completed"] += 1
+                    self._stats["last_queue_seconds"] = payload["queue_seconds"]
+                    self._stats["last_inference_seconds"] = payload["inference_seconds"]
+                    self._stats["last_batch_size"] = payload["batch_size"]
+                self._resolve(job_id, result=payload)
+            elif kind == "batch":
+                with self._lock:
+                    self._stats["batches"] += 1
+                    self._stats["batched_images"] += payload["images"]
+                    self._stats["total_inference_seconds"] += payload["inference_seconds"]
+                    self._stats["peak_rss_mb"] = payload["peak_rss_mb"]
+            elif kind == "preview":
+                handler = self._preview_handlers.get(job_id)
+                if handler is not None:
+                    self._loop.call_soon_threadsafe(handler, payload)
+            elif kind == "cancelled":
+                self._resolve(job_id, error=JobCancelledError(f"Job {job_id} was cancelled"))
+            elif kind == "error":
+                with self._lock:
+                    self._stats["failed"] += 1
+                self._resolve(job_id, error=Exception(payload["error"]))
+
+    def _resolve(self, job_id: str, result: Any = None, error: Optional[Exception] = None):
+        with self._lock:
+            future = self._futures.pop(job_id, None)
+        if future is None:
+            return
+
+        def settle():
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        self._loop.call_soon_threadsafe(settle)
+
+    def _fail_all(self, message: str):
+        with self._lock:
+            job_ids = list(self._futures)
+        for job_id in job_ids:
+            self._resolve(job_id, error=WorkerUnavailableError(message))
+
+    def _retry_after(self) -> int:
+        """Estimate when a queue slot frees up"""
+        with self._lock:
+            batches = self._stats["batches"]
+            average = self._stats["total_inference_seconds"] / batches if batches else 60.0
+        return max(1, math.ceil(average))
+
+    async def submit(
+        self,
+        params: Dict[str, Any],
+        job_id: Optional[str] = None,
+        on_preview: Optional[Callable[[Dict[str, Any]], None]] = None,
+        preview_every: int = 0
+    ) -> Dict[str, Any]:
+        """Queue a generation job and wait for its PNG images
+
+        ``on_preview`` receives latent previews every ``preview_every`` steps on the event loop.
+        """
+        if self.error is not None:
+            raise WorkerUnavailableError(self.error)
+        if not self.running:
+            self.start()
+
+        job_id = job_id or uuid.uuid4().hex
+        if on_preview is not None and preview_every > 0:
+            params = {**params, "preview_every": preview_every}
+        future = self._loop.create_future()
+        with self._lock:
+            full = len(self._futures) >= self.max_queue_size
+            if full:
+                self._stats["rejected"] += 1
+            else:
+                self._futures[job_id] = future
+                self._stats["submitted"] += 1
+                if on_preview is not None:
+                    self._preview_handlers[job_id] = on_preview
+        if full:
+            raise WorkerBusyError(self._retry_after())
+        try:
+            self._jobs.put_nowait((job_id, params, time.time()))
+        except queue.Full:
+            with self._lock:
+                self._futures.pop(job_id, None)
+                self._preview_handlers.pop(job_id, None)
+                self._stats["rejected"] += 1
+            raise WorkerBusyError(self._retry_after())
+        if not self.running:
+            with self._lock:
+                self._futures.pop(job_id, None)
+                self._preview_handlers.pop(job_id, None)
+            raise WorkerUnavailableError(self.error or "Diffusion worker exited")
+
+        try:
+            return await asyncio.wait_for(future, timeout=self.job_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # Nobody is waiting for the images any more, so free the worker
+            self._cancels.put(job_id)
+            raise
+        finally:
+            self._preview_handlers.pop(job_id, None)
+            with self._lock:
+                self._futures.pop(job_id, None)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; the worker drops it at the next step"""
+        with self._lock:
+            if job_id not in self._futures:
+                return False
+            self._stats["cancelled"] += 1
+        self._cancels.put(job_id)
+        self._resolve(job_id, error=JobCancelledError(f"Job {job_id} was cancelled"))
+        return True
+
+    async def stop(self):
+        """Ask the worker to exit after its current job"""
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        try:
+            self._jobs.put_nowait(None)
+        except queue.Full:
+            pass
+        await asyncio.to_thread(process.join, 10)
+        if process.is_alive():
+            process.terminate()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get queue depth and job timing"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._futures)
+        batches = stats["batches"]
+        seconds = stats["total_inference_seconds"]
+        stats["avg_batch_seconds"] = seconds / batches if batches else None
+        stats["images_per_minute"] = stats["batched_images"] * 60 / seconds if seconds else None
+        return {
+            "running": self.running,
+            "ready": self.ready.is_set(),
+            "device": self.device,
+            "load_seconds": self.load_seconds,
+            "load_peak_rss_mb": self.load_peak_rss_mb,
+            "pipeline_options": self.pipeline_options,
+            "max_queue_size": self.max_queue_size,
+            "error": self.error,
+            **stats
+        }
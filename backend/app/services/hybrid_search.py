@@ -0,0 +1,194 @@
+"""
+Hybrid lexical (BM25) + dense retrieval helpers for the RAG pipeline
+"""
+from langchain.schema import Document
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Optional, Set, Tuple, Iterable
+import asyncio
+import logging
+import math
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Metadata fields that are unique per chunk or not filterable, so not worth indexing
+UNINDEXED_FIELDS = {"chunk_id", "sources"}
+
+# Keeps hashtags, mentions and SKU-like tokens (e.g. "#summer", "AB-1234") intact
+TOKEN_PATTERN = re.compile(r"[#@]?\w+(?:[-_./]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokenize text for lexical matching"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        # Also index the bare parts so "#summer" matches "summer" and "AB-1234" matches "1234"
+        parts = re.findall(r"\w+", token)
+        if len(parts) > 1 or (parts and parts[0] != token):
+            tokens.extend(parts)
+    return tokens
+
+
+def _field_values(value: Any) -> List[Any]:
+    """Normalize a metadata or filter value into a list of hashable values"""
+    values = value if isinstance(value, (list, tuple, set)) else [value]
+    return [v for v in values if isinstance(v, (str, int, float, bool))]
+
+
+class BM25Index:
+    """Incremental in-memory inverted index with BM25 scoring and metadata filters"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._doc_lengths: Dict[str, int] = {}
+        self._documents: Dict[str, Document] = {}
+        self._fields: Dict[Tuple[str, Any], Set[str]] = defaultdict(set)
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, doc_id: str, document: Document):
+        """Add or replace a chunk in the index"""
+        term_counts = Counter(tokenize(document.page_content))
+        with self._lock:
+            if doc_id in self._documents:
+                self._remove_locked(doc_id)
+            for term, count in term_counts.items():
+                self._postings[term][doc_id] = count
+            length = sum(term_counts.values())
+            self._doc_lengths[doc_id] = length
+            self._total_length += length
+            self._documents[doc_id] = document
+            for key, value in document.metadata.items():
+                if key not in UNINDEXED_FIELDS:
+                    for v in _field_values(value):
+                        self._fields[(key, v)].add(doc_id)
+
+    def add_many(self, items: Iterable[Tuple[str, Document]]):
+        """Add several chunks to the index"""
+        for doc_id, document in items:
+            self.add(doc_id, document)
+
+    def remove(self, doc_id: str) -> bool:
+        """Remove a chunk from the index"""
+        with self._lock:
+            if doc_id not in self._documents:
+                return False
+            self._remove_locked(doc_id)
+            return True
+
+    def _remove_locked(self, doc_id: str):
+        document = self._documents.pop(doc_id)
+        for term in set(tokenize(document.page_content)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id, 0)
+        for key, value in document.metadata.items():
+            for v in _field_values(value):
+                matches = self._fields.get((key, v))
+                if matches is not None:
+                    matches.discard(doc_id)
+                    if not matches:
+                        del self._fields[(key, v)]
+
+    def get(self, doc_id: str) -> Optional[Document]:
+        """Get an indexed chunk by id"""
+        return self._documents.get(doc_id)
+
+    def match(self, filters: Dict[str, Any]) -> Set[str]:
+        """Get the ids of chunks whose metadata matches every filter (lists match any value)"""
+        with self._lock:
+            result: Optional[Set[str]] = None
+            for key, value in filters.items():
+                matches: Set[str] = set()
+                for v in _field_values(value):
+                    matches |= self._fields.get((key, v), set())
+                result = matches if result is None else result & matches
+                if not result:
+                    return set()
+            return set(self._documents) if result is None else result
+
+    def chunk_ids_for_document(self, document_id: str) -> List[str]:
+        """Get the ids of all indexed chunks belonging to a document"""
+        return list(self.match({"document_id": document_id}))
+
+    def search(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Return the top-k chunk ids ranked by BM25 score, restricted to matching metadata"""
+        terms = set(tokenize(query))
+        with self._lock:
+            num_docs = len(self._documents)
+            if not num_docs or not terms:
+                return []
+            allowed = self.match(filters) if filters else None
+            if allowed is not None and not allowed:
+                return []
+            avg_length = self._total_length / num_docs
+            scores: Dict[str, float] = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse several ranked id lists with reciprocal rank fusion"""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class CrossEncoderReranker:
+    """Local cross-encoder reranker running in a worker pool"""
+
+    def __init__(self, model_name: str, max_workers: int = 2):
+        self.model_name = model_name
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-rerank")
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    def _get_model(self):
+        """Load the cross-encoder on first use"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name)
+                    logger.info(f"Cross-encoder reranker loaded: {self.model_name}")
+        return self._model
+
+    def _score(self, query: str, texts: List[str]) -> List[float]:
+        model = self._get_model()
+        return [float(score) for score in model.predict([(query, text) for text in texts])]
+
+    async def rerank(self, query: str, documents: List[Document], top_k: int) -> List[Tuple[Document, float]]:
+        """Rerank candidate chunks against the query"""
+        if not documents:
+            return []
+        loop = asyncio.get_running_loop()
+        scores = await loop.run_in_executor(
+            self.executor,
+            self._score,
+            query,
+            [doc.page_content for doc in documents]
+        )
+        ranked = sorted(zip(documents, scores), key=lambda item: item[1], reverse=True)
+        return ranked[:top_k]
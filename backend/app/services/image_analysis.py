@@ -0,0 +1,225 @@
+"""
+Image analysis with OpenCV and Tesseract
+
+Computes dominant colors, exposure, sharpness, OCR text coverage, faces and
+the most salient region. Decoding and analysis run in a process pool, and
+results are cached by the sha256 of the image bytes.
+"""
+from app.core.config import settings
+from app.core.http_client import read_limited, stream_public_url
+from app.services.image_store import image_store
+from app.services.rag_cache import RetrievalCache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger(__name__)
+
+# Laplacian variance below this reads as blurry at the analysis resolution
+BLUR_THRESHOLD = 100.0
+ANALYSIS_MAX_SIDE = 1024
+
+# Face detector loaded once per worker process
+_face_cascade = None
+
+
+def _init_worker():
+    """Load detectors in a worker process"""
+    global _face_cascade
+    import cv2
+    cv2.setNumThreads(1)
+    _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+
+
+def _dominant_colors(image, k: int = 5) -> List[Dict[str, Any]]:
+    import cv2
+    import numpy as np
+
+    pixels = cv2.resize(image, (64, 64), interpolation=cv2.INTER_AREA).reshape(-1, 3).astype(np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
+    _, labels, centers = cv2.kmeans(pixels, k, None, criteria, 3, cv2.KMEANS_PP_CENTERS)
+    counts = np.bincount(labels.flatten(), minlength=k)
+    colors = []
+    for index in np.argsort(-counts):
+        b, g, r = (int(c) for c in centers[index])
+        colors.append({"hex": f"#{r:02x}{g:02x}{b:02x}", "share": round(float(counts[index]) / len(labels), 3)})
+    return colors
+
+
+def _salient_region(gray) -> Dict[str, int]:
+    """Bounding box of the most salient area using the spectral residual method"""
+    import cv2
+    import numpy as np
+
+    small = cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA).astype(np.float32)
+    spectrum = np.fft.fft2(small)
+    log_amplitude = np.log(np.abs(spectrum) + 1e-8)
+    residual = log_amplitude - cv2.blur(log_amplitude, (3, 3))
+    saliency = np.abs(np.fft.ifft2(np.exp(residual + 1j * np.angle(spectrum)))) ** 2
+    saliency = cv2.GaussianBlur(saliency, (9, 9), 2.5)
+
+    mask = saliency >= np.percentile(saliency, 90)
+    ys, xs = np.nonzero(mask)
+    scale_x, scale_y = gray.shape[1] / 64, gray.shape[0] / 64
+    x0, y0 = int(xs.min() * scale_x), int(ys.min() * scale_y)
+    x1, y1 = int((xs.max() + 1) * scale_x), int((ys.max() + 1) * scale_y)
+    return {"x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0}
+
+
+def _text_coverage(image) -> Dict[str, Any]:
+    import pytesseract
+
+    try:
+        data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    except pytesseract.TesseractNotFoundError:
+        return {"error": "tesseract is not installed"}
+    area = 0
+    words = []
+    for text, conf, width, height in zip(data["text"], data["conf"], data["width"], data["height"]):
+        if text.strip() and float(conf) >= 60:
+            words.append(text.strip())
+            area += width * height
+    return {
+        "coverage": round(area / (image.shape[0] * image.shape[1]), 4),
+        "words": len(words),
+        "text": " ".join(words)[:500]
+    }
+
+
+def analyze_bytes(data: bytes) -> Dict[str, Any]:
+    """Analyze one encoded image in a worker process"""
+    import cv2
+    import numpy as np
+
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Unsupported or corrupt image")
+    height, width = image.shape[:2]
+    scale = min(1.0, ANALYSIS_MAX_SIDE / max(height, width))
+    if scale < 1.0:
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    faces = []
+    if _face_cascade is not None:
+        faces = _face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(32, 32))
+    return {
+        "width": width,
+        "height": height,
+        "dominant_colors": _dominant_colors(image),
+        "brightness": round(float(gray.mean()) / 255, 3),
+        "contrast": round(float(gray.std()) / 255, 3),
+        "sharpness": round(sharpness, 1),
+        "is_blurry": sharpness < BLUR_THRESHOLD,
+        "text": _text_coverage(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)),
+        "faces": [
+            {"x": int(x / scale), "y": int(y / scale), "width": int(w / scale), "height": int(h / scale)}
+            for x, y, w, h in faces
+        ],
+        "salient_region": {key: int(value / scale) for key, value in _salient_region(gray).items()}
+    }
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class ImageAnalysisService:
+    """Batched image analysis on a process pool with a content-hash cache"""
+
+    def __init__(
+        self,
+        workers: int = 2,
+        cache_entries: int = 1024,
+        cache_ttl_seconds: float = 86400,
+        max_bytes: int = 20 * 1024 * 1024
+    ):
+        self.workers = max(workers, 1)
+        self.max_bytes = max_bytes
+        self.cache = RetrievalCache(max_entries=cache_entries, ttl_seconds=cache_ttl_seconds)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+        return self._pool
+
+    async def _read(self, source: str) -> bytes:
+        """Read image bytes from an http(s) URL or the local image store"""
+        if source.startswith(("http://", "https://")):
+            async with stream_public_url("GET", source) as response:
+                response.raise_for_status()
+                return await read_limited(response, self.max_bytes)
+
+        filename = image_store.filename_from_url(source)
+        path = image_store.path_for(filename) if filename else source
+        # Only files inside the image store may be read from disk
+        root = os.path.realpath(image_store.root)
+        if os.path.commonpath([root, os.path.realpath(path)]) != root:
+            raise ValueError("Local images must be inside the image store")
+        return await asyncio.to_thread(_read_file, path)
+
+    async def analyze(self, source: str) -> Dict[str, Any]:
+        """Analyze one image URL or stored path"""
+        data = await self._read(source)
+        content_hash = hashlib.sha256(data).hexdigest()
+        cached = self.cache.get(content_hash)
+        if cached is not None:
+            return {"image": source, "content_hash": content_hash, "cached": True, **cached}
+
+        # The same content already being analyzed, e.g. twice in one batch, runs once
+        pending = self._inflight.get(content_hash)
+        if pending is None:
+            pending = asyncio.ensure_future(self._run(content_hash, data))
+            self._inflight[content_hash] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(content_hash, None))
+        result = await asyncio.shield(pending)
+        return {"image": source, "content_hash": content_hash, "cached": False, **result}
+
+    async def _run(self, content_hash: str, data: bytes) -> Dict[str, Any]:
+        generation = self.cache.generation
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._get_pool(), analyze_bytes, data)
+        except BrokenProcessPool:
+            # A worker crashed; start a fresh pool for the next request
+            self.close()
+            raise
+        self.cache.set(content_hash, result, generation)
+        return result
+
+    async def analyze_batch(self, sources: List[str]) -> List[Dict[str, Any]]:
+        """Analyze many images concurrently; failures are reported per image"""
+        async def run(source: str) -> Dict[str, Any]:
+            try:
+                return await self.analyze(source)
+            except Exception as e:
+                logger.warning(f"Error analyzing {source}: {e}")
+                return {"image": source, "error": str(e)}
+
+        return list(await asyncio.gather(*(run(source) for source in sources)))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Global instance
+image_analysis_service = ImageAnalysisService(
+    workers=settings.IMAGE_ANALYSIS_WORKERS,
+    cache_entries=settings.IMAGE_ANALYSIS_CACHE_ENTRIES,
+    max_bytes=settings.IMAGE_ANALYSIS_MAX_BYTES
+)
@@ -1,154 +1,225 @@
 """
 Service for image generation using Stable Diffusion
 """
-from diffusers import StableDiffusionPipeline
-import torch
-from PIL import Image
-import io
-import base64
-import httpx
 from app.core.config import settings
-from app.models.schemas import ImageGenerationRequest, ImageGenerationResponse
-from typing import List
+from app.services.sd_backends import create_backend_pool
+from app.services.diffusion_worker import DiffusionWorker, WorkerUnavailableError
+from app.services.image_store import image_store, make_generation_key
+from app.services.image_renditions import create_renditions
+from app.models.schemas import ImageGenerationRequest, ImageGenerationResponse, ImageQuality
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
 import logging
-import os
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Steps, sampler and render scale per quality tier; DPM-Solver++ converges in far fewer steps than PNDM
+QUALITY_PRESETS = {
+    ImageQuality.PREVIEW: {"steps": 12, "scheduler": "dpm", "guidance_scale": 7.0, "scale": 0.5},
+    ImageQuality.STANDARD: {"steps": 25, "scheduler": "dpm", "guidance_scale": 7.5, "scale": 1.0},
+    ImageQuality.FINAL: {"steps": 50, "scheduler": "default", "guidance_scale": 7.5, "scale": 1.0},
+}
+
 
 class ImageGeneratorService:
     """Service for generating images"""
     
     def __init__(self):
-        self.pipeline = None
         self.use_api = False
-        self.api_url = settings.STABLE_DIFFUSION_API_URL
+        self.backend_pool = create_backend_pool()
+        self.worker = DiffusionWorker(
+            settings.LOCAL_DIFFUSION_MODEL,
+            max_queue_size=settings.LOCAL_DIFFUSION_QUEUE_SIZE,
+            job_timeout=settings.LOCAL_DIFFUSION_JOB_TIMEOUT,
+            batch_window_ms=settings.LOCAL_DIFFUSION_BATCH_WINDOW_MS,
+            max_batch_images=settings.LOCAL_DIFFUSION_MAX_BATCH_IMAGES,
+            upscaler_model=settings.LOCAL_DIFFUSION_UPSCALER_MODEL,
+            pipeline_options={
+                "lean": settings.LOCAL_DIFFUSION_LEAN,
+                "unet_precision": settings.LOCAL_DIFFUSION_UNET_PRECISION,
+                "safety_checker": settings.LOCAL_DIFFUSION_SAFETY_CHECKER
+            }
+        )
+        self.image_store = image_store
     
-    def _initialize_pipeline(self):
-        """Initialize Stable Diffusion pipeline"""
-        try:
-            if torch.cuda.is_available():
-                device = "cuda"
-                dtype = torch.float16
-            else:
-                device = "cpu"
-                dtype = torch.float32
-            
-            self.pipeline = StableDiffusionPipeline.from_pretrained(
-                "runwayml/stable-diffusion-v1-5",
-                torch_dtype=dtype
-            )
-            self.pipeline = self.pipeline.to(device)
-            logger.info(f"Stable Diffusion pipeline initialized on {device}")
-        except Exception as e:
-            logger.error(f"Error initializing pipeline: {e}")
-            logger.info("Falling back to API-based generation")
-            self.use_api = True
+    def _generation_params(self, request: ImageGenerationRequest) -> Dict[str, Any]:
+        """Parameters that determine the generated images"""
+        preset = QUALITY_PRESETS[request.quality]
+        # Stable Diffusion needs dimensions divisible by 8
+        width = max(256, int(request.width * preset["scale"]) // 8 * 8)
+        height = max(256, int(request.height * preset["scale"]) // 8 * 8)
+        return {
+            "prompt": request.prompt,
+            "negative_prompt": request.negative_prompt,
+            "style": request.style,
+            "width": width,
+            "height": height,
+            "num_images": request.num_images,
+            "steps": preset["steps"],
+            "guidance_scale": preset["guidance_scale"],
+            "scheduler": preset["scheduler"],
+            "upscale": settings.IMAGE_FINAL_UPSCALE if request.quality == ImageQuality.FINAL else 1,
+            "seed": request.seed
+        }
+    
+    def _response_metadata(self, request: ImageGenerationRequest, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "width": params["width"] * params["upscale"],
+            "height": params["height"] * params["upscale"],
+            "quality": request.quality.value,
+            "steps": params["steps"],
+            "scheduler": params["scheduler"],
+            "generated_at": datetime.utcnow().isoformat()
+        }
     
-    async def generate_image(self, request: ImageGenerationRequest) -> ImageGenerationResponse:
-        """Generate image from prompt"""
+    async def generate_image(
+        self,
+        request: ImageGenerationRequest,
+        job_id: Optional[str] = None,
+        on_preview: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> ImageGenerationResponse:
+        """Generate image from prompt, reusing stored images for repeated parameters
+
+        Local generation sends latent previews to ``on_preview`` and can be cancelled by ``job_id``.
+        """
         try:
-            if self.use_api or self.api_url:
-                return await self._generate_via_api(request)
+            params = self._generation_params(request)
+            cache_key = make_generation_key(params)
+            if settings.IMAGE_CACHE_ENABLED:
+                cached = await asyncio.to_thread(self.image_store.get_generation, cache_key)
+                if cached:
+                    return ImageGenerationResponse(
+                        image_urls=cached,
+                        prompt=request.prompt,
+                        metadata={**self._response_metadata(request, params), "cached": True}
+                    )
+            
+            if self.use_api or self.backend_pool.backends:
+                response = await self._generate_via_api(request, params, job_id, on_preview)
             else:
-                return await self._generate_locally(request)
+                response = await self._generate_locally(request, params, job_id, on_preview)
+            
+            if settings.IMAGE_CACHE_ENABLED and response.image_urls:
+                await asyncio.to_thread(self.image_store.set_generation, cache_key, response.image_urls)
+            return response
         except Exception as e:
             logger.error(f"Error generating image: {e}")
             raise
     
-    async def _generate_via_api(self, request: ImageGenerationRequest) -> ImageGenerationResponse:
+    async def _generate_via_api(
+        self,
+        request: ImageGenerationRequest,
+        params: Dict[str, Any],
+        job_id: Optional[str] = None,
+        on_preview: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> ImageGenerationResponse:
         """Generate image via API"""
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                payload = {
-                    "prompt": request.prompt,
-                    "negative_prompt": request.negative_prompt or "",
-                    "width": request.width,
-                    "height": request.height,
-                    "num_images": request.num_images,
-                    "steps": 50,
-                    "guidance_scale": 7.5
-                }
-                
-                response = await client.post(
-                    f"{self.api_url}/api/v1/generate",
-                    json=payload
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                image_urls = result.get("images", [])
-                
-                return ImageGenerationResponse(
-                    image_urls=image_urls,
-                    prompt=request.prompt,
-                    metadata={
-                        "width": request.width,
-                        "height": request.height,
-                        "generated_at": datetime.utcnow().isoformat()
-                    }
-                )
+            payload = {
+                "prompt": params["prompt"],
+                "negative_prompt": params["negative_prompt"] or "",
+                "width": params["width"],
+                "height": params["height"],
+                "num_images": params["num_images"],
+                "steps": params["steps"],
+                "guidance_scale": params["guidance_scale"],
+                "scheduler": params["scheduler"],
+                "upscale": params["upscale"],
+                "seed": params["seed"]
+            }
+            
+            # Retries on other backends before giving up
+            result = await self.backend_pool.post("/api/v1/generate", payload)
+            image_urls = result.get("images", [])
+            
+            return ImageGenerationResponse(
+                image_urls=image_urls,
+                prompt=request.prompt,
+                metadata=self._response_metadata(request, params)
+            )
         except Exception as e:
             logger.error(f"Error generating image via API: {e}")
-            # Fallback to local generation if API fails
+            # Fallback to local generation once every backend has failed
             if not self.use_api:
-                return await self._generate_locally(request)
+                return await self._generate_locally(request, params, job_id, on_preview)
             raise
     
-    async def _generate_locally(self, request: ImageGenerationRequest) -> ImageGenerationResponse:
-        """Generate image locally"""
+    async def _generate_locally(
+        self,
+        request: ImageGenerationRequest,
+        params: Dict[str, Any],
+        job_id: Optional[str] = None,
+        on_preview: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> ImageGenerationResponse:
+        """Generate image locally in the diffusion worker process"""
         try:
-            if self.pipeline is None:
-                self._initialize_pipeline()
-            
-            if self.pipeline is None:
-                raise Exception("Pipeline not initialized and API not available")
+            if not settings.LOCAL_DIFFUSION_ENABLED:
+                raise WorkerUnavailableError("Local diffusion is disabled and no Stable Diffusion API backend succeeded")
+            result = await self.worker.submit(
+                params,
+                job_id=job_id,
+                on_preview=on_preview,
+                preview_every=settings.LOCAL_DIFFUSION_PREVIEW_STEPS
+            )
             
             images = []
-            for _ in range(request.num_images):
-                image = self.pipeline(
-                    prompt=request.prompt,
-                    negative_prompt=request.negative_prompt,
-                    width=request.width,
-                    height=request.height,
-                    num_inference_steps=50,
-                    guidance_scale=7.5
-                ).images[0]
-                
+            for png in result["images"]:
                 # Save image and get URL
-                image_url = await self._save_image(image)
+                image_url = await self._save_image(png)
                 images.append(image_url)
             
+            if settings.IMAGE_RENDITIONS_ENABLED:
+                await asyncio.gather(*(create_renditions(self.image_store, url) for url in images))
+            
             return ImageGenerationResponse(
                 image_urls=images,
                 prompt=request.prompt,
                 metadata={
-                    "width": request.width,
-                    "height": request.height,
-                    "generated_at": datetime.utcnow().isoformat(),
-                    "method": "local"
+                    **self._response_metadata(request, params),
+                    "method": "local",
+                    "queue_seconds": result["queue_seconds"],
+                    "inference_seconds": result["inference_seconds"],
+                    "batch_size": result["batch_size"]
                 }
             )
         except Exception as e:
             logger.error(f"Error generating image locally: {e}")
             raise
     
-    async def _save_image(self, image: Image.Image) -> str:
-        """Save image and return URL"""
+    def start(self):
+        """Start background backend health checks and, if configured, the local worker"""
+        self.backend_pool.start()
+        if settings.LOCAL_DIFFUSION_ENABLED and settings.LOCAL_DIFFUSION_PRELOAD:
+            self.worker.start()
+    
+    async def stop(self):
+        """Stop background tasks"""
+        await self.backend_pool.stop()
+        await self.worker.stop()
+        self.image_store.close()
+    
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a local generation job"""
+        return self.worker.cancel(job_id)
+    
+    def get_backend_stats(self) -> List[dict]:
+        """Get Stable Diffusion backend pool state"""
+        return self.backend_pool.stats()
+    
+    def get_worker_stats(self) -> dict:
+        """Get local diffusion worker queue depth and job timing"""
+        return self.worker.stats()
+    
+    def get_cache_stats(self) -> dict:
+        """Get generation cache hit rate and image storage usage"""
+        return self.image_store.stats()
+    
+    async def _save_image(self, data: bytes) -> str:
+        """Save image bytes under their content hash and return URL"""
         try:
-            # Create uploads directory if it doesn't exist
-            os.makedirs("uploads/images", exist_ok=True)
-            
-            # Generate filename
-            filename = f"image_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.png"
-            filepath = f"uploads/images/{filename}"
-            
-            # Save image
-            image.save(filepath)
-            
             # Return URL (in production, this would be uploaded to cloud storage)
-            return f"/uploads/images/{filename}"
+            return await asyncio.to_thread(self.image_store.put, data)
         except Exception as e:
             logger.error(f"Error saving image: {e}")
             raise
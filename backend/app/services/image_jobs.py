@@ -0,0 +1,473 @@
+"""
+Background image generation jobs with polling, preview streaming and webhook completion
+
+Jobs are stored in the SQL database and any web worker may run them. A worker
+claims a job with a conditional update and holds a lease on it while it runs,
+so each job is generated once. A job whose worker died is claimed again once
+its lease expires. Previews are only streamed from the process running the
+job; streams elsewhere poll the job row for status changes, and cancels are
+written to the row for the owning process to pick up.
+"""
+from app.core.config import settings
+from app.core.database import get_session
+from app.core.http_client import UnsafeURLError, check_public_url, get_http_client, stream_public_url
+from app.models.schemas import (
+    ImageGenerationRequest,
+    ImageJobRequest,
+    ImageJobResponse,
+    ImageJobStatus
+)
+from app.models.tables import ImageJob
+from app.services.diffusion_worker import JobCancelledError, WorkerBusyError
+from app.services.image_generator import image_generator
+from sqlalchemy import and_, or_
+from typing import Any, AsyncIterator, Dict, Optional, Set
+from datetime import datetime, timedelta
+import asyncio
+import base64
+import httpx
+import logging
+import os
+import socket
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_ATTEMPTS = 3
+FINISHED_STATUSES = {ImageJobStatus.COMPLETED, ImageJobStatus.FAILED, ImageJobStatus.CANCELLED}
+
+
+def _to_response(job: ImageJob) -> ImageJobResponse:
+    return ImageJobResponse(
+        job_id=job.id,
+        status=job.status,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+        completed_at=job.completed_at,
+        result=job.result,
+        error=job.error
+    )
+
+
+class ImageJobService:
+    """Runs image generation requests in the background and persists their state"""
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        lease_seconds: int = 120,
+        poll_interval: float = 2.0,
+        keepalive_seconds: float = 15.0
+    ):
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.keepalive_seconds = keepalive_seconds
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._recovery: Optional[asyncio.Task] = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._worker_id = f"{socket.gethostname()}-{os.getpid()}"
+
+    def _insert(self, job_id: str, request: ImageJobRequest) -> ImageJob:
+        now = datetime.utcnow()
+        job = ImageJob(
+            id=job_id,
+            status=ImageJobStatus.QUEUED.value,
+            request=request.model_dump(mode="json", exclude={"webhook_url"}),
+            webhook_url=request.webhook_url,
+            created_at=now,
+            updated_at=now
+        )
+        with get_session() as session:
+            session.add(job)
+            session.commit()
+        return job
+
+    def _load(self, job_id: str) -> Optional[ImageJob]:
+        with get_session() as session:
+            return session.get(ImageJob, job_id)
+
+    def _update(self, job_id: str, **fields: Any) -> Optional[ImageJob]:
+        with get_session() as session:
+            job = session.get(ImageJob, job_id)
+            if job is None:
+                return None
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.updated_at = datetime.utcnow()
+            session.commit()
+            return job
+
+    def _claimable(self, now: datetime):
+        return or_(
+            ImageJob.status == ImageJobStatus.QUEUED.value,
+            and_(
+                ImageJob.status == ImageJobStatus.RUNNING.value,
+                or_(ImageJob.locked_until.is_(None), ImageJob.locked_until < now)
+            )
+        )
+
+    def _pending_ids(self) -> list:
+        with get_session() as session:
+            return [
+                job_id for (job_id,) in session.query(ImageJob.id)
+                .filter(self._claimable(datetime.utcnow()))
+                .order_by(ImageJob.created_at)
+            ]
+
+    def _claim(self, job_id: str) -> Optional[ImageJob]:
+        """Lease a queued or abandoned job; the conditional update makes concurrent claims safe across processes"""
+        now = datetime.utcnow()
+        with get_session() as session:
+            claimed = session.query(ImageJob).filter(ImageJob.id == job_id, self._claimable(now)).update(
+                {
+                    ImageJob.status: ImageJobStatus.RUNNING.value,
+                    ImageJob.locked_by: self._worker_id,
+                    ImageJob.locked_until: now + timedelta(seconds=self.lease_seconds),
+                    ImageJob.updated_at: now
+                },
+                synchronize_session=False
+            )
+            session.commit()
+            return session.get(ImageJob, job_id) if claimed else None
+
+    def _owned(self, job_id: str):
+        return and_(
+            ImageJob.id == job_id,
+            ImageJob.status == ImageJobStatus.RUNNING.value,
+            ImageJob.locked_by == self._worker_id
+        )
+
+    def _held(self, job_id: str) -> bool:
+        with get_session() as session:
+            return session.query(ImageJob.id).filter(self._owned(job_id)).first() is not None
+
+    def _renew(self, job_id: str) -> bool:
+        """Extend the lease; False if the job was cancelled or taken over"""
+        now = datetime.utcnow()
+        with get_session() as session:
+            renewed = session.query(ImageJob).filter(self._owned(job_id)).update(
+                {ImageJob.locked_until: now + timedelta(seconds=self.lease_seconds)},
+                synchronize_session=False
+            )
+            session.commit()
+            return bool(renewed)
+
+    def _complete(self, job_id: str, **fields: Any) -> Optional[ImageJob]:
+        """Record the outcome only if this process still holds the job, so a cancel is never overwritten"""
+        with get_session() as session:
+            updated = session.query(ImageJob).filter(self._owned(job_id)).update(
+                {
+                    **{getattr(ImageJob, name): value for name, value in fields.items()},
+                    ImageJob.locked_until: None,
+                    ImageJob.updated_at: datetime.utcnow()
+                },
+                synchronize_session=False
+            )
+            session.commit()
+            return session.get(ImageJob, job_id) if updated else None
+
+    def _cancel(self, job_id: str) -> Optional[ImageJob]:
+        """Mark a queued or running job cancelled; the process running it notices on its next check"""
+        now = datetime.utcnow()
+        with get_session() as session:
+            session.query(ImageJob).filter(
+                ImageJob.id == job_id,
+                ImageJob.status.in_([ImageJobStatus.QUEUED.value, ImageJobStatus.RUNNING.value])
+            ).update(
+                {
+                    ImageJob.status: ImageJobStatus.CANCELLED.value,
+                    ImageJob.locked_until: None,
+                    ImageJob.completed_at: now,
+                    ImageJob.updated_at: now
+                },
+                synchronize_session=False
+            )
+            session.commit()
+            return session.get(ImageJob, job_id)
+
+    def _release(self) -> int:
+        """Requeue the jobs this process holds so another worker can pick them up"""
+        with get_session() as session:
+            released = session.query(ImageJob).filter(
+                ImageJob.status == ImageJobStatus.RUNNING.value,
+                ImageJob.locked_by == self._worker_id
+            ).update(
+                {
+                    ImageJob.status: ImageJobStatus.QUEUED.value,
+                    ImageJob.locked_by: None,
+                    ImageJob.locked_until: None
+                },
+                synchronize_session=False
+            )
+            session.commit()
+            return released
+
+    def _schedule(self, job_id: str):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def create_job(self, request: ImageJobRequest) -> ImageJobResponse:
+        """Persist a job and start it in the background
+
+        Raises UnsafeURLError if the webhook URL is not a public http(s) URL.
+        """
+        if request.webhook_url:
+            await check_public_url(request.webhook_url)
+        job_id = str(uuid.uuid4())
+        job = await asyncio.to_thread(self._insert, job_id, request)
+        self._schedule(job_id)
+        return _to_response(job)
+
+    async def get_job(self, job_id: str) -> Optional[ImageJobResponse]:
+        """Get a job's current state"""
+        job = await asyncio.to_thread(self._load, job_id)
+        return _to_response(job) if job else None
+
+    def _publish(self, job_id: str, event: Dict[str, Any]):
+        """Send an event to every stream watching the job, dropping the oldest if a client lags"""
+        for subscriber in self._subscribers.get(job_id, ()):
+            if subscriber.full():
+                subscriber.get_nowait()
+            subscriber.put_nowait(event)
+
+    def _publish_preview(self, job_id: str, preview: Dict[str, Any]):
+        self._publish(job_id, {
+            "event": "preview",
+            "data": {
+                "step": preview["step"],
+                "steps": preview["steps"],
+                "image": "data:image/jpeg;base64," + base64.b64encode(preview["image"]).decode("ascii")
+            }
+        })
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Stream status, preview and completion events for a job
+
+        Events published in this process arrive immediately. Otherwise the job
+        row is polled, so a stream served by another worker than the one
+        running the job still sees status changes and ends when the job
+        finishes. Idle streams get a keep-alive comment.
+        """
+        finished = {status.value for status in FINISHED_STATUSES}
+        subscriber: asyncio.Queue = asyncio.Queue(maxsize=16)
+        self._subscribers.setdefault(job_id, set()).add(subscriber)
+        try:
+            job = await self.get_job(job_id)
+            if job is None:
+                return
+            yield {"event": "status", "data": job.model_dump(mode="json")}
+            if job.status in FINISHED_STATUSES:
+                return
+            status = job.status
+            last_sent = time.monotonic()
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.get(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    job = await self.get_job(job_id)
+                    if job is None:
+                        return
+                    if job.status != status:
+                        event = {
+                            "event": job.status.value if job.status in FINISHED_STATUSES else "status",
+                            "data": job.model_dump(mode="json")
+                        }
+                    elif time.monotonic() - last_sent >= self.keepalive_seconds:
+                        event = {"comment": "keep-alive"}
+                    else:
+                        continue
+                if event.get("event") == "status":
+                    status = ImageJobStatus(event["data"]["status"])
+                yield event
+                last_sent = time.monotonic()
+                if event.get("event") in finished:
+                    return
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    async def _finish(self, job: ImageJob):
+        self._publish(job.id, {"event": job.status, "data": _to_response(job).model_dump(mode="json")})
+        await self._notify(job)
+
+    async def cancel_job(self, job_id: str) -> Optional[ImageJobResponse]:
+        """Cancel a queued or running job and free the diffusion worker
+
+        The cancel is recorded in the job row, so a job running in another
+        process stops at that process's next check.
+        """
+        job = await asyncio.to_thread(self._load, job_id)
+        if job is None:
+            return None
+        if ImageJobStatus(job.status) in FINISHED_STATUSES:
+            return _to_response(job)
+        job = await asyncio.to_thread(self._cancel, job_id)
+        if job.status != ImageJobStatus.CANCELLED.value:
+            # Finished before the cancel landed
+            return _to_response(job)
+        image_generator.cancel(job_id)
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        await self._finish(job)
+        return _to_response(job)
+
+    async def _heartbeat(self, job_id: str):
+        """Keep the lease alive while generating, and stop if the job was cancelled or is no longer ours"""
+        renewed = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if time.monotonic() - renewed >= self.lease_seconds / 3:
+                    held = await asyncio.to_thread(self._renew, job_id)
+                    renewed = time.monotonic()
+                else:
+                    held = await asyncio.to_thread(self._held, job_id)
+                if not held:
+                    logger.info(f"Image job {job_id} is no longer held by this process, stopping it")
+                    image_generator.cancel(job_id)
+                    task = self._tasks.get(job_id)
+                    if task is not None:
+                        task.cancel()
+                    return
+            except Exception as e:
+                logger.warning(f"Failed to check the lease on image job {job_id}: {e}")
+
+    async def _run(self, job_id: str):
+        async with self._semaphore:
+            job = await asyncio.to_thread(self._claim, job_id)
+            if job is None:
+                # Finished, cancelled or running in another process
+                return
+            self._publish(job_id, {"event": "status", "data": _to_response(job).model_dump(mode="json")})
+            request = ImageGenerationRequest(**job.request)
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+            try:
+                while True:
+                    try:
+                        response = await image_generator.generate_image(
+                            request,
+                            job_id=job_id,
+                            on_preview=lambda preview: self._publish_preview(job_id, preview)
+                        )
+                        break
+                    except WorkerBusyError as e:
+                        # Jobs wait for capacity instead of failing like synchronous requests
+                        await asyncio.sleep(e.retry_after)
+                job = await asyncio.to_thread(
+                    self._complete,
+                    job_id,
+                    status=ImageJobStatus.COMPLETED.value,
+                    result=response.model_dump(mode="json"),
+                    completed_at=datetime.utcnow()
+                )
+            except asyncio.CancelledError:
+                # Left running under our lease; stop() requeues it, or it is reclaimed once the lease expires
+                raise
+            except JobCancelledError:
+                # cancel_job updates the job and notifies
+                return
+            except Exception as e:
+                logger.error(f"Image job {job_id} failed: {e}")
+                job = await asyncio.to_thread(
+                    self._complete,
+                    job_id,
+                    status=ImageJobStatus.FAILED.value,
+                    error=str(e),
+                    completed_at=datetime.utcnow()
+                )
+            finally:
+                heartbeat.cancel()
+        if job is None:
+            # Cancelled or taken over while generating; whoever did that reports it
+            return
+        await self._finish(job)
+
+    async def _notify(self, job: ImageJob):
+        """POST the finished job to its webhook, falling back to the Zapier hook"""
+        url = job.webhook_url or settings.ZAPIER_WEBHOOK_URL
+        if not url:
+            return
+        payload = {"event": f"image_job.{job.status}", "job": _to_response(job).model_dump(mode="json")}
+        status = None
+        for attempt in range(WEBHOOK_ATTEMPTS):
+            try:
+                if job.webhook_url:
+                    # Checked again at delivery and pinned, since the host may resolve elsewhere by now
+                    request = stream_public_url("POST", url, json=payload, timeout=settings.IMAGE_JOB_WEBHOOK_TIMEOUT)
+                else:
+                    request = get_http_client().stream("POST", url, json=payload, timeout=settings.IMAGE_JOB_WEBHOOK_TIMEOUT)
+                # Streamed so the response body is never read
+                async with request as response:
+                    response.raise_for_status()
+                status = "delivered"
+                break
+            except UnsafeURLError as e:
+                status = f"rejected: {e}"[:64]
+                logger.warning(f"Webhook for image job {job.id} rejected: {e}")
+                break
+            except httpx.HTTPError as e:
+                status = f"failed: {e}"[:64]
+                logger.warning(f"Webhook for image job {job.id} failed (attempt {attempt + 1}): {e}")
+                if attempt < WEBHOOK_ATTEMPTS - 1:
+                    await asyncio.sleep(2 ** attempt)
+        await asyncio.to_thread(self._update, job.id, webhook_status=status)
+
+    async def _resume_pending(self):
+        job_ids = [
+            job_id for job_id in await asyncio.to_thread(self._pending_ids)
+            if job_id not in self._tasks
+        ]
+        for job_id in job_ids:
+            self._schedule(job_id)
+        if job_ids:
+            logger.info(f"Picked up {len(job_ids)} queued or abandoned image jobs")
+
+    async def _recover(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds)
+            try:
+                await self._resume_pending()
+            except Exception as e:
+                logger.error(f"Failed to look for abandoned image jobs: {e}")
+
+    async def resume(self):
+        """Run jobs left queued or abandoned by a dead process, now and once per lease period
+
+        Every worker calls this; the claim in ``_run`` lets only one of them run each job.
+        """
+        await self._resume_pending()
+        if self._recovery is None:
+            self._recovery = asyncio.create_task(self._recover())
+
+    async def stop(self):
+        """Cancel in-flight jobs and requeue them for the other workers or the next startup"""
+        if self._recovery is not None:
+            self._recovery.cancel()
+            self._recovery = None
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await asyncio.to_thread(self._release)
+        except Exception as e:
+            logger.warning(f"Failed to requeue image jobs, they restart once their leases expire: {e}")
+
+
+# Global instance
+image_job_service = ImageJobService(
+    concurrency=settings.IMAGE_JOB_CONCURRENCY,
+    lease_seconds=settings.IMAGE_JOB_LEASE_SECONDS,
+    poll_interval=settings.IMAGE_JOB_POLL_INTERVAL,
+    keepalive_seconds=settings.IMAGE_JOB_KEEPALIVE_SECONDS
+)
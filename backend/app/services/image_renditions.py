@@ -0,0 +1,118 @@
+"""
+Platform-specific image renditions
+
+Each generated image is cropped, resized and re-encoded once per platform so
+publishing uploads a small file that already meets the platform's size and
+aspect requirements. Encoding runs in a thread pool (Pillow releases the GIL
+while resizing and encoding).
+"""
+from PIL import Image, ImageOps
+from app.core.config import settings
+from app.models.schemas import Platform
+from app.services.image_store import ImageStore
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+import asyncio
+import io
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Upload limits per platform
+PLATFORM_MAX_BYTES = {
+    Platform.TWITTER: 5 * 1024 * 1024,
+    Platform.INSTAGRAM: 8 * 1024 * 1024,
+    Platform.LINKEDIN: 5 * 1024 * 1024,
+    Platform.FACEBOOK: 4 * 1024 * 1024,
+}
+
+# Target size is the largest output; images are never upscaled to reach it
+RENDITIONS: List[Dict[str, Any]] = [
+    {"name": "twitter", "platform": Platform.TWITTER, "size": (1600, 900), "crop": True, "format": "WEBP", "quality": 82},
+    {"name": "twitter-jpeg", "platform": Platform.TWITTER, "size": (1600, 900), "crop": True, "format": "JPEG", "quality": 85},
+    # The Instagram Graph API only accepts JPEG
+    {"name": "instagram-square", "platform": Platform.INSTAGRAM, "size": (1080, 1080), "crop": True, "format": "JPEG", "quality": 88},
+    {"name": "instagram-portrait", "platform": Platform.INSTAGRAM, "size": (1080, 1350), "crop": True, "format": "JPEG", "quality": 88},
+    {"name": "linkedin", "platform": Platform.LINKEDIN, "size": (1200, 627), "crop": True, "format": "JPEG", "quality": 85},
+    {"name": "facebook", "platform": Platform.FACEBOOK, "size": (1200, 630), "crop": True, "format": "JPEG", "quality": 85},
+    {"name": "thumbnail", "platform": None, "size": (320, 320), "crop": False, "format": "WEBP", "quality": 75},
+]
+
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp", "PNG": "png"}
+
+# Thread pool for resizing and encoding
+rendition_executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_RENDITION_WORKERS,
+    thread_name_prefix="image-rendition"
+)
+
+
+def _target_size(source: Image.Image, size: tuple, crop: bool) -> tuple:
+    """Shrink the target to fit the source so renditions are never upscaled"""
+    width, height = size
+    if crop:
+        scale = min(1.0, source.width / width, source.height / height)
+    else:
+        scale = min(1.0, width / source.width, height / source.height)
+        width, height = source.width, source.height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def render(source: Image.Image, spec: Dict[str, Any]) -> tuple:
+    """Crop or resize and encode one rendition, returning (bytes, width, height)"""
+    size = _target_size(source, spec["size"], spec["crop"])
+    if spec["crop"]:
+        image = ImageOps.fit(source, size, Image.LANCZOS)
+    else:
+        image = source.resize(size, Image.LANCZOS)
+    if spec["format"] == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    options = {"quality": spec["quality"]}
+    if spec["format"] == "JPEG":
+        options.update(optimize=True, progressive=True)
+    elif spec["format"] == "WEBP":
+        options["method"] = 4
+    image.save(buffer, format=spec["format"], **options)
+    return buffer.getvalue(), image.width, image.height
+
+
+def _load(path: str) -> Image.Image:
+    image = Image.open(path)
+    image.load()
+    return image
+
+
+def _build(store: ImageStore, source: str, source_image: Image.Image, spec: Dict[str, Any]) -> Dict[str, Any]:
+    data, width, height = render(source_image, spec)
+    platform = spec["platform"].value if spec["platform"] else None
+    return store.put_rendition(source, spec["name"], platform, data, EXTENSIONS[spec["format"]], width, height)
+
+
+async def create_renditions(store: ImageStore, image_url: str) -> List[Dict[str, Any]]:
+    """Build every platform rendition of a stored image in the pool"""
+    source = store.filename_from_url(image_url)
+    if source is None:
+        return []
+    loop = asyncio.get_running_loop()
+    source_image = await loop.run_in_executor(rendition_executor, _load, store.path_for(source))
+    return list(await asyncio.gather(*(
+        loop.run_in_executor(rendition_executor, _build, store, source, source_image, spec)
+        for spec in RENDITIONS
+    )))
+
+
+async def best_rendition(store: ImageStore, image_url: str, platform: Platform) -> Optional[Dict[str, Any]]:
+    """Smallest rendition of a stored image that the platform accepts, building them if missing"""
+    source = store.filename_from_url(image_url)
+    if source is None or not os.path.exists(store.path_for(source)):
+        return None
+    renditions = await asyncio.to_thread(store.get_renditions, source, platform.value)
+    if not renditions:
+        await create_renditions(store, image_url)
+        renditions = await asyncio.to_thread(store.get_renditions, source, platform.value)
+    max_bytes = PLATFORM_MAX_BYTES.get(platform)
+    valid = [r for r in renditions if max_bytes is None or r["bytes"] <= max_bytes]
+    return valid[0] if valid else None
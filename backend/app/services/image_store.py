@@ -0,0 +1,268 @@
+"""
+Content-addressed image storage with a generation cache
+
+Images are stored under the sha256 of their bytes, so identical images are
+written once and concurrent saves never collide. A SQLite index next to the
+files tracks size and last access for LRU eviction, maps generation
+parameters to the image URLs they produced, and records the platform
+renditions derived from each image.
+"""
+from app.core.config import settings
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def make_generation_key(params: Dict[str, Any]) -> str:
+    """Hash the generation parameters that determine the output"""
+    fields = {
+        name: params.get(name)
+        for name in (
+            "prompt", "negative_prompt", "style", "width", "height", "steps",
+            "guidance_scale", "scheduler", "upscale", "seed", "num_images"
+        )
+    }
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ImageStore:
+    """Stores images by content hash and evicts the least recently used past a size budget"""
+
+    def __init__(self, root: str, url_prefix: str, max_bytes: int):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip("/")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.root, "index.sqlite3"), check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS images (
+                    filename TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS images_last_access ON images (last_access);
+                CREATE TABLE IF NOT EXISTS generations (
+                    key TEXT PRIMARY KEY,
+                    urls TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS renditions (
+                    filename TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    platform TEXT,
+                    format TEXT NOT NULL,
+                    width INTEGER NOT NULL,
+                    height INTEGER NOT NULL,
+                    size INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS renditions_source ON renditions (source);
+            """)
+        return self._conn
+
+    def path_for(self, filename: str) -> str:
+        return os.path.join(self.root, filename)
+
+    def url_for(self, filename: str) -> str:
+        return f"{self.url_prefix}/{filename}"
+
+    def filename_from_url(self, url: str) -> Optional[str]:
+        """Map a stored image URL back to its filename, None for external URLs"""
+        if url and url.startswith(self.url_prefix + "/"):
+            return url[len(self.url_prefix) + 1:]
+        return None
+
+    def _write(self, path: str, data: bytes):
+        if not os.path.exists(path):
+            # Write then rename so readers never see a partial file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    def put(self, data: bytes, extension: str = "png") -> str:
+        """Store image bytes under their content hash and return the URL"""
+        filename = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        path = self.path_for(filename)
+        with self._lock:
+            db = self._db()
+            self._write(path, data)
+            db.execute(
+                "INSERT OR REPLACE INTO images (filename, size, last_access) VALUES (?, ?, ?)",
+                (filename, len(data), time.time())
+            )
+            db.commit()
+            self._evict(keep={filename})
+        return self.url_for(filename)
+
+    def put_rendition(
+        self,
+        source: str,
+        name: str,
+        platform: Optional[str],
+        data: bytes,
+        extension: str,
+        width: int,
+        height: int
+    ) -> Dict[str, Any]:
+        """Store a derived rendition next to its source image"""
+        stem = source.rsplit(".", 1)[0]
+        filename = f"{stem}.{name}.{extension}"
+        with self._lock:
+            db = self._db()
+            self._write(self.path_for(filename), data)
+            db.execute(
+                "INSERT OR REPLACE INTO renditions "
+                "(filename, source, name, platform, format, width, height, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (filename, source, name, platform, extension, width, height, len(data))
+            )
+            db.commit()
+            self._evict(keep={source})
+        return {
+            "name": name,
+            "platform": platform,
+            "url": self.url_for(filename),
+            "path": self.path_for(filename),
+            "format": extension,
+            "width": width,
+            "height": height,
+            "bytes": len(data)
+        }
+
+    def get_renditions(self, source: str, platform: Optional[str] = None) -> List[Dict[str, Any]]:
+        """List stored renditions of an image, smallest first"""
+        query = "SELECT filename, name, platform, format, width, height, size FROM renditions WHERE source = ?"
+        args = [source]
+        if platform is not None:
+            query += " AND platform = ?"
+            args.append(platform)
+        with self._lock:
+            rows = self._db().execute(query + " ORDER BY size", args).fetchall()
+        return [
+            {
+                "name": name,
+                "platform": row_platform,
+                "url": self.url_for(filename),
+                "path": self.path_for(filename),
+                "format": extension,
+                "width": width,
+                "height": height,
+                "bytes": size
+            }
+            for filename, name, row_platform, extension, width, height, size in rows
+        ]
+
+    def _remove_file(self, filename: str):
+        try:
+            os.remove(self.path_for(filename))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep: set):
+        """Remove least recently used images and their renditions until the store fits its budget"""
+        db = self._db()
+        total = db.execute(
+            "SELECT (SELECT COALESCE(SUM(size), 0) FROM images) + (SELECT COALESCE(SUM(size), 0) FROM renditions)"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for filename, size in db.execute("SELECT filename, size FROM images ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            if filename in keep:
+                continue
+            self._remove_file(filename)
+            for rendition, rendition_size in db.execute(
+                "SELECT filename, size FROM renditions WHERE source = ?", (filename,)
+            ).fetchall():
+                self._remove_file(rendition)
+                total -= rendition_size
+            db.execute("DELETE FROM renditions WHERE source = ?", (filename,))
+            db.execute("DELETE FROM images WHERE filename = ?", (filename,))
+            total -= size
+            self.evictions += 1
+        db.commit()
+
+    def get_generation(self, key: str) -> Optional[List[str]]:
+        """Return cached image URLs for a generation if all local files still exist"""
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT urls FROM generations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            urls = json.loads(row[0])
+            filenames = [name for name in map(self.filename_from_url, urls) if name]
+            if any(not os.path.exists(self.path_for(name)) for name in filenames):
+                # Part of the result was evicted
+                db.execute("DELETE FROM generations WHERE key = ?", (key,))
+                db.commit()
+                self.misses += 1
+                return None
+            now = time.time()
+            db.executemany("UPDATE images SET last_access = ? WHERE filename = ?", [(now, name) for name in filenames])
+            db.commit()
+            self.hits += 1
+            return urls
+
+    def set_generation(self, key: str, urls: List[str]):
+        """Remember the image URLs a generation produced"""
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO generations (key, urls, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(urls), time.time())
+            )
+            db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache hit rate and disk usage"""
+        with self._lock:
+            db = self._db()
+            files, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM images").fetchone()
+            renditions, rendition_bytes = db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM renditions"
+            ).fetchone()
+            generations = db.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "files": files,
+            "bytes": total,
+            "renditions": renditions,
+            "rendition_bytes": rendition_bytes,
+            "max_bytes": self.max_bytes,
+            "generations": generations,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Global instance
+image_store = ImageStore(
+    settings.IMAGE_STORAGE_DIR,
+    url_prefix="/uploads/images",
+    max_bytes=settings.IMAGE_CACHE_MAX_BYTES
+)
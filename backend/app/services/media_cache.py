@@ -0,0 +1,118 @@
+"""
+Cache of platform media IDs by image content hash
+
+Uploading the same image again for every post wastes bandwidth and upload
+quota. Media IDs are stored per (content hash, platform, account) in the SQL
+database until the platform expires them, so repeat posts, retries and other
+workers skip the upload.
+"""
+from app.core.database import get_session
+from app.models.schemas import Platform
+from app.models.tables import MediaUpload
+from sqlalchemy import func
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import asyncio
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Stop reusing an ID this long before the platform expires it, so it cannot lapse mid-post
+EXPIRY_MARGIN_SECONDS = 3600
+
+
+def content_hash(path_or_url: str) -> str:
+    """sha256 of a local file's bytes, or of the URL for remote images"""
+    if not os.path.isfile(path_or_url):
+        return hashlib.sha256(path_or_url.encode("utf-8")).hexdigest()
+    digest = hashlib.sha256()
+    with open(path_or_url, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MediaUploadCache:
+    """Maps uploaded content to platform media IDs with per-platform expiry"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, platform: str, account: str, key: str) -> Optional[str]:
+        now = datetime.utcnow()
+        with get_session() as session:
+            entry = session.get(MediaUpload, (key, platform, account))
+            if entry is None or entry.expires_at <= now:
+                return None
+            entry.uses += 1
+            entry.last_used_at = now
+            session.commit()
+            return entry.media_id
+
+    def _set(self, platform: str, account: str, key: str, media_id: str, ttl: float):
+        now = datetime.utcnow()
+        with get_session() as session:
+            session.merge(MediaUpload(
+                content_hash=key,
+                platform=platform,
+                account=account,
+                media_id=media_id,
+                expires_at=now + timedelta(seconds=max(ttl - EXPIRY_MARGIN_SECONDS, 0)),
+                uses=0,
+                created_at=now
+            ))
+            session.query(MediaUpload).filter(MediaUpload.expires_at <= now).delete(synchronize_session=False)
+            session.commit()
+
+    def _delete(self, platform: str, account: str, key: str):
+        with get_session() as session:
+            session.query(MediaUpload).filter(
+                MediaUpload.content_hash == key,
+                MediaUpload.platform == platform,
+                MediaUpload.account == account
+            ).delete(synchronize_session=False)
+            session.commit()
+
+    def _counts(self) -> Dict[str, int]:
+        with get_session() as session:
+            rows = (
+                session.query(MediaUpload.platform, func.count())
+                .filter(MediaUpload.expires_at > datetime.utcnow())
+                .group_by(MediaUpload.platform)
+                .all()
+            )
+        return {platform: count for platform, count in rows}
+
+    async def get(self, platform: Platform, account: str, key: str) -> Optional[str]:
+        """Get a still-valid media ID for this content and account"""
+        media_id = await asyncio.to_thread(self._get, platform.value, account, key)
+        if media_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return media_id
+
+    async def set(self, platform: Platform, account: str, key: str, media_id: str, ttl: float):
+        """Remember a media ID for ``ttl`` seconds, less a safety margin"""
+        await asyncio.to_thread(self._set, platform.value, account, key, media_id, ttl)
+
+    async def invalidate(self, platform: Platform, account: str, key: str):
+        """Forget a media ID that was used up or rejected"""
+        await asyncio.to_thread(self._delete, platform.value, account, key)
+
+    async def stats(self) -> Dict[str, Any]:
+        """Get hit rate and live entries per platform"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": await asyncio.to_thread(self._counts),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+# Global instance
+media_upload_cache = MediaUploadCache()
@@ -0,0 +1,341 @@
+"""
+Per-platform, per-account publishing rate limits
+
+Each (platform, account) pair has a token bucket seeded from
+PLATFORM_RATE_LIMITS and corrected from the rate-limit headers the platform
+returns. Calls wait in FIFO order until the bucket has capacity, and requests
+the platform did not process (429, 503, failed connects) are retried with
+jittered exponential backoff.
+
+Buckets live in each web worker's memory, so every worker gets an equal share
+(1/PUBLISH_PROCESSES) of an account's limit. The platform's headers still
+report the account-wide quota and are scaled the same way.
+"""
+from app.core.config import settings
+from app.models.schemas import Platform
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+import asyncio
+import httpx
+import json
+import logging
+import math
+import random
+import requests
+import time
+
+logger = logging.getLogger(__name__)
+
+# Retrying other errors could publish a post twice
+RETRYABLE_STATUSES = {429, 503}
+TRANSIENT_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.PoolTimeout,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ConnectTimeout,
+)
+
+# Reset headers holding a value below this are a delay in seconds, above it an epoch timestamp
+EPOCH_THRESHOLD = 1_000_000_000
+
+
+class WithResponse(NamedTuple):
+    """A call's result along with the HTTP response it came from, for clients that return parsed objects"""
+    value: Any
+    response: Any
+
+
+class RateLimitedError(Exception):
+    """Raised when a platform has no capacity within the allowed wait"""
+
+    def __init__(self, platform: str, retry_after: int):
+        super().__init__(f"{platform} rate limit reached, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[int, float]]:
+    """Parse "twitter=300/10800,instagram=25/86400" into {platform: (calls, period_seconds)}"""
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        platform, _, rate = item.partition("=")
+        calls, _, period = rate.partition("/")
+        limits[platform.strip().lower()] = (int(calls), float(period))
+    return limits
+
+
+class TokenBucket:
+    """This process's share of the publishing capacity of one platform account"""
+
+    def __init__(self, capacity: int, period: float, processes: int = 1):
+        self.limit = capacity
+        self.processes = max(processes, 1)
+        self.capacity = max(capacity // self.processes, 1)
+        self.period = period
+        self.rate = self.capacity / period
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        self.waiting = 0
+        self.total_calls = 0
+        self.total_wait_seconds = 0.0
+        self.throttled = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost: int) -> float:
+        """Seconds until ``cost`` tokens are available"""
+        self._refill()
+        wait = max(0.0, self.blocked_until - time.monotonic())
+        if self.tokens < cost:
+            wait = max(wait, (cost - self.tokens) / self.rate)
+        return wait
+
+    async def acquire(self, platform: str, cost: int, max_wait: float) -> float:
+        """Wait for capacity and take ``cost`` tokens; the lock makes waiters queue in order"""
+        self.waiting += 1
+        try:
+            async with self._lock:
+                waited = 0.0
+                while True:
+                    delay = self.delay(cost)
+                    if delay <= 0:
+                        self.tokens -= cost
+                        self.total_calls += 1
+                        self.total_wait_seconds += waited
+                        return waited
+                    if waited + delay > max_wait:
+                        raise RateLimitedError(platform, math.ceil(delay))
+                    await asyncio.sleep(delay)
+                    waited += delay
+        finally:
+            self.waiting -= 1
+
+    def block(self, seconds: float):
+        """Stop calls for ``seconds``, e.g. after a 429 or an exhausted quota"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.throttled += 1
+
+    def update(self, remaining: Optional[int], reset_in: Optional[float]):
+        """Apply the platform's own view of the remaining quota"""
+        self._refill()
+        if reset_in is not None:
+            self.reset_at = time.time() + reset_in
+        if remaining is None:
+            return
+        self.remaining = remaining
+        if remaining <= 0 and reset_in is not None:
+            # The platform's window refills at reset, so wait for that rather than our refill rate
+            self.block(reset_in)
+        else:
+            self.tokens = min(self.tokens, remaining / self.processes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "limit": self.limit,
+            "processes": self.processes,
+            "capacity": self.capacity,
+            "period_seconds": self.period,
+            "tokens": round(self.tokens, 2),
+            "blocked_for_seconds": round(max(0.0, self.blocked_until - time.monotonic()), 1),
+            "platform_remaining": self.remaining,
+            "platform_reset_at": self.reset_at,
+            "waiting": self.waiting,
+            "total_calls": self.total_calls,
+            "avg_wait_seconds": self.total_wait_seconds / self.total_calls if self.total_calls else 0.0,
+            "throttled": self.throttled
+        }
+
+
+def _header(headers, name: str) -> Optional[str]:
+    value = headers.get(name) if headers is not None else None
+    return value if value not in (None, "") else None
+
+
+def _seconds_until(value: str) -> float:
+    reset = float(value)
+    return max(0.0, reset - time.time()) if reset > EPOCH_THRESHOLD else reset
+
+
+def _is_transient(error: BaseException) -> bool:
+    # tweepy wraps connection errors in TweepyException
+    return isinstance(error, TRANSIENT_ERRORS) or isinstance(error.__context__, TRANSIENT_ERRORS)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed publish certainly did not reach the platform and can be sent again
+
+    Rejections (400, 401, 403, ...), invalid requests and read timeouts, after
+    which the platform may already have published, are permanent.
+    """
+    if isinstance(error, RateLimitedError) or _is_transient(error):
+        return True
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) in RETRYABLE_STATUSES
+
+
+class PlatformRateLimiter:
+    """Token buckets per platform account with header feedback and retries"""
+
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[int, float]],
+        max_attempts: int = 4,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        max_wait: float = 300.0,
+        processes: int = 1
+    ):
+        self.limits = limits
+        self.processes = max(processes, 1)
+        self.max_attempts = max(max_attempts, 1)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_wait = max_wait
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self.retries = 0
+
+    def bucket(self, platform: Platform, account: str) -> TokenBucket:
+        key = (platform.value, account)
+        if key not in self.buckets:
+            # Unlisted platforms get a permissive default that headers can tighten
+            calls, period = self.limits.get(platform.value, (60, 60.0))
+            self.buckets[key] = TokenBucket(calls, period, self.processes)
+        return self.buckets[key]
+
+    def observe(self, platform: Platform, account: str, status_code: Optional[int], headers) -> Optional[float]:
+        """Update the bucket from response headers; returns the server-requested delay, if any"""
+        bucket = self.bucket(platform, account)
+        retry_after = None
+        try:
+            if _header(headers, "retry-after"):
+                retry_after = float(headers["retry-after"])
+
+            # Twitter uses x-rate-limit-*, other APIs x-ratelimit-*
+            for prefix in ("x-rate-limit-", "x-ratelimit-"):
+                remaining = _header(headers, prefix + "remaining")
+                reset = _header(headers, prefix + "reset")
+                if remaining is not None or reset is not None:
+                    bucket.update(
+                        int(remaining) if remaining is not None else None,
+                        _seconds_until(reset) if reset is not None else None
+                    )
+                    if remaining is not None and int(remaining) <= 0 and reset is not None:
+                        retry_after = max(retry_after or 0.0, _seconds_until(reset))
+                    break
+
+            # Meta reports usage as a percentage of the quota
+            usage = _header(headers, "x-business-use-case-usage") or _header(headers, "x-app-usage")
+            if usage is not None:
+                meta_delay = self._observe_meta_usage(bucket, json.loads(usage))
+                if meta_delay:
+                    retry_after = max(retry_after or 0.0, meta_delay)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.debug(f"Ignoring malformed rate limit headers from {platform.value}: {e}")
+
+        if status_code == 429:
+            retry_after = retry_after or self.backoff_base
+        if retry_after:
+            bucket.block(retry_after)
+        return retry_after
+
+    def _observe_meta_usage(self, bucket: TokenBucket, usage: Dict[str, Any]) -> Optional[float]:
+        # x-business-use-case-usage is keyed by business id with a list of usages
+        entries = [entry for value in usage.values() for entry in value] if all(
+            isinstance(value, list) for value in usage.values()
+        ) else [usage]
+        percent = max(
+            (entry.get(key, 0) for entry in entries for key in ("call_count", "total_time", "total_cputime")),
+            default=0
+        )
+        if percent >= 100:
+            minutes = max((entry.get("estimated_time_to_regain_access", 0) for entry in entries), default=0)
+            return minutes * 60 or 60.0
+        bucket.update(int(bucket.limit * (100 - percent) / 100), None)
+        return None
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Full-jitter exponential backoff, never shorter than the server asked for"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    async def call(
+        self,
+        platform: Platform,
+        account: str,
+        send: Callable[[], Awaitable[Any]],
+        cost: int = 1
+    ) -> Any:
+        """Run ``send`` when the account has capacity, retrying unprocessed requests
+
+        ``send`` may return an HTTP response (its status and headers are checked),
+        a WithResponse pairing a parsed result with its response (the result is
+        returned), or any other value. Exceptions carrying a ``response`` are
+        inspected too.
+        """
+        bucket = self.bucket(platform, account)
+        for attempt in range(self.max_attempts):
+            await bucket.acquire(platform.value, cost, self.max_wait)
+            error = None
+            try:
+                result = await send()
+                if isinstance(result, WithResponse):
+                    result, response = result
+                    response = response if hasattr(response, "status_code") else None
+                else:
+                    response = result if hasattr(result, "status_code") and hasattr(result, "headers") else None
+            except Exception as e:
+                if _is_transient(e) and attempt < self.max_attempts - 1:
+                    delay = self._backoff(attempt, None)
+                    logger.warning(f"{platform.value} request failed to connect, retrying in {delay:.1f}s: {e}")
+                    self.retries += 1
+                    await asyncio.sleep(delay)
+                    continue
+                response = getattr(e, "response", None)
+                if response is None:
+                    raise
+                error = e
+
+            retry_after = None
+            if response is not None:
+                retry_after = self.observe(platform, account, response.status_code, response.headers)
+            retryable = response is not None and response.status_code in RETRYABLE_STATUSES
+            if not retryable or attempt == self.max_attempts - 1:
+                if error is not None:
+                    raise error
+                return result
+            delay = self._backoff(attempt, retry_after)
+            if delay > self.max_wait:
+                raise RateLimitedError(platform.value, math.ceil(delay))
+            logger.warning(f"{platform.value} returned {response.status_code}, retrying in {delay:.1f}s")
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """Bucket state for monitoring"""
+        return {
+            "retries": self.retries,
+            "buckets": [
+                {"platform": platform, "account": account, **bucket.to_dict()}
+                for (platform, account), bucket in self.buckets.items()
+            ]
+        }
+
+
+# Global instance
+platform_rate_limiter = PlatformRateLimiter(
+    parse_limits(settings.PLATFORM_RATE_LIMITS),
+    max_attempts=settings.PUBLISH_MAX_ATTEMPTS,
+    backoff_base=settings.PUBLISH_BACKOFF_BASE,
+    backoff_max=settings.PUBLISH_BACKOFF_MAX,
+    max_wait=settings.PUBLISH_MAX_WAIT,
+    processes=settings.PUBLISH_PROCESSES
+)
@@ -0,0 +1,390 @@
+"""
+Durable publishing outbox
+
+Every publish is first recorded as an outbox row keyed by an idempotency key
+derived from the content ID and platform, so the same post is never queued
+twice. A pool of async workers claims due rows with a lease and publishes
+them, renewing the lease while a publish waits on rate limits and retries. A
+worker that dies mid-publish leaves its lease to expire and the row is picked
+up again, so delivery is at-least-once.
+"""
+from app.core.config import settings
+from app.core.database import get_session
+from app.models.schemas import (
+    ContentStatus,
+    OutboxStatus,
+    Platform,
+    PlatformPost,
+    PostRequest,
+    PostResponse
+)
+from app.models.tables import OutboxPost
+from app.services.platform_limits import is_retryable
+from app.services.social_media import social_media_service
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import socket
+import uuid
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = {OutboxStatus.PUBLISHED.value, OutboxStatus.FAILED.value}
+
+
+def make_idempotency_key(
+    content_id: str,
+    platform: Platform,
+    content: str,
+    image_url: Optional[str],
+    now: Optional[datetime] = None
+) -> str:
+    """
+    Key a publish by content ID and platform. Without an ID the content itself
+    is the key, bucketed by OUTBOX_DEDUPE_WINDOW so a retried request is
+    deduplicated but the same text can be posted again later.
+    """
+    if content_id:
+        source = f"{content_id}:{platform.value}"
+    else:
+        window = max(settings.OUTBOX_DEDUPE_WINDOW, 1)
+        bucket = int((now or datetime.utcnow()).timestamp() // window)
+        source = f":{platform.value}:{content}:{image_url or ''}:{bucket}"
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def _to_response(post: OutboxPost) -> PostResponse:
+    if post.result:
+        return PostResponse(**{**post.result, "id": post.id, "content_id": post.content_id})
+    if post.status == OutboxStatus.FAILED.value:
+        status = ContentStatus.FAILED
+    else:
+        # Still queued or in flight
+        status = ContentStatus.SCHEDULED
+    return PostResponse(
+        id=post.id,
+        content_id=post.content_id,
+        platform=post.platform,
+        status=status,
+        scheduled_for=post.available_at if status == ContentStatus.SCHEDULED else None,
+        error=post.error
+    )
+
+
+class PublishOutbox:
+    """Records publish intents and drains them with a pool of async workers"""
+
+    def __init__(
+        self,
+        workers: int = 8,
+        poll_interval: float = 2.0,
+        lease_seconds: int = 600,
+        max_attempts: int = 5
+    ):
+        self.workers = max(workers, 1)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._worker_prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+    def _insert(
+        self,
+        content_id: str,
+        platform: Platform,
+        content: str,
+        image_url: Optional[str],
+        publish_at: Optional[datetime]
+    ) -> Tuple[OutboxPost, bool]:
+        """Insert a publish intent, or return the existing one for the same key"""
+        now = datetime.utcnow()
+        key = make_idempotency_key(content_id, platform, content, image_url, now)
+        post = OutboxPost(
+            id=str(uuid.uuid4()),
+            idempotency_key=key,
+            content_id=content_id,
+            platform=platform.value,
+            content=content,
+            image_url=image_url,
+            status=OutboxStatus.PENDING.value,
+            attempts=0,
+            available_at=publish_at or now,
+            created_at=now,
+            updated_at=now
+        )
+        with get_session() as session:
+            session.add(post)
+            try:
+                session.commit()
+                return post, True
+            except IntegrityError:
+                session.rollback()
+            existing = session.query(OutboxPost).filter(OutboxPost.idempotency_key == key).one()
+            if existing.status == OutboxStatus.FAILED.value:
+                # Asking again for a failed post retries it
+                existing.status = OutboxStatus.PENDING.value
+                existing.attempts = 0
+                existing.available_at = publish_at or now
+                existing.updated_at = now
+                session.commit()
+            return existing, False
+
+    def _load(self, post_id: str) -> Optional[OutboxPost]:
+        with get_session() as session:
+            return session.get(OutboxPost, post_id)
+
+    def _claim(self, worker_id: str) -> Optional[OutboxPost]:
+        """Lease one due row; the conditional update makes concurrent claims safe across processes"""
+        now = datetime.utcnow()
+        claimable = or_(
+            and_(OutboxPost.status == OutboxStatus.PENDING.value, OutboxPost.available_at <= now),
+            and_(OutboxPost.status == OutboxStatus.IN_FLIGHT.value, OutboxPost.locked_until < now)
+        )
+        with get_session() as session:
+            candidates = [
+                post_id for (post_id,) in session.query(OutboxPost.id)
+                .filter(claimable)
+                .order_by(OutboxPost.available_at)
+                .limit(self.workers)
+            ]
+            # Spread workers over the candidates instead of all racing for the first
+            random.shuffle(candidates)
+            for post_id in candidates:
+                claimed = session.query(OutboxPost).filter(OutboxPost.id == post_id, claimable).update(
+                    {
+                        OutboxPost.status: OutboxStatus.IN_FLIGHT.value,
+                        OutboxPost.locked_by: worker_id,
+                        OutboxPost.locked_until: now + timedelta(seconds=self.lease_seconds),
+                        OutboxPost.attempts: OutboxPost.attempts + 1,
+                        OutboxPost.updated_at: now
+                    },
+                    synchronize_session=False
+                )
+                session.commit()
+                if claimed:
+                    return session.get(OutboxPost, post_id)
+        return None
+
+    def _owned(self, post_id: str, worker_id: str):
+        return and_(
+            OutboxPost.id == post_id,
+            OutboxPost.status == OutboxStatus.IN_FLIGHT.value,
+            OutboxPost.locked_by == worker_id
+        )
+
+    def _update(self, post_id: str, worker_id: str, **fields: Any) -> Optional[OutboxPost]:
+        """Record a delivery outcome only while ``worker_id`` still holds the lease"""
+        with get_session() as session:
+            updated = session.query(OutboxPost).filter(self._owned(post_id, worker_id)).update(
+                {
+                    **{getattr(OutboxPost, name): value for name, value in fields.items()},
+                    OutboxPost.updated_at: datetime.utcnow()
+                },
+                synchronize_session=False
+            )
+            session.commit()
+            return session.get(OutboxPost, post_id) if updated else None
+
+    def _renew(self, post_id: str, worker_id: str) -> bool:
+        """Extend the lease; False if another worker reclaimed the post"""
+        with get_session() as session:
+            renewed = session.query(OutboxPost).filter(self._owned(post_id, worker_id)).update(
+                {OutboxPost.locked_until: datetime.utcnow() + timedelta(seconds=self.lease_seconds)},
+                synchronize_session=False
+            )
+            session.commit()
+            return bool(renewed)
+
+    def _counts(self) -> Dict[str, int]:
+        with get_session() as session:
+            rows = session.query(OutboxPost.status, func.count()).group_by(OutboxPost.status).all()
+        return {status: count for status, count in rows}
+
+    async def enqueue(
+        self,
+        content_id: str,
+        platform: Platform,
+        content: str,
+        image_url: Optional[str] = None,
+        publish_at: Optional[datetime] = None
+    ) -> Tuple[OutboxPost, bool]:
+        """Record a publish intent; returns the row and whether it was newly created"""
+        post, created = await asyncio.to_thread(self._insert, content_id, platform, content, image_url, publish_at)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return post, created
+
+    async def publish(self, request: PostRequest, content: str, wait: Optional[float] = None) -> PostResponse:
+        """Publish through the outbox and wait briefly for the outcome
+
+        Returns a scheduled response if the post has not finished within ``wait`` seconds.
+        """
+        post, _ = await self.enqueue(
+            request.content_id,
+            request.platform,
+            content,
+            request.image_url,
+            request.schedule_for
+        )
+        if post.status in FINISHED_STATUSES:
+            return _to_response(post)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(post.id, []).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout=settings.OUTBOX_WAIT_SECONDS if wait is None else wait)
+        except asyncio.TimeoutError:
+            # Possibly finished by another process
+            post = await asyncio.to_thread(self._load, post.id)
+            return _to_response(post)
+        finally:
+            waiters = self._waiters.get(post.id, [])
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._waiters.pop(post.id, None)
+
+    async def publish_post(self, content_id: str, post: PlatformPost) -> PostResponse:
+        """Publish one entry of a multi-platform post through the outbox"""
+        return await self.publish(
+            PostRequest(content_id=content_id, platform=post.platform, image_url=post.image_url),
+            post.content
+        )
+
+    def _retry_delay(self, attempts: int) -> float:
+        return random.uniform(0.5, 1.0) * min(300, 5 * 2 ** attempts)
+
+    async def _heartbeat(self, post_id: str, worker_id: str):
+        """Keep the lease alive while a publish waits for capacity or retries"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await asyncio.to_thread(self._renew, post_id, worker_id):
+                    logger.warning(f"Lost the lease on outbox post {post_id}; its outcome is left to the new owner")
+                    return
+            except Exception as e:
+                logger.warning(f"Failed to renew the lease on outbox post {post_id}: {e}")
+
+    async def _deliver(self, post: OutboxPost, worker_id: str):
+        heartbeat = asyncio.create_task(self._heartbeat(post.id, worker_id))
+        try:
+            response = await social_media_service.post(
+                PostRequest(content_id=post.content_id, platform=post.platform, image_url=post.image_url),
+                post.content
+            )
+            error = response.error if response.status == ContentStatus.FAILED else None
+            retryable = response.retryable
+            result = response.model_dump(mode="json")
+        except Exception as e:
+            error, retryable, result = str(e), is_retryable(e), None
+        finally:
+            heartbeat.cancel()
+
+        now = datetime.utcnow()
+        if error is None:
+            updated = await asyncio.to_thread(
+                self._update,
+                post.id,
+                worker_id,
+                status=OutboxStatus.PUBLISHED.value,
+                result=result,
+                error=None,
+                locked_until=None,
+                published_at=now
+            )
+        elif not retryable or post.attempts >= self.max_attempts:
+            if retryable:
+                logger.error(f"Giving up on outbox post {post.id} to {post.platform} after {post.attempts} attempts: {error}")
+            else:
+                # Rejected, or possibly published already; sending it again could post twice
+                logger.error(f"Outbox post {post.id} to {post.platform} failed and cannot be retried: {error}")
+            updated = await asyncio.to_thread(
+                self._update,
+                post.id,
+                worker_id,
+                status=OutboxStatus.FAILED.value,
+                result=result,
+                error=error,
+                locked_until=None
+            )
+        else:
+            delay = self._retry_delay(post.attempts)
+            logger.warning(f"Outbox post {post.id} to {post.platform} failed, retrying in {delay:.0f}s: {error}")
+            await asyncio.to_thread(
+                self._update,
+                post.id,
+                worker_id,
+                status=OutboxStatus.PENDING.value,
+                error=error,
+                locked_until=None,
+                available_at=now + timedelta(seconds=delay)
+            )
+            return
+
+        if updated is None:
+            # Reclaimed by another worker after the lease lapsed; its outcome stands
+            return
+        for future in self._waiters.pop(post.id, []):
+            if not future.done():
+                future.set_result(_to_response(updated))
+
+    async def _worker(self, index: int):
+        worker_id = f"{self._worker_prefix}-{index}"
+        while True:
+            try:
+                post = await asyncio.to_thread(self._claim, worker_id)
+            except Exception as e:
+                logger.error(f"Outbox worker {worker_id} failed to claim a post: {e}")
+                post = None
+            if post is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            try:
+                await self._deliver(post, worker_id)
+            except Exception as e:
+                logger.error(f"Outbox worker {worker_id} failed to record the outcome of post {post.id}: {e}")
+
+    def start(self):
+        """Start the worker pool; rows left in flight by a dead process are reclaimed once their lease expires"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Publishing outbox started with {self.workers} workers")
+
+    async def stop(self):
+        """Stop the workers; interrupted posts are retried after their lease expires"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def stats(self) -> Dict[str, Any]:
+        """Get outbox depth by status"""
+        counts = await asyncio.to_thread(self._counts)
+        return {
+            "workers": len(self._tasks),
+            "waiting_requests": sum(len(waiters) for waiters in self._waiters.values()),
+            **{status.value: counts.get(status.value, 0) for status in OutboxStatus}
+        }
+
+
+# Global instance
+publish_outbox = PublishOutbox(
+    workers=settings.OUTBOX_WORKERS,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    lease_seconds=settings.OUTBOX_LEASE_SECONDS,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS
+)
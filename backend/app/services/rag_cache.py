@@ -0,0 +1,93 @@
+"""
+Query-level cache for RAG retrieval results
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+import json
+import threading
+import time
+
+
+class RetrievalCache:
+    """LRU/TTL cache of retrieval results invalidated by a write generation counter"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self._entries: "OrderedDict[Hashable, Tuple[int, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    @staticmethod
+    def make_key(
+        query: str,
+        top_k: int,
+        filters: Optional[Dict[str, Any]] = None,
+        namespace: str = ""
+    ) -> Tuple[str, str, int, str]:
+        """Build a cache key from the namespace, normalized query, top_k and filters"""
+        normalized = " ".join(query.lower().split())
+        filter_key = json.dumps(filters or {}, sort_keys=True, default=str)
+        return namespace, normalized, top_k, filter_key
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a cached value, or None on miss"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                generation, expires_at, value = entry
+                if generation == self.generation and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any, generation: int):
+        """Store a value computed while the store was at the given generation"""
+        if not self.enabled:
+            return
+        with self._lock:
+            # A write landed while this result was being computed, so it may already be stale
+            if generation != self.generation:
+                return
+            self._entries[key] = (generation, time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        """Bump the generation so every cached result is treated as stale"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
@@ -0,0 +1,139 @@
+"""
+Shared log of RAG index changes
+
+The lexical (BM25) and near-duplicate indexes live in each worker's memory,
+while the vector store is shared. Every ingest and delete appends the chunks
+it wrote or removed to a SQL table, and each worker replays the entries it has
+not applied yet before serving a retrieval, so a write handled by one worker
+reaches the indexes of all the others.
+"""
+from app.core.config import settings
+from app.core.database import get_session
+from app.models.tables import RagIndexChange
+from sqlalchemy import and_, func, or_
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+UPSERT = "upsert"
+DELETE = "delete"
+# Tells every worker to rebuild its indexes from the vector store, e.g. after a bulk restore
+REBUILD = "rebuild"
+
+# Ids are assigned at insert but rows commit in any order across processes, so recent rows are read again
+REPLAY_WINDOW_SECONDS = 30
+
+
+class IndexChange(NamedTuple):
+    """One logged change to a tenant's chunks"""
+    seq: int
+    tenant_id: str
+    operation: str
+    chunk_id: Optional[str]
+    text: Optional[str]
+    metadata: Optional[Dict[str, Any]]
+
+
+class RagIndexLog:
+    """Appends index changes and tracks how far this process has replayed them"""
+
+    def __init__(self, retention_seconds: float = 7 * 86400):
+        self.retention_seconds = retention_seconds
+        self.seq = 0
+        # Rows up to here are covered by the last rebuild and never read again
+        self.floor = 0
+        self.synced_at: Optional[datetime] = None
+        # Rows inside the replay window that were already applied
+        self._applied: Dict[int, datetime] = {}
+
+    def _append(self, tenant_id: str, changes: List[Tuple[str, Optional[str], Optional[str], Optional[Dict[str, Any]]]]):
+        now = datetime.utcnow()
+        with get_session() as session:
+            session.add_all([
+                RagIndexChange(
+                    tenant_id=tenant_id,
+                    operation=operation,
+                    chunk_id=chunk_id,
+                    text=text,
+                    chunk_metadata=metadata,
+                    created_at=now
+                )
+                for operation, chunk_id, text, metadata in changes
+            ])
+            session.query(RagIndexChange).filter(
+                RagIndexChange.created_at < now - timedelta(seconds=self.retention_seconds)
+            ).delete(synchronize_session=False)
+            session.commit()
+
+    def _latest(self) -> int:
+        with get_session() as session:
+            return session.query(func.max(RagIndexChange.id)).scalar() or 0
+
+    def _read(self, seq: int, floor: int, window_start: datetime) -> List[IndexChange]:
+        with get_session() as session:
+            rows = (
+                session.query(RagIndexChange)
+                .filter(or_(
+                    RagIndexChange.id > seq,
+                    and_(RagIndexChange.id > floor, RagIndexChange.created_at >= window_start)
+                ))
+                .order_by(RagIndexChange.id)
+                .all()
+            )
+            return [
+                IndexChange(row.id, row.tenant_id, row.operation, row.chunk_id, row.text, row.chunk_metadata)
+                for row in rows
+            ]
+
+    def request_rebuild(self):
+        """Ask every worker to rebuild its indexes from the vector store (blocking)"""
+        self._append("", [(REBUILD, None, None, None)])
+
+    async def append(
+        self,
+        tenant_id: str,
+        changes: List[Tuple[str, Optional[str], Optional[str], Optional[Dict[str, Any]]]]
+    ):
+        """Record (operation, chunk_id, text, metadata) changes for a tenant"""
+        if changes:
+            await asyncio.to_thread(self._append, tenant_id, changes)
+
+    async def reset(self, seq: Optional[int] = None):
+        """Continue replaying after ``seq``, or after the current end of the log
+
+        Call before rebuilding the indexes from the vector store, so writes
+        that land during the rebuild are still replayed.
+        """
+        self.seq = await asyncio.to_thread(self._latest) if seq is None else seq
+        self.floor = self.seq
+        self.synced_at = datetime.utcnow()
+        self._applied.clear()
+
+    async def poll(self) -> Optional[List[IndexChange]]:
+        """Get the changes not applied yet, oldest first
+
+        Returns None when this process has not polled for longer than the
+        retention period, since pruned changes would be missed; the caller
+        should rebuild its indexes from the vector store instead.
+        """
+        now = datetime.utcnow()
+        if self.synced_at is None or now - self.synced_at > timedelta(seconds=self.retention_seconds - REPLAY_WINDOW_SECONDS):
+            return None
+        window_start = now - timedelta(seconds=REPLAY_WINDOW_SECONDS)
+        changes = [
+            change for change in await asyncio.to_thread(self._read, self.seq, self.floor, window_start)
+            if change.seq not in self._applied
+        ]
+        for change in changes:
+            self._applied[change.seq] = now
+            self.seq = max(self.seq, change.seq)
+        self._applied = {seq: seen_at for seq, seen_at in self._applied.items() if seen_at >= window_start}
+        self.synced_at = now
+        return changes
+
+
+# Global instance
+rag_index_log = RagIndexLog(retention_seconds=settings.RAG_INDEX_LOG_RETENTION_SECONDS)
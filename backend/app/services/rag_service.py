@@ -3,11 +3,26 @@ RAG (Retrieval-Augmented Generation) service
 """
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from app.core.vector_store import get_vector_store, get_embeddings
-from app.models.schemas import RAGDocument
-from typing import List, Dict, Any
+from app.core.config import settings
+from app.core.vector_store import (
+    aget_vector_store,
+    build_search_kwargs,
+    build_write_kwargs,
+    find_document_chunks,
+    update_chunk_metadata,
+    run_in_vector_pool,
+    supports_native_async,
+    NATIVE_ASYNC_METHODS
+)
+from app.services.hybrid_search import BM25Index, CrossEncoderReranker, reciprocal_rank_fusion
+from app.services.rag_cache import RetrievalCache
+from app.services.dedup import MinHasher, NearDuplicateIndex, merge_chunk_metadata, release_chunk_metadata
+from app.services.rag_index_log import RagIndexLog, IndexChange, rag_index_log, UPSERT, DELETE, REBUILD
+from app.services.rag_snapshot import SnapshotRecord, iter_store_records, read_snapshot
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+import asyncio
 import logging
-from datetime import datetime
+import os
 import uuid
 
 logger = logging.getLogger(__name__)
@@ -16,66 +31,388 @@ logger = logging.getLogger(__name__)
 class RAGService:
     """Service for RAG operations"""
     
-    def __init__(self):
-        self.vector_store = None
+    def __init__(
+        self,
+        vector_store=None,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        index_log: Optional[RagIndexLog] = None
+    ):
+        self.vector_store = vector_store
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
             length_function=len
         )
+        # Per-tenant lexical indexes over chunk text, kept next to the vector store for hybrid retrieval
+        self.lexical_indexes: Dict[str, BM25Index] = {}
+        self.reranker = (
+            CrossEncoderReranker(settings.RAG_RERANK_MODEL, max_workers=settings.RAG_RERANK_WORKERS)
+            if settings.RAG_RERANK_MODEL else None
+        )
+        self.cache = RetrievalCache(
+            max_entries=settings.RAG_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.RAG_CACHE_TTL_SECONDS
+        )
+        # Per-tenant near-duplicate indexes used to skip re-embedding overlapping uploads
+        self.min_hasher = MinHasher()
+        self.dedup_indexes: Dict[str, NearDuplicateIndex] = {}
+        self.dedup_stats = {
+            "chunks_seen": 0,
+            "duplicates_skipped": 0,
+            "bytes_saved": 0,
+            "embedding_calls_avoided": 0
+        }
+        # Shared change log that keeps the local indexes of every worker in step; None keeps them local
+        self.index_log = index_log
+        self._sync_lock = asyncio.Lock()
     
-    def _get_vector_store(self):
-        """Get or initialize vector store"""
+    async def _get_vector_store(self):
+        """Get or initialize vector store without blocking the event loop"""
         if self.vector_store is None:
-            self.vector_store = get_vector_store()
+            self.vector_store = await aget_vector_store()
         return self.vector_store
     
-    async def add_document(self, content: str, metadata: Dict[str, Any] = None) -> str:
-        """Add document to vector store"""
+    async def _call_vector_store(self, method: str, *args, **kwargs):
+        """Run a vector store call on its native async client or in the bounded pool"""
+        vector_store = await self._get_vector_store()
+        if method in NATIVE_ASYNC_METHODS and supports_native_async(vector_store):
+            return await getattr(vector_store, f"a{method}")(*args, **kwargs)
+        return await run_in_vector_pool(getattr(vector_store, method), *args, **kwargs)
+    
+    async def _similarity_search(self, query: str, k: int, **kwargs) -> List[Tuple[Document, float]]:
+        """Dense search; with a native async client the query is embedded asynchronously first"""
+        vector_store = await self._get_vector_store()
+        embeddings = getattr(vector_store, "embeddings", None)
+        if supports_native_async(vector_store) and embeddings is not None:
+            vector = await embeddings.aembed_query(query)
+            return await vector_store.asimilarity_search_with_score_by_vector(vector, k=k, **kwargs)
+        return await run_in_vector_pool(vector_store.similarity_search_with_score, query, k=k, **kwargs)
+    
+    def _lexical_index(self, tenant_id: str) -> BM25Index:
+        """Get the lexical index for a tenant"""
+        if tenant_id not in self.lexical_indexes:
+            self.lexical_indexes[tenant_id] = BM25Index()
+        return self.lexical_indexes[tenant_id]
+    
+    def _dedup_index(self, tenant_id: str) -> NearDuplicateIndex:
+        """Get the near-duplicate index for a tenant"""
+        if tenant_id not in self.dedup_indexes:
+            self.dedup_indexes[tenant_id] = NearDuplicateIndex(threshold=settings.RAG_DEDUP_THRESHOLD)
+        return self.dedup_indexes[tenant_id]
+    
+    def _apply_change(self, change: IndexChange):
+        """Apply one logged chunk change to the local indexes"""
+        if change.operation == UPSERT:
+            self.index_stored_chunk(change.chunk_id, change.text or "", change.metadata or {})
+        elif change.operation == DELETE:
+            self._lexical_index(change.tenant_id).remove(change.chunk_id)
+            self._dedup_index(change.tenant_id).remove(change.chunk_id)
+    
+    async def _record_changes(self, tenant_id: str, changes: List[Tuple[str, str, Optional[str], Optional[Dict[str, Any]]]]):
+        """Log chunk changes for every worker and apply them to the local indexes"""
+        if self.index_log is not None:
+            try:
+                await self.index_log.append(tenant_id, changes)
+                await self.sync_indexes()
+                return
+            except Exception as e:
+                logger.error(f"Failed to log RAG index changes, other workers will see them after a restart: {e}")
+        for operation, chunk_id, text, metadata in changes:
+            self._apply_change(IndexChange(0, tenant_id, operation, chunk_id, text, metadata))
+    
+    async def sync_indexes(self):
+        """Replay index changes made by other workers since the last sync"""
+        if self.index_log is None:
+            return
+        async with self._sync_lock:
+            try:
+                changes = await self.index_log.poll()
+            except Exception as e:
+                logger.warning(f"Failed to read the RAG index log, using local indexes as they are: {e}")
+                return
+            if changes is None or any(change.operation == REBUILD for change in changes):
+                await self._rebuild_locked()
+                return
+            for change in changes:
+                self._apply_change(change)
+            if changes:
+                # Another worker wrote to the store, so cached results may be stale
+                self.cache.invalidate()
+    
+    async def rebuild_indexes(self) -> int:
+        """Rebuild the local lexical and near-duplicate indexes from the vector store"""
+        async with self._sync_lock:
+            return await self._rebuild_locked()
+    
+    async def _rebuild_locked(self) -> int:
+        if self.index_log is not None:
+            # Writes landing during the scan are replayed on the next sync
+            await self.index_log.reset()
+        vector_store = await self._get_vector_store()
         try:
+            lexical_indexes, dedup_indexes, count = await run_in_vector_pool(
+                lambda: self._index_records(iter_store_records(vector_store))
+            )
+        except NotImplementedError as e:
+            count = await self._rebuild_from_snapshot(e)
+        else:
+            self.lexical_indexes, self.dedup_indexes = lexical_indexes, dedup_indexes
+            logger.info(f"Rebuilt RAG lexical and near-duplicate indexes from {count} stored chunks")
+        self.cache.invalidate()
+        return count
+    
+    async def _rebuild_from_snapshot(self, reason: Exception) -> int:
+        """Fallback for stores that cannot be listed: the last snapshot plus every logged change"""
+        logger.warning(f"Cannot list the vector store, warming from the snapshot and index log instead: {reason}")
+        count = 0
+        if settings.RAG_SNAPSHOT_PATH and os.path.exists(settings.RAG_SNAPSHOT_PATH):
+            lexical_indexes, dedup_indexes, count = await run_in_vector_pool(
+                lambda: self._index_records(read_snapshot(settings.RAG_SNAPSHOT_PATH))
+            )
+            self.lexical_indexes, self.dedup_indexes = lexical_indexes, dedup_indexes
+        if self.index_log is not None:
+            # Changes since the snapshot; ones it already holds replay harmlessly
+            await self.index_log.reset(0)
+            for change in await self.index_log.poll() or []:
+                self._apply_change(change)
+        return count
+    
+    def _index_records(self, records: Iterable[SnapshotRecord]) -> Tuple[Dict[str, BM25Index], Dict[str, NearDuplicateIndex], int]:
+        """Index stored chunks into fresh indexes (blocking)"""
+        lexical_indexes: Dict[str, BM25Index] = {}
+        dedup_indexes: Dict[str, NearDuplicateIndex] = {}
+        count = 0
+        for record in records:
+            self._index_chunk(lexical_indexes, dedup_indexes, record.id, record.text, record.metadata)
+            count += 1
+        return lexical_indexes, dedup_indexes, count
+    
+    async def ingest_document(
+        self,
+        content: str,
+        metadata: Dict[str, Any] = None,
+        tenant_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Add document to vector store, skipping near-duplicate chunks, and report what was stored"""
+        try:
+            tenant_id = tenant_id or settings.RAG_DEFAULT_TENANT
+            document_id = str(uuid.uuid4())
+            
+            await self.sync_indexes()
+            
             # Split document into chunks
             documents = self.text_splitter.create_documents(
                 [content],
                 metadatas=[metadata or {}]
             )
             
-            # Add to vector store
-            vector_store = self._get_vector_store()
-            ids = [str(uuid.uuid4()) for _ in documents]
-            vector_store.add_documents(documents, ids=ids)
+            # Drop chunks that are near-duplicates of stored ones or of earlier chunks in this document
+            dedup_index = self._dedup_index(tenant_id)
+            pending_index = NearDuplicateIndex(threshold=settings.RAG_DEDUP_THRESHOLD)
+            new_documents, ids, duplicates = [], [], []
+            linked: Dict[str, Optional[Document]] = {}
+            bytes_saved = 0
+            for document in documents:
+                chunk_id = str(uuid.uuid4())
+                if settings.RAG_DEDUP_ENABLED:
+                    signature = self.min_hasher.signature(document.page_content)
+                    match = dedup_index.find_duplicate(signature)
+                    if match is not None:
+                        # Stored by an earlier document; this document is added to that chunk's metadata
+                        linked[match[0]] = self._lexical_index(tenant_id).get(match[0])
+                    else:
+                        match = pending_index.find_duplicate(signature)
+                    if match is not None:
+                        duplicates.append({"duplicate_of": match[0], "similarity": match[1]})
+                        bytes_saved += len(document.page_content.encode("utf-8"))
+                        continue
+                    # The shared index only learns about the chunk once it is stored
+                    pending_index.add(chunk_id, signature)
+                
+                document.metadata["tenant_id"] = tenant_id
+                document.metadata["document_id"] = document_id
+                document.metadata["chunk_id"] = chunk_id
+                new_documents.append(document)
+                ids.append(chunk_id)
+            
+            # Add to vector store, then link duplicates so metadata filters still find this document
+            vector_store = await self._get_vector_store()
+            if new_documents:
+                await self._call_vector_store(
+                    "add_documents",
+                    new_documents,
+                    ids=ids,
+                    **build_write_kwargs(vector_store, tenant_id)
+                )
+            changes = [(UPSERT, chunk_id, doc.page_content, doc.metadata) for chunk_id, doc in zip(ids, new_documents)]
+            for chunk_id, stored in linked.items():
+                if stored is None:
+                    continue
+                chunk_metadata = merge_chunk_metadata(stored.metadata, document_id, metadata or {})
+                await run_in_vector_pool(update_chunk_metadata, vector_store, chunk_id, chunk_metadata, tenant_id)
+                changes.append((UPSERT, chunk_id, stored.page_content, chunk_metadata))
+            # Indexing after the writes keeps a failed write from leaving signatures behind
+            await self._record_changes(tenant_id, changes)
+            self.cache.invalidate()
             
-            logger.info(f"Added {len(documents)} document chunks to vector store")
-            return ids[0]
+            self.dedup_stats["chunks_seen"] += len(documents)
+            self.dedup_stats["duplicates_skipped"] += len(duplicates)
+            self.dedup_stats["bytes_saved"] += bytes_saved
+            self.dedup_stats["embedding_calls_avoided"] += len(duplicates)
+            
+            logger.info(
+                f"Added {len(new_documents)} document chunks to vector store "
+                f"({len(duplicates)} near-duplicates skipped)"
+            )
+            return {
+                "document_id": document_id,
+                "chunks_total": len(documents),
+                "chunks_added": len(new_documents),
+                "duplicates_skipped": len(duplicates),
+                "bytes_saved": bytes_saved,
+                "embedding_calls_avoided": len(duplicates),
+                "duplicates": duplicates
+            }
         
         except Exception as e:
             logger.error(f"Error adding document to RAG: {e}")
             raise
     
-    async def search(self, query: str, top_k: int = 5) -> str:
+    def index_stored_chunk(self, chunk_id: str, text: str, metadata: Dict[str, Any]):
+        """Add a chunk that is already in the vector store to the local lexical and dedup indexes"""
+        self._index_chunk(self.lexical_indexes, self.dedup_indexes, chunk_id, text, metadata)
+    
+    def _index_chunk(
+        self,
+        lexical_indexes: Dict[str, BM25Index],
+        dedup_indexes: Dict[str, NearDuplicateIndex],
+        chunk_id: str,
+        text: str,
+        metadata: Dict[str, Any]
+    ):
+        tenant_id = metadata.get("tenant_id") or settings.RAG_DEFAULT_TENANT
+        if tenant_id not in lexical_indexes:
+            lexical_indexes[tenant_id] = BM25Index()
+        lexical_indexes[tenant_id].add(chunk_id, Document(page_content=text, metadata=metadata))
+        if settings.RAG_DEDUP_ENABLED:
+            if tenant_id not in dedup_indexes:
+                dedup_indexes[tenant_id] = NearDuplicateIndex(threshold=settings.RAG_DEDUP_THRESHOLD)
+            dedup_indexes[tenant_id].add(chunk_id, self.min_hasher.signature(text))
+    
+    async def add_document(
+        self,
+        content: str,
+        metadata: Dict[str, Any] = None,
+        tenant_id: Optional[str] = None
+    ) -> str:
+        """Add document to vector store"""
+        report = await self.ingest_document(content, metadata, tenant_id)
+        return report["document_id"]
+    
+    @staticmethod
+    def _chunk_key(document: Document) -> str:
+        """Stable key used to merge the same chunk across retrievers"""
+        return document.metadata.get("chunk_id") or document.page_content
+    
+    async def _retrieve(
+        self,
+        query: str,
+        top_k: int,
+        filters: Optional[Dict[str, Any]] = None,
+        tenant_id: Optional[str] = None
+    ) -> List[Tuple[Document, float]]:
+        """Retrieve chunks, serving repeated queries from the result cache"""
+        tenant_id = tenant_id or settings.RAG_DEFAULT_TENANT
+        await self.sync_indexes()
+        cache_key = self.cache.make_key(query, top_k, filters, namespace=tenant_id)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        generation = self.cache.generation
+        results = await self._retrieve_uncached(query, top_k, filters, tenant_id)
+        self.cache.set(cache_key, results, generation)
+        return results
+    
+    async def _retrieve_uncached(
+        self,
+        query: str,
+        top_k: int,
+        filters: Optional[Dict[str, Any]],
+        tenant_id: str
+    ) -> List[Tuple[Document, float]]:
+        """Retrieve chunks with dense search, fused with BM25 and optionally reranked"""
+        vector_store = await self._get_vector_store()
+        search_kwargs = build_search_kwargs(vector_store, tenant_id, filters)
+        if not settings.RAG_HYBRID_SEARCH and self.reranker is None:
+            return await self._similarity_search(query, top_k, **search_kwargs)
+        
+        fetch_k = top_k * max(settings.RAG_CANDIDATE_MULTIPLIER, 1)
+        candidates: Dict[str, Document] = {}
+        
+        dense_ranking = []
+        dense_results = await self._similarity_search(query, fetch_k, **search_kwargs)
+        for doc, _ in dense_results:
+            key = self._chunk_key(doc)
+            candidates.setdefault(key, doc)
+            dense_ranking.append(key)
+        rankings = [dense_ranking]
+        
+        if settings.RAG_HYBRID_SEARCH:
+            lexical_index = self._lexical_index(tenant_id)
+            lexical_ranking = []
+            for chunk_id, _ in lexical_index.search(query, k=fetch_k, filters=filters):
+                doc = lexical_index.get(chunk_id)
+                if doc is not None:
+                    candidates.setdefault(chunk_id, doc)
+                    lexical_ranking.append(chunk_id)
+            rankings.append(lexical_ranking)
+        
+        fused = reciprocal_rank_fusion(rankings, k=settings.RAG_RRF_K)
+        if self.reranker is not None:
+            return await self.reranker.rerank(
+                query,
+                [candidates[key] for key, _ in fused[:fetch_k]],
+                top_k
+            )
+        return [(candidates[key], score) for key, score in fused[:top_k]]
+    
+    async def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        tenant_id: Optional[str] = None
+    ) -> str:
         """Search for relevant documents"""
         try:
-            vector_store = self._get_vector_store()
-            results = vector_store.similarity_search(query, k=top_k)
+            results = await self._retrieve(query, top_k, filters, tenant_id)
             
             # Combine results into context
-            context = "\n\n".join([doc.page_content for doc in results])
+            context = "\n\n".join([doc.page_content for doc, _ in results])
             return context
         
         except Exception as e:
             logger.error(f"Error searching RAG: {e}")
             return ""
     
-    async def search_with_metadata(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    async def search_with_metadata(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        tenant_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """Search for relevant documents with metadata"""
         try:
-            vector_store = self._get_vector_store()
-            results = vector_store.similarity_search_with_score(query, k=top_k)
+            results = await self._retrieve(query, top_k, filters, tenant_id)
             
             documents = []
             for doc, score in results:
                 documents.append({
                     "content": doc.page_content,
-                    "metadata": doc.metadata,
+                    "metadata": {key: value for key, value in doc.metadata.items() if key != "sources"},
                     "score": float(score)
                 })
             
@@ -85,14 +422,70 @@ class RAGService:
             logger.error(f"Error searching RAG with metadata: {e}")
             return []
     
-    async def delete_document(self, document_id: str) -> bool:
+    async def _find_document_chunks(self, document_id: str, tenant_id: str) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """Find a document's chunks in the vector store, which every worker sees"""
+        vector_store = await self._get_vector_store()
+        try:
+            return await run_in_vector_pool(find_document_chunks, vector_store, document_id, tenant_id)
+        except NotImplementedError:
+            lexical_index = self._lexical_index(tenant_id)
+            chunks = {}
+            for chunk_id in lexical_index.chunk_ids_for_document(document_id):
+                document = lexical_index.get(chunk_id)
+                if document is not None:
+                    chunks[chunk_id] = (document.page_content, document.metadata)
+            return chunks
+    
+    async def delete_document(self, document_id: str, tenant_id: Optional[str] = None) -> bool:
         """Delete document from vector store"""
         try:
-            # Note: This depends on the vector store implementation
-            # Some stores may not support deletion
-            logger.warning(f"Document deletion not fully implemented for document_id: {document_id}")
+            tenant_id = tenant_id or settings.RAG_DEFAULT_TENANT
+            await self.sync_indexes()
+            chunks = await self._find_document_chunks(document_id, tenant_id)
+            if not chunks:
+                logger.warning(f"No stored chunks found for document_id: {document_id}")
+                return False
+            
+            # Chunks other documents were deduplicated into keep those documents' metadata
+            vector_store = await self._get_vector_store()
+            deleted, changes = [], []
+            for chunk_id, (text, chunk_metadata) in chunks.items():
+                remaining = release_chunk_metadata(chunk_metadata, document_id)
+                if remaining is None:
+                    deleted.append(chunk_id)
+                    changes.append((DELETE, chunk_id, None, None))
+                else:
+                    await run_in_vector_pool(update_chunk_metadata, vector_store, chunk_id, remaining, tenant_id)
+                    changes.append((UPSERT, chunk_id, text, remaining))
+            if deleted:
+                await self._call_vector_store(
+                    "delete",
+                    ids=deleted,
+                    **build_write_kwargs(vector_store, tenant_id)
+                )
+            await self._record_changes(tenant_id, changes)
+            self.cache.invalidate()
+            
+            logger.info(
+                f"Deleted {len(deleted)} chunks for document_id: {document_id} "
+                f"({len(chunks) - len(deleted)} kept for other documents)"
+            )
             return True
         except Exception as e:
             logger.error(f"Error deleting document: {e}")
             return False
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get retrieval cache statistics"""
+        return {
+            **self.cache.stats(),
+            "index_log_seq": self.index_log.seq if self.index_log is not None else None
+        }
+    
+    def get_dedup_stats(self) -> Dict[str, Any]:
+        """Get cumulative near-duplicate detection statistics"""
+        return {"enabled": settings.RAG_DEDUP_ENABLED, **self.dedup_stats}
+
 
+# Global instance
+rag_service = RAGService(index_log=rag_index_log)
@@ -0,0 +1,265 @@
+"""
+Vector index snapshot export and restore
+
+Snapshots stream every chunk's vector, text and metadata into a compact binary
+file so a corpus can be bulk-loaded into Pinecone, Qdrant or the local indexes
+without calling the embedding model again.
+
+File layout (little endian):
+    magic b"RAGSNAP1" | uint32 dimension | uint32 header length | header JSON
+    then per chunk: uint32 record length | record JSON {id, text, metadata} | float32[dimension]
+
+Usage:
+    python -m app.services.rag_snapshot export snapshots/brand.ragsnap
+    python -m app.services.rag_snapshot restore snapshots/brand.ragsnap
+"""
+from langchain.vectorstores import Pinecone, Qdrant
+from qdrant_client.models import Distance, PointStruct, VectorParams
+from app.core.config import settings
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, BinaryIO
+from datetime import datetime
+import argparse
+import json
+import logging
+import os
+import struct
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"RAGSNAP1"
+_U32 = struct.Struct("<I")
+
+
+class SnapshotRecord(NamedTuple):
+    """A stored chunk with its embedding"""
+    id: str
+    text: str
+    metadata: Dict[str, Any]
+    vector: np.ndarray
+
+
+def write_snapshot(path: str, records: Iterable[SnapshotRecord], info: Optional[Dict[str, Any]] = None) -> int:
+    """Stream records into a snapshot file and return how many were written"""
+    records = iter(records)
+    first = next(records, None)
+    dimension = len(first.vector) if first is not None else 0
+    header = json.dumps({
+        "created_at": datetime.utcnow().isoformat(),
+        **(info or {})
+    }).encode("utf-8")
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    count = 0
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(_U32.pack(dimension))
+        f.write(_U32.pack(len(header)))
+        f.write(header)
+        if first is not None:
+            for record in _chain(first, records):
+                payload = json.dumps(
+                    {"id": record.id, "text": record.text, "metadata": record.metadata},
+                    default=str
+                ).encode("utf-8")
+                vector = np.asarray(record.vector, dtype="<f4")
+                if vector.shape != (dimension,):
+                    raise ValueError(f"Record {record.id} has dimension {vector.size}, expected {dimension}")
+                f.write(_U32.pack(len(payload)))
+                f.write(payload)
+                f.write(vector.tobytes())
+                count += 1
+    # Only replace an existing snapshot once the new one is complete
+    os.replace(tmp_path, path)
+    return count
+
+
+def _chain(first: SnapshotRecord, rest: Iterator[SnapshotRecord]) -> Iterator[SnapshotRecord]:
+    yield first
+    yield from rest
+
+
+def _read_exact(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Snapshot file is truncated")
+    return data
+
+
+def read_snapshot_header(path: str) -> Tuple[int, Dict[str, Any]]:
+    """Read the dimension and header of a snapshot file"""
+    with open(path, "rb") as f:
+        return _read_header(f)
+
+
+def _read_header(f: BinaryIO) -> Tuple[int, Dict[str, Any]]:
+    if _read_exact(f, len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        raise ValueError("Not a RAG snapshot file")
+    (dimension,) = _U32.unpack(_read_exact(f, _U32.size))
+    (header_length,) = _U32.unpack(_read_exact(f, _U32.size))
+    header = json.loads(_read_exact(f, header_length))
+    return dimension, header
+
+
+def read_snapshot(path: str) -> Iterator[SnapshotRecord]:
+    """Stream records out of a snapshot file"""
+    with open(path, "rb") as f:
+        dimension, _ = _read_header(f)
+        vector_size = dimension * 4
+        while True:
+            prefix = f.read(_U32.size)
+            if not prefix:
+                return
+            (length,) = _U32.unpack(prefix)
+            payload = json.loads(_read_exact(f, length))
+            vector = np.frombuffer(_read_exact(f, vector_size), dtype="<f4")
+            yield SnapshotRecord(payload["id"], payload["text"], payload["metadata"], vector)
+
+
+def _batched(records: Iterable[SnapshotRecord], batch_size: int) -> Iterator[List[SnapshotRecord]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_store_records(store, batch_size: int = 256) -> Iterator[SnapshotRecord]:
+    """Stream every chunk with its vector out of the active vector store"""
+    if isinstance(store, Qdrant):
+        offset = None
+        while True:
+            points, offset = store.client.scroll(
+                collection_name=store.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            for point in points:
+                payload = point.payload or {}
+                vector = point.vector[store.vector_name] if store.vector_name else point.vector
+                yield SnapshotRecord(
+                    str(point.id),
+                    payload.get(store.content_payload_key, ""),
+                    payload.get(store.metadata_payload_key) or {},
+                    np.asarray(vector, dtype=np.float32)
+                )
+            if offset is None:
+                return
+
+    elif isinstance(store, Pinecone):
+        index = store._index
+        if not hasattr(index, "list"):
+            raise NotImplementedError("Listing vector ids requires a Pinecone client with Index.list support")
+        namespaces = index.describe_index_stats().get("namespaces", {}) or {"": {}}
+        for namespace in namespaces:
+            for ids in index.list(namespace=namespace):
+                for start in range(0, len(ids), batch_size):
+                    fetched = index.fetch(ids=ids[start:start + batch_size], namespace=namespace)
+                    for vector_id, vector in fetched.vectors.items():
+                        metadata = dict(vector.metadata or {})
+                        text = metadata.pop(store._text_key, "")
+                        yield SnapshotRecord(vector_id, text, metadata, np.asarray(vector.values, dtype=np.float32))
+
+    else:
+        raise NotImplementedError(f"Snapshots are not supported for {type(store).__name__}")
+
+
+def load_records_into_store(store, records: Iterable[SnapshotRecord], dimension: int, batch_size: int = 256) -> int:
+    """Bulk-load snapshot records into a vector store without re-embedding"""
+    count = 0
+    if isinstance(store, Qdrant):
+        try:
+            store.client.get_collection(store.collection_name)
+        except Exception:
+            store.client.create_collection(
+                collection_name=store.collection_name,
+                vectors_config=VectorParams(size=dimension, distance=Distance.COSINE)
+            )
+        for batch in _batched(records, batch_size):
+            store.client.upsert(
+                collection_name=store.collection_name,
+                points=[
+                    PointStruct(
+                        id=record.id,
+                        vector={store.vector_name: record.vector.tolist()} if store.vector_name else record.vector.tolist(),
+                        payload={
+                            store.content_payload_key: record.text,
+                            store.metadata_payload_key: record.metadata
+                        }
+                    )
+                    for record in batch
+                ]
+            )
+            count += len(batch)
+
+    elif isinstance(store, Pinecone):
+        from app.core.vector_store import pinecone_namespace
+        # Pinecone caps request size, so keep upserts smaller than for Qdrant
+        for batch in _batched(records, min(batch_size, 100)):
+            by_namespace: Dict[str, List[Tuple[str, List[float], Dict[str, Any]]]] = {}
+            for record in batch:
+                namespace = pinecone_namespace(record.metadata.get("tenant_id") or settings.RAG_DEFAULT_TENANT)
+                by_namespace.setdefault(namespace, []).append(
+                    (record.id, record.vector.tolist(), {**record.metadata, store._text_key: record.text})
+                )
+            for namespace, vectors in by_namespace.items():
+                store._index.upsert(vectors=vectors, namespace=namespace)
+            count += len(batch)
+
+    else:
+        raise NotImplementedError(f"Snapshots are not supported for {type(store).__name__}")
+    return count
+
+
+def export_snapshot(path: str, store=None) -> Dict[str, Any]:
+    """Export the active vector store to a snapshot file"""
+    from app.core.vector_store import get_vector_store
+    store = store or get_vector_store()
+    count = write_snapshot(path, iter_store_records(store), info={"source": type(store).__name__})
+    logger.info(f"Exported {count} chunks to snapshot {path}")
+    return {"path": path, "chunks": count, "bytes": os.path.getsize(path)}
+
+
+def restore_snapshot(path: str, store=None, rag=None) -> Dict[str, Any]:
+    """Load a snapshot into the vector store and warm the local lexical/dedup indexes"""
+    from app.core.vector_store import get_vector_store
+    from app.services.rag_service import rag_service
+    rag = rag or rag_service
+    dimension, header = read_snapshot_header(path)
+
+    def warmed(records: Iterable[SnapshotRecord]) -> Iterator[SnapshotRecord]:
+        for record in records:
+            rag.index_stored_chunk(record.id, record.text, record.metadata)
+            yield record
+
+    store = store or get_vector_store()
+    count = load_records_into_store(store, warmed(read_snapshot(path)), dimension)
+    if rag.index_log is not None:
+        # Running servers index the restored chunks too
+        rag.index_log.request_rebuild()
+    rag.cache.invalidate()
+    logger.info(f"Restored {count} chunks from snapshot {path}")
+    return {"path": path, "chunks": count, "dimension": dimension, "source": header.get("source")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or restore RAG vector index snapshots")
+    parser.add_argument("command", choices=["export", "restore"])
+    parser.add_argument("path", help="Snapshot file path")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        result = export_snapshot(args.path)
+    else:
+        result = restore_snapshot(args.path)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
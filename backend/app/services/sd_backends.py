@@ -0,0 +1,161 @@
+"""
+Stable Diffusion API backend pool with health checks and load balancing
+"""
+from app.core.config import settings
+from app.core.http_client import get_http_client
+from typing import Any, Dict, List, Optional
+import asyncio
+import httpx
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SDBackendError(Exception):
+    """Raised when no Stable Diffusion backend could serve a request"""
+
+
+class SDBackend:
+    """A single Stable Diffusion API server"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.total_requests = 0
+        self.total_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+
+    def mark_success(self):
+        self.healthy = True
+        self.consecutive_failures = 0
+
+    def mark_failure(self, error: str):
+        self.healthy = False
+        self.consecutive_failures += 1
+        self.total_failures += 1
+        self.last_error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error
+        }
+
+
+class SDBackendPool:
+    """Routes generation requests to the least busy healthy backend and retries on others"""
+
+    def __init__(
+        self,
+        urls: List[str],
+        timeout: float = 120.0,
+        max_attempts: int = 3,
+        health_check_path: str = "/internal/ping",
+        health_check_interval: float = 30.0
+    ):
+        self.backends = [SDBackend(url) for url in urls if url.strip()]
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.health_check_path = health_check_path
+        self.health_check_interval = health_check_interval
+        self._health_task: Optional[asyncio.Task] = None
+
+    def _pick(self, exclude: set) -> Optional[SDBackend]:
+        """Pick the backend with the fewest outstanding requests, preferring healthy ones"""
+        candidates = [b for b in self.backends if b.url not in exclude]
+        healthy = [b for b in candidates if b.healthy]
+        # If every backend looks down, still try one rather than failing without a request
+        pool = healthy or candidates
+        if not pool:
+            return None
+        return min(pool, key=lambda b: (b.outstanding, b.consecutive_failures))
+
+    async def post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a JSON payload to a backend, retrying on another backend on failure"""
+        client = get_http_client()
+        tried = set()
+        last_error = None
+        for _ in range(min(self.max_attempts, len(self.backends))):
+            backend = self._pick(tried)
+            if backend is None:
+                break
+            tried.add(backend.url)
+            backend.outstanding += 1
+            backend.total_requests += 1
+            try:
+                response = await client.post(f"{backend.url}{path}", json=payload, timeout=self.timeout)
+                if response.status_code < 500:
+                    # Client errors are the request's fault and would fail on every backend
+                    response.raise_for_status()
+                    backend.mark_success()
+                    return response.json()
+                backend.mark_failure(f"HTTP {response.status_code}")
+                last_error = f"{backend.url} returned HTTP {response.status_code}"
+            except httpx.HTTPStatusError:
+                raise
+            except (httpx.TransportError, ValueError) as e:
+                backend.mark_failure(str(e) or type(e).__name__)
+                last_error = f"{backend.url}: {e}"
+            finally:
+                backend.outstanding -= 1
+            logger.warning(f"Stable Diffusion backend failed, trying next: {last_error}")
+        raise SDBackendError(last_error or "No Stable Diffusion backends configured")
+
+    async def check_health(self, backend: SDBackend):
+        """Probe a backend's health endpoint"""
+        try:
+            response = await get_http_client().get(f"{backend.url}{self.health_check_path}", timeout=5.0)
+            if response.status_code < 500:
+                backend.mark_success()
+            else:
+                backend.mark_failure(f"Health check HTTP {response.status_code}")
+        except httpx.TransportError as e:
+            backend.mark_failure(f"Health check failed: {e}")
+        backend.last_checked = time.time()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.gather(*(self.check_health(b) for b in self.backends), return_exceptions=True)
+            await asyncio.sleep(self.health_check_interval)
+
+    def start(self):
+        """Start periodic health checks"""
+        if self._health_task is None and self.backends:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        """Stop periodic health checks"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Get per-backend state"""
+        return [b.to_dict() for b in self.backends]
+
+
+def create_backend_pool() -> SDBackendPool:
+    """Build the backend pool from settings"""
+    urls = settings.STABLE_DIFFUSION_API_URLS.split(",") if settings.STABLE_DIFFUSION_API_URLS else [
+        settings.STABLE_DIFFUSION_API_URL
+    ]
+    return SDBackendPool(
+        urls,
+        timeout=settings.SD_API_TIMEOUT,
+        max_attempts=settings.SD_API_MAX_ATTEMPTS,
+        health_check_path=settings.SD_HEALTH_CHECK_PATH,
+        health_check_interval=settings.SD_HEALTH_CHECK_INTERVAL
+    )
@@ -1,19 +1,62 @@
 """
 Service for social media integrations (Twitter, Instagram, LinkedIn)
+
+Instagram and LinkedIn go through the shared async HTTP client. tweepy is
+blocking, so Twitter calls run on a dedicated thread pool sized for many
+concurrent publishes. Every call passes through the per-account rate limiter,
+which queues posts until the platform has capacity and retries throttled ones.
+Uploaded media IDs are cached by image content so repeat posts skip the upload.
 """
 import tweepy
 import requests
 # LinkedIn integration requires OAuth flow
 # from linkedin import linkedin
 from app.core.config import settings
-from app.models.schemas import Platform, PostRequest, PostResponse, ContentStatus
-from typing import Optional
+from app.core.http_client import get_http_client
+from app.models.schemas import (
+    Platform,
+    PostRequest,
+    PostResponse,
+    ContentStatus,
+    PlatformPost,
+    PlatformPostResult,
+    MultiPlatformPostResponse
+)
+from app.services.image_store import image_store
+from app.services.image_renditions import best_rendition
+from app.services.platform_limits import WithResponse, is_retryable, platform_rate_limiter
+from app.services.media_cache import content_hash, media_upload_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Tuple
+import asyncio
+import hashlib
+import httpx
 import logging
+import os
+import threading
+import time
 from datetime import datetime
 import uuid
 
 logger = logging.getLogger(__name__)
 
+# Total request timeout per platform; Instagram fetches the image while creating the container
+PUBLISH_TIMEOUTS = {
+    Platform.TWITTER: settings.TWITTER_PUBLISH_TIMEOUT,
+    Platform.INSTAGRAM: settings.INSTAGRAM_PUBLISH_TIMEOUT,
+    Platform.LINKEDIN: settings.LINKEDIN_PUBLISH_TIMEOUT,
+}
+
+# Thread pool for blocking tweepy calls
+twitter_executor = ThreadPoolExecutor(
+    max_workers=settings.TWITTER_PUBLISH_WORKERS,
+    thread_name_prefix="twitter-publish"
+)
+
+
+def _timeout(platform: Platform) -> httpx.Timeout:
+    return httpx.Timeout(PUBLISH_TIMEOUTS[platform], connect=10.0)
+
 
 class SocialMediaService:
     """Service for social media integrations"""
@@ -30,13 +73,74 @@ class SocialMediaService:
                 settings.TWITTER_ACCESS_TOKEN,
                 settings.TWITTER_ACCESS_TOKEN_SECRET
             )
-            self.twitter_api = tweepy.API(self.twitter_auth)
+            self.twitter_api = tweepy.API(self.twitter_auth, timeout=settings.TWITTER_PUBLISH_TIMEOUT)
         else:
             self.twitter_api = None
+        # tweepy.API keeps the last response on the instance, so each publishing thread gets its own
+        self._twitter_local = threading.local()
         
         # Initialize LinkedIn client (requires OAuth flow - simplified for now)
         self.linkedin_enabled = bool(settings.LINKEDIN_ACCESS_TOKEN)
     
+    def _thread_twitter_api(self) -> tweepy.API:
+        """The calling thread's tweepy client"""
+        api = getattr(self._twitter_local, "api", None)
+        if api is None:
+            api = tweepy.API(self.twitter_auth, timeout=settings.TWITTER_PUBLISH_TIMEOUT)
+            self._twitter_local.api = api
+        return api
+    
+    async def _run_twitter(self, method: str, *args, **kwargs) -> WithResponse:
+        """Run a blocking tweepy call on the Twitter thread pool
+
+        tweepy returns parsed objects, so the HTTP response is read from
+        ``last_response`` for the rate limiter to see its headers. Each thread
+        calls through its own client so concurrent calls can't overwrite it.
+        """
+        def call():
+            api = self._thread_twitter_api()
+            result = getattr(api, method)(*args, **kwargs)
+            return WithResponse(result, getattr(api, "last_response", None))
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(twitter_executor, call)
+    
+    def _account(self, platform: Platform) -> str:
+        """Rate limit key for the configured account on a platform"""
+        if platform == Platform.TWITTER:
+            # Access tokens start with the numeric user id
+            return settings.TWITTER_ACCESS_TOKEN.split("-", 1)[0]
+        if platform == Platform.INSTAGRAM:
+            return settings.INSTAGRAM_APP_ID
+        if platform == Platform.LINKEDIN:
+            return settings.LINKEDIN_CLIENT_ID
+        return "default"
+    
+    def _public_url(self, url: str) -> str:
+        """Make a stored image URL fetchable by the platform"""
+        if settings.MEDIA_BASE_URL and url.startswith("/"):
+            return f"{settings.MEDIA_BASE_URL.rstrip('/')}{url}"
+        return url
+    
+    async def _twitter_media(self, path: str, key: str) -> Tuple[str, bool]:
+        """Get a media ID for a file, uploading it unless a valid one is cached; returns (media_id, cached)"""
+        account = self._account(Platform.TWITTER)
+        media_id = await media_upload_cache.get(Platform.TWITTER, account, key)
+        if media_id is not None:
+            return media_id, True
+        
+        chunked = os.path.isfile(path) and os.path.getsize(path) > settings.TWITTER_CHUNKED_UPLOAD_BYTES
+        # Uploads have their own, larger limit, so they take no publishing tokens
+        media = await platform_rate_limiter.call(
+            Platform.TWITTER,
+            account,
+            lambda: self._run_twitter("media_upload", path, chunked=chunked, media_category="tweet_image"),
+            cost=0
+        )
+        ttl = getattr(media, "expires_after_secs", None) or settings.TWITTER_MEDIA_TTL
+        await media_upload_cache.set(Platform.TWITTER, account, key, str(media.media_id), ttl)
+        return str(media.media_id), False
+    
     async def post_to_twitter(self, content: str, image_url: Optional[str] = None) -> PostResponse:
         """Post to Twitter"""
         if not self.twitter_api:
@@ -45,15 +149,32 @@ class SocialMediaService:
         try:
             # Upload image if provided
             media_ids = None
+            cached = False
             if image_url:
-                media = self.twitter_api.media_upload(image_url)
-                media_ids = [media.media_id]
+                rendition = await best_rendition(image_store, image_url, Platform.TWITTER)
+                path = rendition["path"] if rendition else image_url
+                key = await asyncio.to_thread(content_hash, path)
+                media_id, cached = await self._twitter_media(path, key)
+                media_ids = [media_id]
             
             # Post tweet
-            tweet = self.twitter_api.update_status(
-                status=content,
-                media_ids=media_ids
-            )
+            try:
+                tweet = await platform_rate_limiter.call(
+                    Platform.TWITTER,
+                    self._account(Platform.TWITTER),
+                    lambda: self._run_twitter("update_status", status=content, media_ids=media_ids)
+                )
+            except tweepy.BadRequest:
+                if not cached:
+                    raise
+                # The cached media ID was rejected, e.g. expired early; upload again once
+                await media_upload_cache.invalidate(Platform.TWITTER, self._account(Platform.TWITTER), key)
+                media_ids = [(await self._twitter_media(path, key))[0]]
+                tweet = await platform_rate_limiter.call(
+                    Platform.TWITTER,
+                    self._account(Platform.TWITTER),
+                    lambda: self._run_twitter("update_status", status=content, media_ids=media_ids)
+                )
             
             return PostResponse(
                 id=str(uuid.uuid4()),
@@ -70,7 +191,8 @@ class SocialMediaService:
                 content_id="",
                 platform=Platform.TWITTER,
                 status=ContentStatus.FAILED,
-                error=str(e)
+                error=str(e),
+                retryable=is_retryable(e)
             )
     
     async def post_to_instagram(self, caption: str, image_url: str) -> PostResponse:
@@ -79,20 +201,40 @@ class SocialMediaService:
             raise Exception("Instagram API not configured")
         
         try:
-            # Instagram requires Graph API
-            # Step 1: Create media container
-            url = f"https://graph.instagram.com/v18.0/{settings.INSTAGRAM_APP_ID}/media"
-            
-            payload = {
-                "caption": caption,
-                "image_url": image_url,
-                "access_token": settings.INSTAGRAM_ACCESS_TOKEN
-            }
+            rendition = await best_rendition(image_store, image_url, Platform.INSTAGRAM)
+            source = rendition["path"] if rendition else image_url
+            if rendition:
+                image_url = self._public_url(rendition["url"])
             
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
+            client = get_http_client()
+            account = self._account(Platform.INSTAGRAM)
+            # Containers hold the caption and are single-use, so one is only reused when publishing it failed
+            image_hash = await asyncio.to_thread(content_hash, source)
+            key = hashlib.sha256(f"{image_hash}:{caption}".encode("utf-8")).hexdigest()
+            creation_id = await media_upload_cache.get(Platform.INSTAGRAM, account, key)
             
-            creation_id = response.json().get("id")
+            if creation_id is None:
+                # Instagram requires Graph API
+                # Step 1: Create media container
+                url = f"https://graph.instagram.com/v18.0/{settings.INSTAGRAM_APP_ID}/media"
+                
+                payload = {
+                    "caption": caption,
+                    "image_url": image_url,
+                    "access_token": settings.INSTAGRAM_ACCESS_TOKEN
+                }
+                
+                # Only published posts count against the Instagram publishing limit
+                response = await platform_rate_limiter.call(
+                    Platform.INSTAGRAM,
+                    account,
+                    lambda: client.post(url, json=payload, timeout=_timeout(Platform.INSTAGRAM)),
+                    cost=0
+                )
+                response.raise_for_status()
+                
+                creation_id = response.json().get("id")
+                await media_upload_cache.set(Platform.INSTAGRAM, account, key, creation_id, settings.INSTAGRAM_CONTAINER_TTL)
             
             # Step 2: Publish the media
             publish_url = f"https://graph.instagram.com/v18.0/{settings.INSTAGRAM_APP_ID}/media_publish"
@@ -101,7 +243,14 @@ class SocialMediaService:
                 "access_token": settings.INSTAGRAM_ACCESS_TOKEN
             }
             
-            publish_response = requests.post(publish_url, json=publish_payload)
+            publish_response = await platform_rate_limiter.call(
+                Platform.INSTAGRAM,
+                account,
+                lambda: client.post(publish_url, json=publish_payload, timeout=_timeout(Platform.INSTAGRAM))
+            )
+            if publish_response.is_success or publish_response.status_code == 400:
+                # Published containers cannot be reused, and a rejected one is likely expired
+                await media_upload_cache.invalidate(Platform.INSTAGRAM, account, key)
             publish_response.raise_for_status()
             
             post_id = publish_response.json().get("id")
@@ -121,7 +270,8 @@ class SocialMediaService:
                 content_id="",
                 platform=Platform.INSTAGRAM,
                 status=ContentStatus.FAILED,
-                error=str(e)
+                error=str(e),
+                retryable=is_retryable(e)
             )
     
     async def post_to_linkedin(self, content: str, image_url: Optional[str] = None) -> PostResponse:
@@ -158,7 +308,11 @@ class SocialMediaService:
                 }
             }
             
-            response = requests.post(url, headers=headers, json=payload)
+            response = await platform_rate_limiter.call(
+                Platform.LINKEDIN,
+                self._account(Platform.LINKEDIN),
+                lambda: get_http_client().post(url, headers=headers, json=payload, timeout=_timeout(Platform.LINKEDIN))
+            )
             response.raise_for_status()
             
             result = response.json()
@@ -179,7 +333,8 @@ class SocialMediaService:
                 content_id="",
                 platform=Platform.LINKEDIN,
                 status=ContentStatus.FAILED,
-                error=str(e)
+                error=str(e),
+                retryable=is_retryable(e)
             )
     
     async def post(self, request: PostRequest, content: str) -> PostResponse:
@@ -198,6 +353,63 @@ class SocialMediaService:
         except Exception as e:
             logger.error(f"Error posting to {request.platform}: {e}")
             raise
+    
+    async def _post_direct(self, content_id: str, post: PlatformPost) -> PostResponse:
+        return await self.post(
+            PostRequest(content_id=content_id, platform=post.platform, image_url=post.image_url),
+            post.content
+        )
+    
+    async def _post_timed(
+        self,
+        content_id: str,
+        post: PlatformPost,
+        publish: Callable[[str, PlatformPost], Awaitable[PostResponse]]
+    ) -> PlatformPostResult:
+        """Publish to one platform, turning errors into a failed result"""
+        started = time.perf_counter()
+        try:
+            response = await publish(content_id, post)
+        except Exception as e:
+            response = PostResponse(
+                id=str(uuid.uuid4()),
+                platform=post.platform,
+                status=ContentStatus.FAILED,
+                error=str(e),
+                retryable=is_retryable(e)
+            )
+        return PlatformPostResult(
+            **response.model_dump(exclude={"content_id"}),
+            content_id=content_id,
+            duration_seconds=time.perf_counter() - started
+        )
+    
+    async def post_many(
+        self,
+        content_id: str,
+        posts: List[PlatformPost],
+        publish: Optional[Callable[[str, PlatformPost], Awaitable[PostResponse]]] = None
+    ) -> MultiPlatformPostResponse:
+        """Publish to every platform concurrently; one platform failing does not affect the others
+
+        ``publish`` replaces the direct platform call, e.g. to go through the outbox.
+        """
+        started = time.perf_counter()
+        publish = publish or self._post_direct
+        results = await asyncio.gather(*(self._post_timed(content_id, post, publish) for post in posts))
+        published = sum(result.status == ContentStatus.PUBLISHED for result in results)
+        if published == len(results):
+            status = "published"
+        elif published:
+            status = "partial"
+        else:
+            status = "failed"
+        return MultiPlatformPostResponse(
+            content_id=content_id,
+            status=status,
+            results=list(results),
+            duration_seconds=time.perf_counter() - started
+        )
 
 
 # Global instance
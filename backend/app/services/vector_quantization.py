@@ -0,0 +1,101 @@
+"""
+Memory and recall report for quantized vector storage
+"""
+from langchain.vectorstores import Qdrant
+from qdrant_client.models import SearchParams, QuantizationSearchParams
+from app.core.config import settings
+from typing import Any, Dict, List
+import time
+import numpy as np
+
+FLOAT32_BYTES = 4
+
+
+def estimate_vector_memory(num_vectors: int, dimension: int, mode: str, compression: str = "x16") -> Dict[str, Any]:
+    """Estimate RAM used by vectors for a quantization mode against the float32 baseline"""
+    float_bytes = num_vectors * dimension * FLOAT32_BYTES
+    if mode == "int8":
+        quantized_bytes = num_vectors * dimension
+    elif mode == "pq":
+        quantized_bytes = float_bytes // int(compression.lstrip("x"))
+    else:
+        quantized_bytes = float_bytes
+    return {
+        "num_vectors": num_vectors,
+        "dimension": dimension,
+        "float32_bytes": float_bytes,
+        "quantized_ram_bytes": quantized_bytes,
+        "ram_saved_bytes": float_bytes - quantized_bytes,
+        "compression_ratio": float_bytes / quantized_bytes if quantized_bytes else 0.0
+    }
+
+
+def _search_ids(store: Qdrant, vector: List[float], k: int, params: SearchParams) -> List[str]:
+    hits = store.client.search(
+        collection_name=store.collection_name,
+        query_vector=(store.vector_name, vector) if store.vector_name else vector,
+        limit=k,
+        search_params=params,
+        with_payload=False
+    )
+    return [str(hit.id) for hit in hits]
+
+
+def evaluate_quantization(store: Qdrant, sample_size: int = 100, k: int = 10) -> Dict[str, Any]:
+    """Compare quantized search (with and without rescoring) against exact float search"""
+    if not isinstance(store, Qdrant):
+        raise NotImplementedError("Quantization reports are only available for the Qdrant store")
+
+    points, _ = store.client.scroll(
+        collection_name=store.collection_name,
+        limit=sample_size,
+        with_payload=False,
+        with_vectors=True
+    )
+    queries = [point.vector[store.vector_name] if store.vector_name else point.vector for point in points]
+    num_vectors = store.client.count(store.collection_name, exact=True).count
+    dimension = len(queries[0]) if queries else 0
+
+    modes = {
+        "exact_float": SearchParams(exact=True),
+        "quantized": SearchParams(quantization=QuantizationSearchParams(rescore=False)),
+        "quantized_rescored": SearchParams(
+            quantization=QuantizationSearchParams(
+                rescore=True,
+                oversampling=settings.QDRANT_QUANTIZATION_OVERSAMPLING
+            )
+        ),
+    }
+    results: Dict[str, List[List[str]]] = {name: [] for name in modes}
+    latencies: Dict[str, List[float]] = {name: [] for name in modes}
+    for vector in queries:
+        for name, params in modes.items():
+            start = time.perf_counter()
+            results[name].append(_search_ids(store, vector, k, params))
+            latencies[name].append((time.perf_counter() - start) * 1000)
+
+    report = {}
+    for name in modes:
+        recalls = [
+            len(set(approx) & set(exact)) / len(exact)
+            for approx, exact in zip(results[name], results["exact_float"])
+            if exact
+        ]
+        recall = float(np.mean(recalls)) if recalls else 0.0
+        report[name] = {
+            f"recall@{k}": recall,
+            "recall_lost": 1.0 - recall,
+            "latency_ms_p50": float(np.percentile(latencies[name], 50)) if latencies[name] else 0.0
+        }
+
+    return {
+        "mode": settings.QDRANT_QUANTIZATION or "none",
+        "sample_size": len(queries),
+        "memory": estimate_vector_memory(
+            num_vectors,
+            dimension,
+            settings.QDRANT_QUANTIZATION.lower(),
+            settings.QDRANT_PQ_COMPRESSION
+        ),
+        "search": report
+    }
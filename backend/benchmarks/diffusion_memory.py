@@ -0,0 +1,121 @@
+"""
+Memory and latency benchmark for the local diffusion pipeline options
+
+Each configuration runs in a fresh spawned process, because peak RSS never
+goes down within a process. Reports load time, peak RSS after loading, the
+latency of one generation and the peak RSS after it, plus how many UNet
+layers were quantized to int8. A configuration whose process dies, e.g. when
+it is killed for running out of memory, is reported as an error.
+
+Usage (from the backend directory):
+    python -m benchmarks.diffusion_memory
+    python -m benchmarks.diffusion_memory --steps 20 --configs default lean lean-bf16 lean-int8
+"""
+from app.services.diffusion_worker import load_pipeline, peak_rss_mb, quantized_layer_count, _run_batch
+from typing import Any, Dict
+import argparse
+import json
+import multiprocessing
+import queue
+import time
+
+CONFIGS: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    "no-safety": {"safety_checker": False},
+    "lean": {"lean": True, "safety_checker": False},
+    "lean-bf16": {"lean": True, "safety_checker": False, "unet_precision": "bfloat16"},
+    "lean-int8": {"lean": True, "safety_checker": False, "unet_precision": "int8"},
+}
+
+
+def measure(model_id: str, options: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    """Load the pipeline with the given options and time one generation"""
+    start = time.perf_counter()
+    pipeline, device = load_pipeline(model_id, **options)
+    load_seconds = time.perf_counter() - start
+    load_rss = peak_rss_mb()
+
+    start = time.perf_counter()
+    _run_batch(pipeline, [params])
+    return {
+        "device": device,
+        "load_seconds": load_seconds,
+        "load_peak_rss_mb": load_rss,
+        "int8_layers": quantized_layer_count(pipeline.unet),
+        "generate_seconds": time.perf_counter() - start,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def _child(model_id: str, options: Dict[str, Any], params: Dict[str, Any], results):
+    try:
+        results.put(measure(model_id, options, params))
+    except Exception as e:
+        results.put({"error": str(e)})
+
+
+def _collect(process, results, timeout: float) -> Dict[str, Any]:
+    """Wait for the child's result without hanging if it dies before reporting"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            try:
+                # The result may still be in the pipe after the child exited
+                return results.get(timeout=1)
+            except queue.Empty:
+                return {"error": f"process exited with code {process.exitcode} without a result (out of memory?)"}
+        if time.monotonic() > deadline:
+            process.terminate()
+            return {"error": f"no result after {timeout:.0f}s"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark memory and latency of local diffusion options")
+    parser.add_argument("--model", default="runwayml/stable-diffusion-v1-5")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=3600, help="Seconds to wait for each configuration")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    params = {
+        "prompt": "A product photo of a ceramic coffee mug, studio lighting",
+        "negative_prompt": "blurry, low quality",
+        "width": args.width,
+        "height": args.height,
+        "num_images": 1,
+        "steps": args.steps,
+        "guidance_scale": 7.5,
+        "seed": 0
+    }
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for name in args.configs:
+        child_results = context.Queue()
+        process = context.Process(target=_child, args=(args.model, CONFIGS[name], params, child_results))
+        process.start()
+        result = {"config": name, "options": CONFIGS[name], **_collect(process, child_results, args.timeout)}
+        process.join()
+        results.append(result)
+        if "error" in result:
+            print(f"{name:<10} error: {result['error']}")
+            continue
+        print(
+            f"{name:<10} load={result['load_seconds']:.1f}s load_rss={result['load_peak_rss_mb']}MiB "
+            f"generate={result['generate_seconds']:.1f}s peak_rss={result['peak_rss_mb']}MiB "
+            f"int8_layers={result['int8_layers']}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Throughput benchmark for batched local image generation
+
+Compares the old per-image loop (one pipeline call per image, one request at a
+time) against the worker's batched denoising, where concurrent requests with
+the same size and steps share one forward pass. Reports images per minute.
+
+Usage (from the backend directory):
+    python -m benchmarks.image_batching
+    python -m benchmarks.image_batching --requests 8 --num-images 1 --batch-sizes 1 2 4 8 --steps 20
+"""
+from app.services.diffusion_worker import load_pipeline, _run_batch
+from typing import Any, Dict, List
+import argparse
+import json
+import time
+
+
+def make_requests(count: int, num_images: int, width: int, height: int, steps: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "prompt": f"A product photo of a ceramic coffee mug, studio lighting, variation {i}",
+            "negative_prompt": "blurry, low quality",
+            "width": width,
+            "height": height,
+            "num_images": num_images,
+            "steps": steps,
+            "guidance_scale": 7.5,
+            "seed": i
+        }
+        for i in range(count)
+    ]
+
+
+def run_loop(pipeline, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Previous behaviour: one pipeline call per image"""
+    start = time.perf_counter()
+    images = 0
+    for params in requests:
+        for _ in range(params["num_images"]):
+            pipeline(
+                prompt=params["prompt"],
+                negative_prompt=params["negative_prompt"],
+                width=params["width"],
+                height=params["height"],
+                num_inference_steps=params["steps"],
+                guidance_scale=params["guidance_scale"]
+            )
+            images += 1
+    seconds = time.perf_counter() - start
+    return {"mode": "loop", "batch_images": 1, "images": images, "seconds": seconds}
+
+
+def run_batched(pipeline, requests: List[Dict[str, Any]], max_batch_images: int) -> Dict[str, Any]:
+    """Group requests into micro-batches the way the worker does"""
+    batches, current, current_images = [], [], 0
+    for params in requests:
+        if current and current_images + params["num_images"] > max_batch_images:
+            batches.append(current)
+            current, current_images = [], 0
+        current.append(params)
+        current_images += params["num_images"]
+    if current:
+        batches.append(current)
+
+    start = time.perf_counter()
+    images = sum(len(outputs) for batch in batches for outputs in _run_batch(pipeline, batch))
+    seconds = time.perf_counter() - start
+    return {"mode": "batched", "batch_images": max_batch_images, "images": images, "seconds": seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark looped vs batched local image generation")
+    parser.add_argument("--model", default="runwayml/stable-diffusion-v1-5")
+    parser.add_argument("--requests", type=int, default=4, help="Concurrent requests to simulate")
+    parser.add_argument("--num-images", type=int, default=1, help="Images per request")
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[2, 4], help="Max images per batch")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    pipeline, device = load_pipeline(args.model)
+    requests = make_requests(args.requests, args.num_images, args.width, args.height, args.steps)
+    # Warm up kernels and allocator so the first configuration is not penalised
+    run_loop(pipeline, make_requests(1, 1, args.width, args.height, 1))
+
+    results = [run_loop(pipeline, requests)]
+    results.extend(run_batched(pipeline, requests, size) for size in args.batch_sizes)
+    for result in results:
+        result["device"] = device
+        result["images_per_minute"] = result["images"] * 60 / result["seconds"] if result["seconds"] else 0.0
+        print(
+            f"{result['mode']:<8} batch={result['batch_images']:<3} images={result['images']:<4} "
+            f"seconds={result['seconds']:.1f} images/min={result['images_per_minute']:.2f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
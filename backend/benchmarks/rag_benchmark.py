@@ -0,0 +1,252 @@
+"""
+Retrieval quality and latency benchmark for the RAG pipeline
+
+Ingests a labeled corpus through RAGService into an in-memory Qdrant store and
+reports recall@k, MRR, ingest throughput and query latency percentiles for every
+combination of chunking, embedding model and retrieval mode. Runs fully offline:
+use local sentence-transformers models or the built-in hashing embeddings.
+
+Usage (from the backend directory):
+    python -m benchmarks.rag_benchmark
+    python -m benchmarks.rag_benchmark --chunking 500:100 1000:200 2000:400 \\
+        --embeddings hashing sentence-transformers/all-MiniLM-L6-v2 --modes dense hybrid
+    python -m benchmarks.rag_benchmark --corpus corpus.jsonl --queries queries.jsonl
+
+Corpus files are JSONL with {"id", "text"}; query files are JSONL with
+{"query", "relevant_ids": [...]}.
+"""
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import Qdrant
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams
+from app.core.config import settings
+from app.core.embedding_engine import BatchingEmbeddings
+from app.services.rag_service import RAGService
+from app.services.rag_cache import RetrievalCache
+from typing import Any, Dict, List, Tuple
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import numpy as np
+
+FILLER_SENTENCES = [
+    "Our team believes great content starts with listening to the community.",
+    "Consistency across channels builds trust with customers over time.",
+    "We publish updates every week and share behind-the-scenes stories.",
+    "Engagement rises when posts ask a clear question at the end.",
+    "Visual storytelling helps audiences remember the message.",
+    "Customer feedback shapes every product roadmap decision we make.",
+    "Seasonal campaigns perform best when planned a month in advance.",
+    "Short videos drive more shares than static images on most platforms.",
+    "Our brand voice is friendly, confident and never pushy.",
+    "Every launch is supported by a coordinated email and social push.",
+]
+TOPICS = [
+    "hiking boots", "espresso machines", "yoga mats", "wireless earbuds", "running shoes",
+    "camping tents", "smart watches", "water bottles", "desk lamps", "travel backpacks",
+    "skincare serums", "kitchen knives", "gaming chairs", "electric bikes", "rain jackets",
+]
+FEATURES = [
+    "recycled materials", "a lifetime warranty", "carbon neutral shipping", "a two year battery",
+    "hand stitched seams", "ceramic coating", "modular parts", "ultralight frames",
+    "noise cancellation", "solar charging", "organic cotton", "waterproof zippers",
+]
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words hashing embeddings for dependency-free offline runs"""
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimension
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def generate_corpus(num_documents: int, seed: int = 7) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Generate a synthetic brand corpus with one exact-term and one semantic query per document"""
+    rng = random.Random(seed)
+    corpus, queries = [], []
+    for i in range(num_documents):
+        brand = "".join(rng.choice("bcdfghklmnprstvz") + rng.choice("aeiou") for _ in range(3)).capitalize()
+        sku = f"{rng.choice('ABCDEFGHJK')}{rng.choice('LMNPQRSTUV')}-{rng.randint(1000, 9999)}"
+        topic = rng.choice(TOPICS)
+        feature = rng.choice(FEATURES)
+        fact = (
+            f"The {brand} {topic} (SKU {sku}) are made with {feature} "
+            f"and launch with the hashtag #{brand}{topic.split()[0].capitalize()}."
+        )
+        paragraphs = [" ".join(rng.sample(FILLER_SENTENCES, 4)) for _ in range(rng.randint(4, 10))]
+        paragraphs.insert(rng.randint(0, len(paragraphs)), fact)
+        doc_id = f"doc-{i}"
+        corpus.append({"id": doc_id, "text": "\n\n".join(paragraphs)})
+        queries.append({"query": f"Which product has SKU {sku}?", "relevant_ids": [doc_id], "kind": "exact"})
+        queries.append({"query": f"{brand} {topic} with {feature}", "relevant_ids": [doc_id], "kind": "semantic"})
+    return corpus, queries
+
+
+def load_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_embeddings(name: str) -> Embeddings:
+    """Create a local embedding model by name"""
+    if name == "hashing":
+        return HashingEmbeddings()
+    if name.startswith("batched:"):
+        return BatchingEmbeddings(name.split(":", 1)[1])
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=name)
+
+
+def build_store(embeddings: Embeddings, collection_name: str) -> Qdrant:
+    """Create an in-memory Qdrant store sized for the embedding model"""
+    dimension = len(embeddings.embed_query("dimension probe"))
+    client = QdrantClient(location=":memory:")
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(size=dimension, distance=Distance.COSINE)
+    )
+    return Qdrant(client=client, collection_name=collection_name, embeddings=embeddings)
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+async def run_configuration(
+    corpus: List[Dict[str, Any]],
+    queries: List[Dict[str, Any]],
+    embeddings: Embeddings,
+    chunk_size: int,
+    chunk_overlap: int,
+    mode: str,
+    k: int
+) -> Dict[str, Any]:
+    """Ingest the corpus and evaluate every query for one configuration"""
+    settings.RAG_HYBRID_SEARCH = mode == "hybrid"
+    settings.RAG_DEDUP_ENABLED = False
+    rag = RAGService(
+        vector_store=build_store(embeddings, "benchmark"),
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+    rag.reranker = None
+    # Measure the retrieval path itself, not the result cache
+    rag.cache = RetrievalCache(max_entries=0)
+
+    chunks = 0
+    start = time.perf_counter()
+    for doc in corpus:
+        report = await rag.ingest_document(doc["text"], metadata={"source_id": doc["id"]})
+        chunks += report["chunks_added"]
+    ingest_seconds = time.perf_counter() - start
+
+    latencies, hits, reciprocal_ranks = [], 0, []
+    for query in queries:
+        start = time.perf_counter()
+        results = await rag.search_with_metadata(query["query"], top_k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        relevant = set(query["relevant_ids"])
+        rank = next(
+            (i + 1 for i, result in enumerate(results) if result["metadata"].get("source_id") in relevant),
+            None
+        )
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    return {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "mode": mode,
+        "chunks": chunks,
+        f"recall@{k}": hits / len(queries) if queries else 0.0,
+        "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0,
+        "ingest_chunks_per_second": chunks / ingest_seconds if ingest_seconds else 0.0,
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p95": percentile(latencies, 95),
+        "latency_ms_p99": percentile(latencies, 99),
+    }
+
+
+async def run_benchmark(args) -> List[Dict[str, Any]]:
+    if args.corpus:
+        corpus = load_jsonl(args.corpus)
+        queries = load_jsonl(args.queries)
+    else:
+        corpus, queries = generate_corpus(args.documents, seed=args.seed)
+
+    results = []
+    for embedding_name in args.embeddings:
+        embeddings = build_embeddings(embedding_name)
+        for chunking in args.chunking:
+            chunk_size, chunk_overlap = (int(value) for value in chunking.split(":"))
+            for mode in args.modes:
+                result = await run_configuration(
+                    corpus, queries, embeddings, chunk_size, chunk_overlap, mode, args.k
+                )
+                result["embeddings"] = embedding_name
+                results.append(result)
+                print_row(result, args.k)
+        if isinstance(embeddings, BatchingEmbeddings):
+            embeddings.close()
+    return results
+
+
+def print_row(result: Dict[str, Any], k: int):
+    print(
+        f"{result['embeddings'][:40]:<40} {result['chunk_size']:>5}:{result['chunk_overlap']:<4} "
+        f"{result['mode']:<7} chunks={result['chunks']:<6} "
+        f"recall@{k}={result[f'recall@{k}']:.3f} mrr={result['mrr']:.3f} "
+        f"ingest={result['ingest_chunks_per_second']:.1f}/s "
+        f"p50={result['latency_ms_p50']:.1f}ms p95={result['latency_ms_p95']:.1f}ms "
+        f"p99={result['latency_ms_p99']:.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG retrieval quality and latency")
+    parser.add_argument("--corpus", help="JSONL corpus file with id and text")
+    parser.add_argument("--queries", help="JSONL query file with query and relevant_ids")
+    parser.add_argument("--documents", type=int, default=200, help="Synthetic corpus size")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--k", type=int, default=3, help="Cutoff for recall@k and MRR")
+    parser.add_argument("--chunking", nargs="+", default=["1000:200"], help="chunk_size:chunk_overlap pairs")
+    parser.add_argument(
+        "--embeddings",
+        nargs="+",
+        default=["hashing"],
+        help="'hashing', local sentence-transformers model names, or 'batched:<model>' for the process pool engine"
+    )
+    parser.add_argument("--modes", nargs="+", default=["dense", "hybrid"], choices=["dense", "hybrid"])
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    if args.corpus and not args.queries:
+        parser.error("--queries is required with --corpus")
+
+    results = asyncio.run(run_benchmark(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
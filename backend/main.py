@@ -21,9 +21,18 @@ from app.routers import (
 from app.core.config import settings
 from app.core.database import init_db
 from app.core.scheduler import init_scheduler
+from app.core.http_client import init_http_client, close_http_client
+from app.core.vector_store import aget_vector_store, close_vector_store
+from app.services.rag_service import rag_service
+from app.services.image_generator import image_generator
+from app.services.image_jobs import image_job_service
+from app.services.image_analysis import image_analysis_service
+from app.services.image_store import image_store
+from app.services.publish_outbox import publish_outbox
 from app.core.logging_config import setup_logging
 from app.core.middleware import LoggingMiddleware, SecurityHeadersMiddleware
 from app.core.rate_limit import RateLimitMiddleware
+from app.core.media import MediaMiddleware
 from app.core.exceptions import (
     http_exception_handler,
     validation_exception_handler,
@@ -43,15 +52,37 @@ async def lifespan(app: FastAPI):
     try:
         await init_db()
         init_scheduler()
+        init_http_client()
+        image_generator.start()
+        await image_job_service.resume()
+        publish_outbox.start()
         logger.info("Application started successfully!")
     except Exception as e:
         logger.error(f"Failed to start application: {e}")
         raise
     
+    # Warm up the vector store off the event loop so no request pays for it
+    try:
+        await aget_vector_store()
+    except Exception as e:
+        logger.warning(f"Vector store unavailable at startup, RAG will retry on first use: {e}")
+    
+    # Rebuild the in-memory lexical and dedup indexes from the chunks in the vector store
+    try:
+        await rag_service.rebuild_indexes()
+    except Exception as e:
+        logger.warning(f"Failed to rebuild RAG indexes from the vector store: {e}")
+    
     yield
     
     # Shutdown
     logger.info("Shutting down...")
+    await publish_outbox.stop()
+    await image_job_service.stop()
+    await image_generator.stop()
+    image_analysis_service.close()
+    await close_vector_store()
+    await close_http_client()
 
 
 # Initialize FastAPI app
@@ -81,6 +112,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Stored images, added last so it runs before the middleware above
+app.add_middleware(
+    MediaMiddleware,
+    prefix=image_store.url_prefix,
+    directory=image_store.root,
+    max_age=settings.MEDIA_CACHE_MAX_AGE,
+    accel_redirect_prefix=settings.MEDIA_ACCEL_REDIRECT_PREFIX
+)
+
 # Exception handlers
 app.add_exception_handler(StarletteHTTPException, http_exception_handler)
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
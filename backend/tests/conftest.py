@@ -0,0 +1,24 @@
+"""
+Shared pytest setup for the backend tests
+"""
+import os
+import sys
+import pytest
+
+# Run from the repository root or the backend directory alike
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def sql_db(tmp_path, monkeypatch):
+    """A fresh SQLite database for the job and queue tables"""
+    from app.core import database
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "DATABASE_URL", "")
+    monkeypatch.setattr(settings, "LOCAL_DATABASE_URL", f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setattr(database, "engine", None)
+    monkeypatch.setattr(database, "SessionLocal", None)
+    engine = database.init_sql_db()
+    yield engine
+    engine.dispose()
@@ -0,0 +1,81 @@
+"""
+Tests for MinHash near-duplicate detection and shared chunk metadata
+"""
+import json
+import pytest
+from app.services.dedup import (
+    MinHasher,
+    NearDuplicateIndex,
+    estimate_jaccard,
+    merge_chunk_metadata,
+    release_chunk_metadata
+)
+
+TEXT = (
+    "Our summer collection features lightweight linen shirts, breathable cotton shorts "
+    "and sandals made from recycled materials, available in stores and online from June."
+)
+NEAR_DUPLICATE = TEXT.replace("from June.", "from June!").replace("Our", "The")
+UNRELATED = "Quarterly earnings rose eight percent on strong subscription growth in Europe and Asia."
+
+
+@pytest.fixture
+def hasher():
+    return MinHasher(num_perm=128)
+
+
+def test_signatures_estimate_similarity(hasher):
+    original = hasher.signature(TEXT)
+    assert estimate_jaccard(original, hasher.signature(TEXT)) == 1.0
+    assert estimate_jaccard(original, hasher.signature(NEAR_DUPLICATE)) > 0.7
+    assert estimate_jaccard(original, hasher.signature(UNRELATED)) < 0.1
+
+
+def test_signatures_are_deterministic_across_instances():
+    assert (MinHasher(seed=1).signature(TEXT) == MinHasher(seed=1).signature(TEXT)).all()
+
+
+def test_index_finds_near_duplicates_above_threshold(hasher):
+    index = NearDuplicateIndex(num_perm=128, bands=32, threshold=0.7)
+    index.add("c1", hasher.signature(TEXT))
+    index.add("c2", hasher.signature(UNRELATED))
+
+    match = index.find_duplicate(hasher.signature(NEAR_DUPLICATE))
+    assert match is not None and match[0] == "c1"
+    assert index.find_duplicate(hasher.signature("A completely different sentence about trail running shoes.")) is None
+
+
+def test_index_remove_and_replace(hasher):
+    index = NearDuplicateIndex()
+    index.add("c1", hasher.signature(TEXT))
+    index.add("c1", hasher.signature(UNRELATED))
+    assert len(index) == 1
+    assert index.find_duplicate(hasher.signature(TEXT)) is None
+
+    index.remove("c1")
+    assert len(index) == 0
+    assert index.find_duplicate(hasher.signature(UNRELATED)) is None
+
+
+def test_index_rejects_uneven_bands():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(num_perm=128, bands=10)
+
+
+def test_merged_chunk_matches_every_document():
+    stored = {"tenant_id": "t", "chunk_id": "c1", "document_id": "r1", "document_type": "faq"}
+    merged = merge_chunk_metadata(stored, "r2", {"document_type": "blog"})
+
+    assert merged["document_id"] == ["r1", "r2"]
+    assert merged["document_type"] == ["faq", "blog"]
+    assert merged["chunk_id"] == "c1" and merged["tenant_id"] == "t"
+    assert set(json.loads(merged["sources"])) == {"r1", "r2"}
+
+
+def test_released_chunk_keeps_remaining_document_metadata():
+    stored = {"tenant_id": "t", "chunk_id": "c1", "document_id": "r1", "document_type": "faq"}
+    merged = merge_chunk_metadata(stored, "r2", {"document_type": "blog"})
+
+    remaining = release_chunk_metadata(merged, "r1")
+    assert remaining == {"tenant_id": "t", "chunk_id": "c1", "document_id": "r2", "document_type": "blog"}
+    assert release_chunk_metadata(remaining, "r2") is None
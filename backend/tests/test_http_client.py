@@ -0,0 +1,75 @@
+"""
+Tests for the checks on user-supplied outbound URLs
+"""
+import asyncio
+import httpx
+import pytest
+from app.core import http_client
+from app.core.http_client import UnsafeURLError, check_public_url, read_limited, stream_public_url
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("url", [
+    "file:///etc/passwd",
+    "ftp://8.8.8.8/image.png",
+    "http:///no-host",
+    "http://127.0.0.1:8000/admin",
+    "http://10.0.0.5/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hook",
+    "http://localhost/hook",
+])
+async def test_non_public_urls_are_rejected(url):
+    with pytest.raises(UnsafeURLError):
+        await check_public_url(url)
+
+
+@pytest.mark.asyncio
+async def test_public_address_is_allowed():
+    await check_public_url("https://8.8.8.8/hook")
+
+
+@pytest.mark.asyncio
+async def test_allow_list_limits_hosts(monkeypatch):
+    monkeypatch.setattr(http_client.settings, "OUTBOUND_ALLOWED_HOSTS", "hooks.example.com, 8.8.4.4")
+    await check_public_url("https://8.8.4.4/hook")
+    with pytest.raises(UnsafeURLError):
+        await check_public_url("https://8.8.8.8/hook")
+
+
+@pytest.mark.asyncio
+async def test_read_limited_caps_the_body():
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=b"x" * 100)))
+    async with client.stream("GET", "https://img.example.com/a.png") as response:
+        assert await read_limited(response, 100) == b"x" * 100
+    async with client.stream("GET", "https://img.example.com/a.png") as response:
+        with pytest.raises(UnsafeURLError):
+            await read_limited(response, 99)
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_public_requests_connect_to_the_checked_address(monkeypatch):
+    resolved = iter(["93.184.216.34", "127.0.0.1"])
+
+    async def getaddrinfo(host, port):
+        # A rebinding resolver answers with an internal address the second time
+        return [(None, None, None, "", (next(resolved), port))]
+
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return httpx.Response(200)
+
+    monkeypatch.setattr(asyncio.get_running_loop(), "getaddrinfo", getaddrinfo)
+    monkeypatch.setattr(http_client, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async with stream_public_url("GET", "https://img.example.com:8443/a.png?size=1") as response:
+        assert response.status_code == 200
+
+    request = sent[0]
+    assert str(request.url) == "https://93.184.216.34:8443/a.png?size=1"
+    assert request.headers["host"] == "img.example.com:8443"
+    assert request.extensions["sni_hostname"] == "img.example.com"
+    await http_client.http_client.aclose()
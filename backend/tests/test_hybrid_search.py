@@ -0,0 +1,78 @@
+"""
+Tests for BM25 indexing and reciprocal rank fusion
+"""
+from langchain.schema import Document
+from app.services.hybrid_search import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def _index(*texts, **metadata):
+    index = BM25Index()
+    for i, text in enumerate(texts):
+        index.add(f"c{i}", Document(page_content=text, metadata={"document_id": f"d{i}", **metadata}))
+    return index
+
+
+def test_tokenize_keeps_hashtags_and_skus_with_their_parts():
+    tokens = tokenize("New #Summer drop: AB-1234")
+    assert "#summer" in tokens and "summer" in tokens
+    assert "ab-1234" in tokens and "1234" in tokens
+
+
+def test_search_ranks_matching_chunks_by_bm25():
+    index = _index(
+        "coffee mugs and coffee beans",
+        "ceramic coffee mug",
+        "running shoes for trail running"
+    )
+    ranked = [chunk_id for chunk_id, _ in index.search("coffee")]
+    assert ranked == ["c0", "c1"]
+    assert index.search("tea") == []
+
+
+def test_rare_terms_outweigh_common_ones():
+    index = _index("sale sale sale today", "sale on espresso today", "sale tomorrow")
+    ranked = index.search("sale espresso")
+    assert ranked[0][0] == "c1"
+
+
+def test_search_respects_metadata_filters():
+    index = BM25Index()
+    index.add("a", Document(page_content="summer launch", metadata={"document_type": "faq"}))
+    index.add("b", Document(page_content="summer launch", metadata={"document_type": ["blog", "faq"]}))
+    index.add("c", Document(page_content="summer launch", metadata={"document_type": "blog"}))
+    assert {chunk_id for chunk_id, _ in index.search("summer", filters={"document_type": "faq"})} == {"a", "b"}
+    assert {chunk_id for chunk_id, _ in index.search("summer", filters={"document_type": ["blog"]})} == {"b", "c"}
+    assert index.search("summer", filters={"document_type": "press"}) == []
+
+
+def test_remove_and_replace_update_postings_and_fields():
+    index = _index("alpha beta", "beta gamma")
+    assert index.chunk_ids_for_document("d0") == ["c0"]
+    assert index.remove("c0")
+    assert not index.remove("c0")
+    assert index.search("alpha") == []
+    assert index.chunk_ids_for_document("d0") == []
+
+    index.add("c1", Document(page_content="delta", metadata={"document_id": "d9"}))
+    assert len(index) == 1
+    assert index.search("beta") == []
+    assert index.chunk_ids_for_document("d9") == ["c1"]
+
+
+def test_unindexed_fields_are_not_filterable():
+    index = BM25Index()
+    index.add("a", Document(page_content="text", metadata={"chunk_id": "a", "sources": "{}"}))
+    assert index.match({"chunk_id": "a"}) == set()
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]], k=60)
+    ids = [doc_id for doc_id, _ in fused]
+    assert ids[0] == "b"
+    assert ids.index("c") < ids.index("a")
+    assert ids[-1] == "d"
+    assert fused[0][1] == 1 / 62 + 1 / 61
+
+
+def test_reciprocal_rank_fusion_of_one_ranking_keeps_its_order():
+    assert [doc_id for doc_id, _ in reciprocal_rank_fusion([["x", "y", "z"]])] == ["x", "y", "z"]
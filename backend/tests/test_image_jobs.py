@@ -0,0 +1,135 @@
+"""
+Tests for background image jobs shared by several worker processes
+"""
+from datetime import datetime, timedelta
+import asyncio
+import uuid
+import pytest
+from app.models.schemas import ImageGenerationResponse, ImageJobRequest, ImageJobStatus
+from app.services import image_jobs
+from app.services.image_jobs import ImageJobService
+
+
+class FakeGenerator:
+    def __init__(self, seconds: float = 0.05):
+        self.seconds = seconds
+        self.generated = []
+        self.cancelled = []
+
+    async def generate_image(self, request, job_id=None, on_preview=None):
+        self.generated.append(job_id)
+        await asyncio.sleep(self.seconds)
+        return ImageGenerationResponse(image_urls=["/media/x.png"], prompt=request.prompt, metadata={})
+
+    def cancel(self, job_id: str) -> bool:
+        self.cancelled.append(job_id)
+        return False
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    generator = FakeGenerator()
+    monkeypatch.setattr(image_jobs, "image_generator", generator)
+    monkeypatch.setattr(image_jobs.settings, "ZAPIER_WEBHOOK_URL", "")
+    return generator
+
+
+def _service(worker_id: str, **kwargs) -> ImageJobService:
+    service = ImageJobService(**{"lease_seconds": 60, "poll_interval": 0.02, **kwargs})
+    service._worker_id = worker_id
+    return service
+
+
+def _queued_job(service: ImageJobService) -> str:
+    return service._insert(str(uuid.uuid4()), ImageJobRequest(prompt="mug")).id
+
+
+def test_a_job_is_claimed_once_until_its_lease_expires(sql_db):
+    a, b = _service("a"), _service("b")
+    job_id = _queued_job(a)
+    claimed = a._claim(job_id)
+    assert claimed.status == ImageJobStatus.RUNNING.value and claimed.locked_by == "a"
+    assert b._claim(job_id) is None
+    assert b._pending_ids() == []
+
+    a._update(job_id, locked_until=datetime.utcnow() - timedelta(seconds=1))
+    assert b._pending_ids() == [job_id]
+    assert b._claim(job_id).locked_by == "b"
+    # The old owner can no longer renew or finish it
+    assert not a._renew(job_id)
+    assert a._complete(job_id, status=ImageJobStatus.COMPLETED.value) is None
+
+
+@pytest.mark.asyncio
+async def test_every_worker_resuming_generates_each_job_once(sql_db, generator):
+    workers = [_service(name) for name in "abcd"]
+    job_id = await asyncio.to_thread(_queued_job, workers[0])
+    await asyncio.gather(*(worker.resume() for worker in workers))
+    await asyncio.sleep(0.2)
+
+    assert generator.generated == [job_id]
+    job = await workers[0].get_job(job_id)
+    assert job.status == ImageJobStatus.COMPLETED
+    await asyncio.gather(*(worker.stop() for worker in workers))
+
+
+def test_a_cancel_is_not_overwritten_by_the_result(sql_db):
+    a, b = _service("a"), _service("b")
+    job_id = _queued_job(a)
+    a._claim(job_id)
+    b._cancel(job_id)
+
+    assert a._complete(job_id, status=ImageJobStatus.COMPLETED.value) is None
+    assert a._load(job_id).status == ImageJobStatus.CANCELLED.value
+
+
+@pytest.mark.asyncio
+async def test_stop_requeues_running_jobs(sql_db, generator):
+    generator.seconds = 10
+    service = _service("a")
+    job = await service.create_job(ImageJobRequest(prompt="mug"))
+    await asyncio.sleep(0.05)
+    assert (await service.get_job(job.job_id)).status == ImageJobStatus.RUNNING
+
+    await service.stop()
+    assert (await service.get_job(job.job_id)).status == ImageJobStatus.QUEUED
+
+
+@pytest.mark.asyncio
+async def test_stream_on_another_worker_follows_the_job_row(sql_db, generator):
+    generator.seconds = 0.2
+    runner = _service("a")
+    viewer = _service("b", keepalive_seconds=0.05)
+    job = await runner.create_job(ImageJobRequest(prompt="mug"))
+
+    events = [event async for event in viewer.events(job.job_id)]
+    assert events[0]["event"] == "status"
+    assert {"comment": "keep-alive"} in events
+    assert events[-1]["event"] == ImageJobStatus.COMPLETED.value
+    assert events[-1]["data"]["result"]["image_urls"] == ["/media/x.png"]
+    await runner.stop()
+
+
+@pytest.mark.asyncio
+async def test_cancel_from_another_worker_stops_the_job(sql_db, generator):
+    generator.seconds = 10
+    runner, other = _service("a"), _service("b")
+    job = await runner.create_job(ImageJobRequest(prompt="mug"))
+    await asyncio.sleep(0.05)
+
+    cancelled = await other.cancel_job(job.job_id)
+    assert cancelled.status == ImageJobStatus.CANCELLED
+    await asyncio.sleep(0.1)
+    assert job.job_id in generator.cancelled
+    assert job.job_id not in runner._tasks
+    assert (await runner.get_job(job.job_id)).status == ImageJobStatus.CANCELLED
+    await runner.stop()
+
+
+@pytest.mark.asyncio
+async def test_cancel_does_not_overwrite_a_finished_job(sql_db, generator):
+    service = _service("a")
+    job = await service.create_job(ImageJobRequest(prompt="mug"))
+    await asyncio.sleep(0.15)
+
+    assert (await service.cancel_job(job.job_id)).status == ImageJobStatus.COMPLETED
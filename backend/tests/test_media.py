@@ -0,0 +1,91 @@
+"""
+Tests for stored media serving: byte ranges and conditional requests
+"""
+import pytest
+from starlette.testclient import TestClient
+from app.core.media import MediaFiles, _parse_range
+
+FILENAME = "a" * 64 + ".png"
+BODY = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 1023)),
+    ("bytes=-100", (924, 1023)),
+    ("bytes=-5000", (0, 1023)),
+    ("bytes=1000-5000", (1000, 1023)),
+    ("bytes=10-5", None),
+    ("bytes=0-1,5-9", None),
+    ("items=0-10", None),
+    ("bytes=abc", None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 1024) == expected
+
+
+@pytest.mark.parametrize("header, size", [("bytes=1024-", 1024), ("bytes=-0", 1024), ("bytes=-10", 0)])
+def test_parse_range_unsatisfiable(header, size):
+    with pytest.raises(ValueError):
+        _parse_range(header, size)
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / FILENAME).write_bytes(BODY)
+    return TestClient(MediaFiles(str(tmp_path)))
+
+
+def test_full_file_is_immutable_with_strong_etag(client):
+    response = client.get(f"/{FILENAME}")
+    assert response.status_code == 200
+    assert response.content == BODY
+    assert response.headers["etag"] == '"{}"'.format("a" * 64)
+    assert "immutable" in response.headers["cache-control"]
+    assert response.headers["accept-ranges"] == "bytes"
+
+
+def test_range_request_gets_partial_content(client):
+    response = client.get(f"/{FILENAME}", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == BODY[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(BODY)}"
+    assert response.headers["content-length"] == "10"
+
+
+def test_unsatisfiable_range_gets_416(client):
+    response = client.get(f"/{FILENAME}", headers={"Range": f"bytes={len(BODY)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(BODY)}"
+
+
+def test_stale_if_range_serves_the_whole_file(client):
+    response = client.get(f"/{FILENAME}", headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert response.status_code == 200
+    assert response.content == BODY
+
+
+def test_matching_etag_gets_304(client):
+    etag = client.get(f"/{FILENAME}").headers["etag"]
+    response = client.get(f"/{FILENAME}", headers={"If-None-Match": f"W/{etag}"})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert client.get(f"/{FILENAME}", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_modified_since_gets_304(client):
+    last_modified = client.get(f"/{FILENAME}").headers["last-modified"]
+    assert client.get(f"/{FILENAME}", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+
+def test_unknown_names_and_methods_are_rejected(client):
+    assert client.get("/../secret.png").status_code == 404
+    assert client.get("/" + "b" * 64 + ".png").status_code == 404
+    assert client.post(f"/{FILENAME}").status_code == 405
+
+
+def test_head_sends_headers_only(client):
+    response = client.head(f"/{FILENAME}")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(BODY))
+    assert response.content == b""
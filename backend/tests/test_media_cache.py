@@ -0,0 +1,71 @@
+"""
+Tests for the platform media ID cache
+"""
+from datetime import datetime, timedelta
+import pytest
+from app.core.database import get_session
+from app.models.schemas import Platform
+from app.models.tables import MediaUpload
+from app.services.media_cache import EXPIRY_MARGIN_SECONDS, MediaUploadCache, content_hash
+
+
+@pytest.fixture
+def cache(sql_db):
+    return MediaUploadCache()
+
+
+def _expire(key: str, platform: Platform, account: str):
+    with get_session() as session:
+        session.get(MediaUpload, (key, platform.value, account)).expires_at = datetime.utcnow() - timedelta(seconds=1)
+        session.commit()
+
+
+def test_content_hash_of_files_and_urls(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"pixels")
+    assert content_hash(str(path)) == content_hash(str(path))
+    assert content_hash(str(path)) != content_hash("https://cdn.example.com/image.png")
+
+
+@pytest.mark.asyncio
+async def test_media_id_is_reused_until_it_expires(cache):
+    await cache.set(Platform.TWITTER, "acct", "k1", "m1", ttl=86400)
+    assert await cache.get(Platform.TWITTER, "acct", "k1") == "m1"
+
+    _expire("k1", Platform.TWITTER, "acct")
+    assert await cache.get(Platform.TWITTER, "acct", "k1") is None
+    stats = await cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, {})
+
+
+@pytest.mark.asyncio
+async def test_ids_expire_a_margin_before_the_platform_expiry(cache):
+    await cache.set(Platform.TWITTER, "acct", "k1", "m1", ttl=EXPIRY_MARGIN_SECONDS)
+    assert await cache.get(Platform.TWITTER, "acct", "k1") is None
+
+    await cache.set(Platform.TWITTER, "acct", "k2", "m2", ttl=EXPIRY_MARGIN_SECONDS + 600)
+    with get_session() as session:
+        expires_at = session.get(MediaUpload, ("k2", "twitter", "acct")).expires_at
+    assert timedelta(seconds=590) < expires_at - datetime.utcnow() <= timedelta(seconds=600)
+
+
+@pytest.mark.asyncio
+async def test_ids_are_scoped_to_platform_and_account(cache):
+    await cache.set(Platform.TWITTER, "acct", "k1", "m1", ttl=86400)
+    assert await cache.get(Platform.TWITTER, "other", "k1") is None
+    assert await cache.get(Platform.INSTAGRAM, "acct", "k1") is None
+
+
+@pytest.mark.asyncio
+async def test_invalidate_and_pruning_of_expired_entries(cache):
+    await cache.set(Platform.TWITTER, "acct", "k1", "m1", ttl=86400)
+    await cache.invalidate(Platform.TWITTER, "acct", "k1")
+    assert await cache.get(Platform.TWITTER, "acct", "k1") is None
+
+    await cache.set(Platform.INSTAGRAM, "acct", "old", "m2", ttl=86400)
+    _expire("old", Platform.INSTAGRAM, "acct")
+    # Writes prune expired rows
+    await cache.set(Platform.INSTAGRAM, "acct", "new", "m3", ttl=86400)
+    with get_session() as session:
+        assert session.get(MediaUpload, ("old", "instagram", "acct")) is None
+    assert (await cache.stats())["entries"] == {"instagram": 1}
@@ -0,0 +1,143 @@
+"""
+Tests for per-account publishing rate limits
+"""
+import httpx
+import pytest
+from app.models.schemas import Platform
+from app.services import platform_limits
+from app.services.platform_limits import (
+    PlatformRateLimiter,
+    RateLimitedError,
+    TokenBucket,
+    WithResponse,
+    parse_limits
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(platform_limits.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(platform_limits.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def _response(status_code: int = 200, **headers) -> httpx.Response:
+    return httpx.Response(status_code, headers=headers, request=httpx.Request("POST", "https://api.example.com"))
+
+
+def test_parse_limits():
+    assert parse_limits("twitter=300/10800, Instagram=25/86400,") == {
+        "twitter": (300, 10800.0),
+        "instagram": (25, 86400.0)
+    }
+    assert parse_limits("") == {}
+
+
+@pytest.mark.asyncio
+async def test_bucket_spends_then_waits_for_refill(clock):
+    bucket = TokenBucket(2, 10.0)
+    assert await bucket.acquire("twitter", 1, max_wait=0) == 0
+    assert await bucket.acquire("twitter", 1, max_wait=0) == 0
+    assert bucket.delay(1) == pytest.approx(5.0)
+
+    waited = await bucket.acquire("twitter", 1, max_wait=60)
+    assert waited == pytest.approx(5.0)
+    assert bucket.total_calls == 3
+
+
+@pytest.mark.asyncio
+async def test_bucket_raises_when_capacity_is_too_far_away(clock):
+    bucket = TokenBucket(1, 3600.0)
+    await bucket.acquire("instagram", 1, max_wait=0)
+    with pytest.raises(RateLimitedError) as raised:
+        await bucket.acquire("instagram", 1, max_wait=60)
+    assert raised.value.retry_after == 3600
+
+
+def test_bucket_takes_its_share_of_the_account_limit(clock):
+    bucket = TokenBucket(300, 10800.0, processes=4)
+    assert bucket.capacity == 75
+    bucket.update(40, None)
+    assert bucket.tokens == 10.0
+
+
+def test_bucket_refills_at_its_share_of_the_account_rate(clock):
+    bucket = TokenBucket(300, 10800.0, processes=4)
+    assert bucket.tokens == 75.0
+    bucket.tokens = 0.0
+    clock.now += 3600
+    bucket._refill()
+    assert bucket.tokens == pytest.approx(25.0)
+
+
+def test_exhausted_quota_blocks_until_reset(clock):
+    bucket = TokenBucket(10, 60.0)
+    bucket.update(0, 30.0)
+    assert bucket.delay(1) == pytest.approx(30.0)
+
+
+def test_observe_reads_twitter_and_retry_after_headers(clock):
+    limiter = PlatformRateLimiter({"twitter": (300, 10800.0)})
+    assert limiter.observe(Platform.TWITTER, "a", 200, _response(**{"x-rate-limit-remaining": "5"}).headers) is None
+    bucket = limiter.bucket(Platform.TWITTER, "a")
+    assert bucket.remaining == 5 and bucket.tokens == 5.0
+
+    assert limiter.observe(Platform.TWITTER, "a", 429, _response(429, **{"retry-after": "12"}).headers) == 12.0
+    assert bucket.delay(1) == pytest.approx(12.0)
+
+
+def test_observe_reads_meta_usage(clock):
+    limiter = PlatformRateLimiter({"instagram": (100, 3600.0)})
+    limiter.observe(Platform.INSTAGRAM, "a", 200, {"x-app-usage": '{"call_count": 90, "total_time": 10}'})
+    assert limiter.bucket(Platform.INSTAGRAM, "a").tokens == 10.0
+    assert limiter.observe(Platform.INSTAGRAM, "a", 200, {"x-app-usage": '{"call_count": 100}'}) == 60.0
+
+
+@pytest.mark.asyncio
+async def test_call_retries_throttled_requests(clock):
+    limiter = PlatformRateLimiter({}, max_attempts=3, backoff_base=1.0)
+    responses = [_response(429, **{"retry-after": "2"}), _response(503), _response(200)]
+
+    async def send():
+        return responses.pop(0)
+
+    response = await limiter.call(Platform.LINKEDIN, "a", send)
+    assert response.status_code == 200
+    assert limiter.retries == 2
+
+
+@pytest.mark.asyncio
+async def test_call_does_not_retry_rejections(clock):
+    limiter = PlatformRateLimiter({}, max_attempts=3)
+    calls = []
+
+    async def send():
+        calls.append(1)
+        return _response(403)
+
+    assert (await limiter.call(Platform.LINKEDIN, "a", send)).status_code == 403
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_call_unwraps_results_and_observes_their_response(clock):
+    limiter = PlatformRateLimiter({"twitter": (300, 10800.0)})
+
+    async def send():
+        return WithResponse("tweet", _response(**{"x-rate-limit-remaining": "3"}))
+
+    assert await limiter.call(Platform.TWITTER, "a", send) == "tweet"
+    assert limiter.bucket(Platform.TWITTER, "a").remaining == 3
+
@@ -0,0 +1,197 @@
+"""
+Tests for the durable publishing outbox
+"""
+import asyncio
+from datetime import datetime, timedelta
+import httpx
+import pytest
+from app.core.database import get_session
+from app.models.schemas import ContentStatus, OutboxStatus, Platform, PostResponse
+from app.models.tables import OutboxPost
+from app.services import publish_outbox
+from app.services.platform_limits import RateLimitedError, is_retryable
+from app.services.publish_outbox import PublishOutbox, make_idempotency_key
+
+
+class FakeSocialMedia:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.posts = []
+
+    async def post(self, request, content):
+        self.posts.append((request.platform, content))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def _failed(retryable: bool) -> PostResponse:
+    return PostResponse(id="r", platform=Platform.TWITTER, status=ContentStatus.FAILED, error="boom", retryable=retryable)
+
+
+@pytest.fixture
+def outbox(sql_db):
+    return PublishOutbox(workers=2, lease_seconds=60, max_attempts=3)
+
+
+def test_idempotency_key_depends_on_content_id_and_platform():
+    key = make_idempotency_key("c1", Platform.TWITTER, "hello", None)
+    assert key == make_idempotency_key("c1", Platform.TWITTER, "edited", "/media/x.png")
+    assert key != make_idempotency_key("c1", Platform.LINKEDIN, "hello", None)
+    # Without a content ID the content itself identifies the post, within a dedupe window
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    key = make_idempotency_key("", Platform.TWITTER, "a", None, now)
+    assert key == make_idempotency_key("", Platform.TWITTER, "a", None, now + timedelta(seconds=1))
+    assert key != make_idempotency_key("", Platform.TWITTER, "b", None, now)
+    assert key != make_idempotency_key("", Platform.TWITTER, "a", None, now + timedelta(hours=1))
+
+
+@pytest.mark.asyncio
+async def test_enqueue_is_idempotent(outbox):
+    first, created = await outbox.enqueue("c1", Platform.TWITTER, "hello")
+    second, created_again = await outbox.enqueue("c1", Platform.TWITTER, "hello")
+    assert created and not created_again
+    assert second.id == first.id
+    assert (await outbox.stats())["pending"] == 1
+
+
+def test_a_post_is_claimed_by_one_worker_until_its_lease_expires(outbox):
+    post, _ = outbox._insert("c1", Platform.TWITTER, "hello", None, None)
+    claimed = outbox._claim("w1")
+    assert claimed.id == post.id
+    assert claimed.status == OutboxStatus.IN_FLIGHT.value and claimed.locked_by == "w1" and claimed.attempts == 1
+    assert outbox._claim("w2") is None
+
+    outbox._update(post.id, "w1", locked_until=datetime.utcnow() - timedelta(seconds=1))
+    reclaimed = outbox._claim("w2")
+    assert reclaimed.locked_by == "w2" and reclaimed.attempts == 2
+
+
+def test_only_the_lease_holder_records_an_outcome(outbox):
+    post, _ = outbox._insert("c1", Platform.TWITTER, "hello", None, None)
+    outbox._claim("w1")
+    outbox._update(post.id, "w1", locked_until=datetime.utcnow() - timedelta(seconds=1))
+    outbox._claim("w2")
+
+    assert not outbox._renew(post.id, "w1")
+    assert outbox._update(post.id, "w1", status=OutboxStatus.FAILED.value) is None
+    assert outbox._renew(post.id, "w2")
+    assert outbox._update(post.id, "w2", status=OutboxStatus.PUBLISHED.value).status == OutboxStatus.PUBLISHED.value
+
+
+@pytest.mark.asyncio
+async def test_lease_is_renewed_during_a_slow_publish(sql_db, monkeypatch):
+    outbox = PublishOutbox(lease_seconds=0.3)
+
+    class SlowSocialMedia:
+        async def post(self, request, content):
+            await asyncio.sleep(0.5)
+            return PostResponse(id="r", platform=Platform.TWITTER, status=ContentStatus.PUBLISHED)
+
+    monkeypatch.setattr(publish_outbox, "social_media_service", SlowSocialMedia())
+    post, _ = await outbox.enqueue("c1", Platform.TWITTER, "hello")
+    delivery = asyncio.create_task(outbox._deliver(await asyncio.to_thread(outbox._claim, "w1"), "w1"))
+    await asyncio.sleep(0.4)
+    # Past the original lease, but still held
+    assert await asyncio.to_thread(outbox._claim, "w2") is None
+    await delivery
+    assert outbox._load(post.id).status == OutboxStatus.PUBLISHED.value
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_a_failed_delivery(outbox, monkeypatch):
+    delivered = []
+
+    async def deliver(post, worker_id):
+        delivered.append(post.id)
+        if len(delivered) == 1:
+            raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(outbox, "_deliver", deliver)
+    for i in range(2):
+        await outbox.enqueue(f"c{i}", Platform.TWITTER, "hello")
+    outbox._wakeup = asyncio.Event()
+    worker = asyncio.create_task(outbox._worker(0))
+    await asyncio.sleep(0.2)
+    assert len(delivered) == 2 and not worker.done()
+    worker.cancel()
+
+
+def test_scheduled_posts_are_not_claimed_early(outbox):
+    outbox._insert("c1", Platform.TWITTER, "hello", None, datetime.utcnow() + timedelta(hours=1))
+    assert outbox._claim("w1") is None
+
+
+def test_concurrent_claims_lease_each_post_once(outbox):
+    for i in range(4):
+        outbox._insert(f"c{i}", Platform.TWITTER, "hello", None, None)
+    claimed = [outbox._claim(f"w{i}") for i in range(6)]
+    ids = [post.id for post in claimed if post is not None]
+    assert len(ids) == 4 and len(set(ids)) == 4
+
+
+@pytest.mark.asyncio
+async def test_published_post_resolves_and_is_not_sent_again(outbox, monkeypatch):
+    service = FakeSocialMedia(PostResponse(id="r", platform=Platform.TWITTER, status=ContentStatus.PUBLISHED))
+    monkeypatch.setattr(publish_outbox, "social_media_service", service)
+    await outbox.enqueue("c1", Platform.TWITTER, "hello")
+    await outbox._deliver(await asyncio.to_thread(outbox._claim, "w1"), "w1")
+
+    post, created = await outbox.enqueue("c1", Platform.TWITTER, "hello")
+    assert not created and post.status == OutboxStatus.PUBLISHED.value
+    assert len(service.posts) == 1
+
+
+@pytest.mark.asyncio
+async def test_retryable_failure_is_requeued_with_backoff(outbox, monkeypatch):
+    monkeypatch.setattr(publish_outbox, "social_media_service", FakeSocialMedia(_failed(retryable=True)))
+    post, _ = await outbox.enqueue("c1", Platform.TWITTER, "hello")
+    await outbox._deliver(await asyncio.to_thread(outbox._claim, "w1"), "w1")
+
+    post = outbox._load(post.id)
+    assert post.status == OutboxStatus.PENDING.value
+    assert post.available_at > datetime.utcnow()
+
+
+@pytest.mark.asyncio
+async def test_permanent_failure_is_not_retried(outbox, monkeypatch):
+    monkeypatch.setattr(publish_outbox, "social_media_service", FakeSocialMedia(Exception("Instagram requires an image")))
+    post, _ = await outbox.enqueue("c1", Platform.INSTAGRAM, "hello")
+    await outbox._deliver(await asyncio.to_thread(outbox._claim, "w1"), "w1")
+
+    post = outbox._load(post.id)
+    assert post.status == OutboxStatus.FAILED.value
+    assert post.error == "Instagram requires an image"
+
+
+@pytest.mark.asyncio
+async def test_retryable_failure_gives_up_after_max_attempts(outbox, monkeypatch):
+    monkeypatch.setattr(publish_outbox, "social_media_service", FakeSocialMedia(_failed(retryable=True)))
+    post, _ = await outbox.enqueue("c1", Platform.TWITTER, "hello")
+    with get_session() as session:
+        session.get(OutboxPost, post.id).attempts = outbox.max_attempts - 1
+        session.commit()
+    await outbox._deliver(await asyncio.to_thread(outbox._claim, "w1"), "w1")
+    assert outbox._load(post.id).status == OutboxStatus.FAILED.value
+
+
+@pytest.mark.asyncio
+async def test_asking_again_retries_a_failed_post(outbox, monkeypatch):
+    monkeypatch.setattr(publish_outbox, "social_media_service", FakeSocialMedia(_failed(retryable=False)))
+    post, _ = await outbox.enqueue("c1", Platform.TWITTER, "hello")
+    await outbox._deliver(await asyncio.to_thread(outbox._claim, "w1"), "w1")
+
+    again, created = await outbox.enqueue("c1", Platform.TWITTER, "hello")
+    assert not created and again.id == post.id
+    assert again.status == OutboxStatus.PENDING.value and again.attempts == 0
+
+
+def test_only_unprocessed_failures_are_retryable():
+    request = httpx.Request("POST", "https://api.example.com")
+    assert is_retryable(httpx.ConnectError("refused"))
+    assert is_retryable(RateLimitedError("twitter", 60))
+    assert is_retryable(httpx.HTTPStatusError("busy", request=request, response=httpx.Response(503, request=request)))
+    assert not is_retryable(httpx.HTTPStatusError("no", request=request, response=httpx.Response(401, request=request)))
+    assert not is_retryable(httpx.ReadTimeout("slow"))
+    assert not is_retryable(Exception("Instagram requires an image"))
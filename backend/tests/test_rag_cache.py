@@ -0,0 +1,65 @@
+"""
+Tests for the generation-invalidated retrieval cache
+"""
+from app.services import rag_cache
+from app.services.rag_cache import RetrievalCache
+
+
+def test_make_key_normalizes_query_and_filter_order():
+    assert RetrievalCache.make_key("  Summer   SALE ", 5, {"b": 1, "a": 2}, "t1") == \
+        RetrievalCache.make_key("summer sale", 5, {"a": 2, "b": 1}, "t1")
+    assert RetrievalCache.make_key("summer sale", 5, None, "t1") != RetrievalCache.make_key("summer sale", 5, None, "t2")
+
+
+def test_hit_after_set_and_miss_after_invalidate():
+    cache = RetrievalCache()
+    cache.set("q", ["doc"], cache.generation)
+    assert cache.get("q") == ["doc"]
+
+    cache.invalidate()
+    assert cache.generation == 1
+    assert cache.get("q") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["invalidations"]) == (1, 1, 1)
+
+
+def test_results_computed_before_a_write_are_not_stored():
+    cache = RetrievalCache()
+    generation = cache.generation
+    # A write lands while the retrieval is running
+    cache.invalidate()
+    cache.set("q", ["stale"], generation)
+    assert cache.get("q") is None
+
+    cache.set("q", ["fresh"], cache.generation)
+    assert cache.get("q") == ["fresh"]
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rag_cache.time, "monotonic", lambda: now[0])
+    cache = RetrievalCache(ttl_seconds=10)
+    cache.set("q", "value", cache.generation)
+    now[0] += 9
+    assert cache.get("q") == "value"
+    now[0] += 2
+    assert cache.get("q") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = RetrievalCache(max_entries=2)
+    cache.set("a", 1, 0)
+    cache.set("b", 2, 0)
+    cache.get("a")
+    cache.set("c", 3, 0)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = RetrievalCache(max_entries=0)
+    cache.set("q", "value", 0)
+    assert not cache.enabled
+    assert cache.get("q") is None
@@ -0,0 +1,41 @@
+"""
+Tests for the Twitter publishing thread pool
+"""
+import asyncio
+import threading
+import pytest
+from app.services import social_media
+from app.services.social_media import SocialMediaService
+
+
+class FakeAPI:
+    """Records each response on the instance, like tweepy.API"""
+
+    barrier = threading.Barrier(2, timeout=5)
+
+    def __init__(self, auth, timeout=None):
+        self.last_response = None
+
+    def update_status(self, status, media_ids=None):
+        self.last_response = f"response:{status}"
+        # Hold both threads here so a shared client would have been overwritten
+        self.barrier.wait()
+        return status
+
+
+@pytest.mark.asyncio
+async def test_concurrent_twitter_calls_each_see_their_own_response(monkeypatch):
+    monkeypatch.setattr(social_media.tweepy, "API", FakeAPI)
+    monkeypatch.setattr(social_media.settings, "TWITTER_API_KEY", "key")
+    monkeypatch.setattr(social_media.settings, "TWITTER_API_SECRET", "secret")
+    monkeypatch.setattr(social_media.settings, "TWITTER_ACCESS_TOKEN", "1-token")
+    monkeypatch.setattr(social_media.settings, "TWITTER_ACCESS_TOKEN_SECRET", "token-secret")
+    service = SocialMediaService()
+
+    first, second = await asyncio.gather(
+        service._run_twitter("update_status", status="a"),
+        service._run_twitter("update_status", status="b")
+    )
+
+    assert (first.value, first.response) == ("a", "response:a")
+    assert (second.value, second.response) == ("b", "response:b")
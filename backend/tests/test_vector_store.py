@@ -0,0 +1,72 @@
+"""
+Tests for tenant scoping in the vector store
+"""
+import pytest
+from langchain.embeddings import FakeEmbeddings
+from langchain.vectorstores import Pinecone, Qdrant
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+from app.core.config import settings
+from app.core.vector_store import build_search_kwargs, build_write_kwargs, find_document_chunks
+
+
+@pytest.fixture
+def qdrant():
+    client = QdrantClient(":memory:")
+    client.create_collection("chunks", vectors_config=VectorParams(size=4, distance=Distance.COSINE))
+    stored = {
+        "legacy": {"document_id": "d1"},
+        "default": {"document_id": "d1", "tenant_id": settings.RAG_DEFAULT_TENANT},
+        "other": {"document_id": "d1", "tenant_id": "acme"},
+    }
+    client.upsert("chunks", points=[
+        PointStruct(id=i, vector=[1.0, 0.0, 0.0, 0.0], payload={"page_content": name, "metadata": metadata})
+        for i, (name, metadata) in enumerate(stored.items())
+    ])
+    return Qdrant(client=client, collection_name="chunks", embeddings=FakeEmbeddings(size=4))
+
+
+def _search(store, tenant_id):
+    results = store.similarity_search("query", k=10, **build_search_kwargs(store, tenant_id))
+    return sorted(document.page_content for document in results)
+
+
+def test_chunks_without_a_tenant_belong_to_the_default_tenant(qdrant):
+    assert _search(qdrant, settings.RAG_DEFAULT_TENANT) == ["default", "legacy"]
+    assert _search(qdrant, "acme") == ["other"]
+    assert sorted(text for text, _ in find_document_chunks(qdrant, "d1", settings.RAG_DEFAULT_TENANT).values()) == ["default", "legacy"]
+
+
+def test_default_tenant_uses_the_default_pinecone_namespace():
+    store = Pinecone.__new__(Pinecone)
+    assert build_write_kwargs(store, settings.RAG_DEFAULT_TENANT) == {"namespace": ""}
+    assert build_search_kwargs(store, "acme")["namespace"] == "acme"
+
+
+class FakeIndex:
+    """Pinecone index that rejects oversized metadata queries, like the real service"""
+
+    def __init__(self, count: int):
+        self.metadata = {f"c{i}": {"document_id": "d1", "chunk_id": f"c{i}", "text": f"chunk {i}"} for i in range(count)}
+        self.top_ks = []
+
+    def describe_index_stats(self):
+        return {"dimension": 4}
+
+    def query(self, vector, top_k, filter, namespace, include_metadata):
+        assert top_k <= 1000
+        self.top_ks.append(top_k)
+        seen = set(filter.get("chunk_id", {}).get("$nin", []))
+        matches = [{"id": id, "metadata": metadata} for id, metadata in self.metadata.items() if id not in seen]
+        return {"matches": matches[:top_k]}
+
+
+def test_pinecone_document_chunks_are_paged():
+    store = Pinecone.__new__(Pinecone)
+    store._index = FakeIndex(2500)
+    store._text_key = "text"
+
+    chunks = find_document_chunks(store, "d1", "acme", batch_size=5000)
+
+    assert len(chunks) == 2500 and chunks["c7"][0] == "chunk 7"
+    assert store._index.top_ks == [1000, 1000, 1000]